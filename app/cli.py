@@ -1,23 +1,20 @@
 from __future__ import annotations
 
 import argparse
+import sys
+from contextlib import nullcontext
+from dataclasses import replace
 from pathlib import Path
+from typing import Callable, Dict
 
-from app.config import get_settings
-from app.services.nfo_service import build_movie_nfo
-from app.services.scrape_service import scrape_movie
-from app.services.file_service import DEFAULT_RENAME_FORMAT, save_assets_for_existing_video
+from app.config import DEFAULT_RENAME_FORMAT, get_settings
 
 
-def main(argv: list[str] | None = None) -> None:
-    """命令行入口：
-
-    根据 javdb 影片页面 URL 和本地已存在的视频文件，在该视频所在目录
-    生成 Jellyfin 兼容的 movie.nfo、poster.jpg、fanart.jpg、extrafanart/* 等文件，
-    不会复制或移动原视频文件。
-    """
+def _scrape_main(argv: list[str]) -> None:
+    """刮削单部影片：根据影片页面 URL 为本地已有视频生成 NFO 和图片。"""
 
     parser = argparse.ArgumentParser(
+        prog="python -m app.cli",
         description=(
             "根据 javdb URL 为本地已有视频文件生成 movie.nfo 和图片，"
             "全部输出到该视频所在目录，不复制视频。"
@@ -26,7 +23,11 @@ def main(argv: list[str] | None = None) -> None:
     parser.add_argument(
         "--url",
         required=True,
-        help="影片页面 URL（当前支持 javdb，例如：https://javdb.com/v/82ebmO）",
+        action="append",
+        help=(
+            "影片页面 URL（当前支持 javdb，例如：https://javdb.com/v/82ebmO）。"
+            "可重复指定同一影片在多个站点的 URL，将并发刮削并按顺序优先合并字段"
+        ),
     )
     parser.add_argument(
         "--video",
@@ -39,6 +40,48 @@ def main(argv: list[str] | None = None) -> None:
         metavar="FMT",
         help=f"重命名格式，留空则不重命名。默认：{DEFAULT_RENAME_FORMAT}。占位符：id/year/date/actor/title/vr/idx",
     )
+    parser.add_argument(
+        "--skip-duplicates",
+        action="store_true",
+        help="若相同内容的视频（按采样指纹判断）已经刮削过，则跳过本次刮削",
+    )
+    parser.add_argument(
+        "--skip-indexed",
+        action="store_true",
+        help="若同目录已有该视频的 NFO，或文件名中的番号已在本地 NFO 索引中（见 index 子命令），则跳过本次刮削",
+    )
+    parser.add_argument(
+        "--trailer",
+        action="store_true",
+        help="同时分段并行下载预告片为 <视频名>-trailer.mp4（默认由 NFOFETCH_TRAILER 决定）",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="忽略刮削结果缓存，重新请求站点（用于获取站点上的更正），并刷新缓存",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="本次刮削 + 写入的总时间预算，超出后跳过剩余图片；默认不限",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="记录本次刮削各阶段耗时，输出 Chrome trace JSON 到 NFOFETCH_TRACE_DIR（默认 ./traces）",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="同时用 cProfile 采集（隐含 --trace），输出同名 .prof 文件",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="同时用 tracemalloc 统计内存峰值与分配热点（隐含 --trace）",
+    )
 
     args = parser.parse_args(argv)
 
@@ -46,27 +89,541 @@ def main(argv: list[str] | None = None) -> None:
     if not video_path.is_file():
         raise SystemExit(f"视频文件不存在：{video_path}")
 
+    # 重量级依赖（pydantic / scraper 等）在参数解析之后才导入，保证 --help 和参数错误足够快。
+    from app.deadline import job_deadline
+    from app.services.file_service import save_assets_for_existing_video
+    from app.services.nfo_service import build_movie_nfo
+    from app.services.probe_service import probe_video
+    from app.services.dedupe_service import find_scraped_duplicate, remember_video
+    from app.services.scrape_service import scrape_movie_multi
+
     settings = get_settings()
-    metadata = scrape_movie(args.url, settings=settings)
-    nfo_text = build_movie_nfo(metadata)
+    if args.trailer:
+        settings = replace(settings, download_trailer=True)
+    if args.skip_indexed:
+        from app.services.library_index import already_scraped
 
-    result = save_assets_for_existing_video(
-        metadata=metadata,
-        nfo_text=nfo_text,
-        video_path=video_path,
-        settings=settings,
-        rename_format=args.rename_format or None,
-    )
+        indexed = already_scraped(video_path, settings)
+        if indexed is not None:
+            print(f"索引中已有该影片（{indexed.number or '?'}），跳过：{indexed.nfo_path}")
+            return
+    if args.skip_duplicates:
+        duplicate = find_scraped_duplicate(video_path, settings)
+        if duplicate is not None:
+            print(f"与已刮削的视频内容相同，跳过：{duplicate}")
+            return
+    tracing = args.trace or args.profile or args.trace_memory
+    if tracing:
+        from app.tracing import start_trace
+
+        trace_ctx = start_trace("cli", profile=args.profile, memory=args.trace_memory)
+    else:
+        trace_ctx = nullcontext()
+
+    with trace_ctx as trace, job_deadline(args.deadline):
+        metadata = scrape_movie_multi(args.url, settings=settings, use_cache=not args.refresh)
+        nfo_text = build_movie_nfo(metadata, probe_video(video_path))
+
+        result = save_assets_for_existing_video(
+            metadata=metadata,
+            nfo_text=nfo_text,
+            video_path=video_path,
+            settings=settings,
+            rename_format=args.rename_format or None,
+        )
+
+    try:
+        remember_video(Path(result.video_path or video_path), settings)
+        if args.skip_indexed and result.nfo_path:
+            from app.services.library_index import get_library_index
+
+            with get_library_index(settings) as index:
+                index.add(Path(result.nfo_path))
+    except OSError:
+        pass
 
     print("刮削成功 ✅")
     print(f"影片目录: {result.movie_dir}")
     print(f"NFO 文件: {result.nfo_path}")
     if result.poster_path:
         print(f"封面: {result.poster_path}")
+    if result.cut_stages:
+        print(f"超出时间预算，已跳过: {'、'.join(result.cut_stages)}")
     if result.fanart_path:
         print(f"背景图: {result.fanart_path}")
     if result.extra_images:
         print(f"剧照: {len(result.extra_images)} 张，位于 extrafanart/ 目录下")
+    if result.trailer_path:
+        print(f"预告片: {result.trailer_path}")
+    if trace is not None:
+        from app.tracing import trace_dir
+
+        print(f"追踪文件: {trace_dir() / trace.metadata['trace_file']}")
+
+
+def _regenerate_main(argv: list[str]) -> None:
+    """离线重新生成整个目录树下的 movie.nfo。"""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli regenerate",
+        description=(
+            "根据各影片目录下保存的元数据（.nfofetch.json）离线重新生成 movie.nfo，"
+            "不访问网络，仅写回内容有变化的文件。"
+        ),
+    )
+    parser.add_argument("root", help="媒体库根目录，将递归处理其下所有影片目录")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="并行进程数，默认等于 CPU 核数",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="只统计需要更新的 NFO 数量，不写入文件",
+    )
+    args = parser.parse_args(argv)
+
+    root = Path(args.root).expanduser().resolve()
+    if not root.is_dir():
+        raise SystemExit(f"目录不存在：{root}")
+
+    from app.services.regenerate_service import regenerate_library
+
+    report = regenerate_library(root, workers=args.workers, dry_run=args.dry_run)
+
+    print(f"共找到 {report.total} 份元数据")
+    print(f"{'需要更新' if args.dry_run else '已更新'}: {report.updated}")
+    print(f"无变化: {report.unchanged}")
+    if report.failed:
+        print(f"失败: {report.failed}")
+        for err in report.errors:
+            print(f"  {err}")
+
+
+def _rename_main(argv: list[str]) -> None:
+    """按元数据批量重命名整个目录树下的视频，默认只预览。"""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli rename",
+        description=(
+            "根据各影片目录下保存的元数据（.nfofetch.json）批量重命名视频及同名附属文件。"
+            "默认只显示预览，加 --apply 才会执行，并写入可用于撤销的日志。"
+        ),
+    )
+    parser.add_argument("root", nargs="?", help="媒体库根目录")
+    parser.add_argument(
+        "--format",
+        default=DEFAULT_RENAME_FORMAT,
+        metavar="FMT",
+        help=f"重命名格式，默认：{DEFAULT_RENAME_FORMAT}。占位符：id/year/date/actor/title/vr/idx",
+    )
+    parser.add_argument("--apply", action="store_true", help="执行重命名（默认只预览）")
+    parser.add_argument(
+        "--journal",
+        default=None,
+        help="撤销日志路径，默认写入 ROOT/.nfofetch-rename-<时间>.jsonl",
+    )
+    parser.add_argument(
+        "--undo",
+        default=None,
+        metavar="JOURNAL",
+        help="根据撤销日志还原之前的重命名",
+    )
+    args = parser.parse_args(argv)
+
+    from app.services import rename_service
+
+    if args.undo:
+        restored, errors = rename_service.undo_renames(Path(args.undo).expanduser())
+        print(f"已还原 {restored} 个文件")
+        for err in errors:
+            print(f"  {err}")
+        return
+
+    if not args.root:
+        parser.error("需要指定 ROOT 或 --undo")
+    root = Path(args.root).expanduser().resolve()
+    if not root.is_dir():
+        raise SystemExit(f"目录不存在：{root}")
+
+    plan = rename_service.plan_library_renames(root, args.format)
+    for line in plan.diff_lines():
+        print(line)
+    for err in plan.errors:
+        print(f"跳过 {err}")
+    print(f"共 {len(plan.dirs)} 个目录、{plan.total} 个文件需要重命名")
+
+    if not args.apply or not plan.total:
+        if plan.total:
+            print("以上为预览，加 --apply 执行")
+        return
+
+    journal = (
+        Path(args.journal).expanduser()
+        if args.journal
+        else rename_service.default_journal_path(root)
+    )
+    errors = rename_service.apply_library_plan(plan, journal)
+    for err in errors:
+        print(f"失败 {err}")
+    print(f"已完成，撤销日志：{journal}")
+    print(f"如需撤销：python -m app.cli rename --undo {journal}")
+
+
+def _queue_path(arg: str | None) -> str:
+    path = arg or get_settings().queue_path
+    if not path:
+        raise SystemExit("需要通过 --queue 或环境变量 NFOFETCH_QUEUE_PATH 指定任务队列文件")
+    return path
+
+
+def _enqueue_main(argv: list[str]) -> None:
+    """向分布式任务队列提交刮削任务。"""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli enqueue",
+        description="向共享任务队列提交 (URL, 视频) 刮削任务，由 worker 节点领取执行。",
+    )
+    parser.add_argument("--queue", default=None, help="队列文件，默认 NFOFETCH_QUEUE_PATH")
+    parser.add_argument("--url", required=True, help="影片页面 URL")
+    parser.add_argument("--video", required=True, help="视频文件路径（worker 节点上可见的路径）")
+    parser.add_argument("--rename-format", default=None, metavar="FMT", help="重命名格式，留空则不重命名")
+    args = parser.parse_args(argv)
+
+    from app.services.job_queue import JobQueue
+
+    with JobQueue(_queue_path(args.queue)) as queue:
+        job_id = queue.enqueue(args.url, args.video, args.rename_format or None)
+    print(f"已提交任务 #{job_id}")
+
+
+def _worker_main(argv: list[str]) -> None:
+    """作为 worker 节点从共享任务队列领取并执行刮削任务。"""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli worker",
+        description=(
+            "从共享任务队列领取任务并执行刮削、写入。多台机器（或使用不同代理的进程）"
+            "可同时运行，任务通过租约 + 心跳分配，worker 崩溃后任务会被重新领取。"
+        ),
+    )
+    parser.add_argument("--queue", default=None, help="队列文件，默认 NFOFETCH_QUEUE_PATH")
+    parser.add_argument("--id", default=None, help="worker 标识，默认 主机名:进程号")
+    parser.add_argument("--lease", type=float, default=120.0, help="租约时长（秒），默认 120")
+    parser.add_argument("--once", action="store_true", help="队列为空时退出，而不是继续等待")
+    parser.add_argument(
+        "--threads", type=int, default=1, help="同时执行任务的线程数（下载并发），默认 1"
+    )
+    parser.add_argument(
+        "--parse-workers",
+        default=None,
+        metavar="N|auto",
+        help="解析详情页的进程数，auto 为 CPU 核数，0 为在线程内解析；默认 NFOFETCH_PARSE_WORKERS",
+    )
+    parser.add_argument("--status", action="store_true", help="只显示队列中各状态的任务数")
+    args = parser.parse_args(argv)
+
+    queue_path = _queue_path(args.queue)
+    if args.status:
+        from app.services.job_queue import JobQueue
+
+        with JobQueue(queue_path) as queue:
+            for status, count in queue.counts().items():
+                print(f"{status}: {count}")
+        return
+
+    from app.services.worker_service import run_worker_threads
+
+    settings = get_settings()
+    if args.parse_workers is not None:
+        value = args.parse_workers.strip().lower()
+        if value != "auto" and not value.isdigit():
+            parser.error("--parse-workers 需要是非负整数或 auto")
+        settings = replace(settings, parse_workers=-1 if value == "auto" else int(value))
+    processed = run_worker_threads(
+        queue_path,
+        settings,
+        max(1, args.threads),
+        worker=args.id,
+        lease_seconds=args.lease,
+        once=args.once,
+    )
+    print(f"共处理 {processed} 个任务")
+
+
+def _bundle_main(argv: list[str]) -> None:
+    """导出 / 导入缓存包，用于在多个实例之间共享刮削结果。"""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli bundle",
+        description=(
+            "把本地刮削缓存（及可选的图片）打包导出，或导入到另一个实例的缓存中，"
+            "新节点无需访问上游即可直接写入这些影片的 NFO 与图片。"
+        ),
+    )
+    actions = parser.add_subparsers(dest="action", required=True)
+
+    export = actions.add_parser("export", help="导出缓存包")
+    export.add_argument("out", help="输出文件，例如 cache.nfofetch.zip")
+    export.add_argument("--id", action="append", default=[], help="只导出指定番号，可重复")
+    export.add_argument("--ids-file", default=None, help="番号列表文件，每行一个")
+    export.add_argument("--images", action="store_true", help="同时打包图片缓存中已有的原图")
+    export.add_argument(
+        "--library", default=None, metavar="ROOT", help="同时从媒体库的 .nfofetch.json 收集元数据"
+    )
+
+    imp = actions.add_parser("import", help="导入缓存包")
+    imp.add_argument("bundle", help="缓存包文件")
+    imp.add_argument("--overwrite", action="store_true", help="覆盖本地已有（即使更新）的记录")
+
+    args = parser.parse_args(argv)
+
+    from app.services import bundle_service
+
+    settings = get_settings()
+    if args.action == "export":
+        numbers = list(args.id)
+        if args.ids_file:
+            with open(args.ids_file, "r", encoding="utf-8") as f:
+                numbers.extend(line.strip() for line in f if line.strip())
+        stats = bundle_service.export_bundle(
+            Path(args.out).expanduser(),
+            settings,
+            numbers=numbers or None,
+            include_images=args.images,
+            library_root=Path(args.library).expanduser() if args.library else None,
+        )
+        print(f"已导出 {stats.records} 条元数据、{stats.images} 张图片到 {args.out}")
+    else:
+        stats = bundle_service.import_bundle(
+            Path(args.bundle).expanduser(), settings, overwrite=args.overwrite
+        )
+        print(f"已导入 {stats.records} 条元数据（跳过 {stats.skipped} 条）、{stats.images} 张图片")
+
+
+def _dedupe_main(argv: list[str]) -> None:
+    """按采样指纹查找内容重复的视频。"""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli dedupe",
+        description=(
+            "扫描目录树下的视频，按文件大小与头 / 中 / 尾等位置的采样块计算指纹，"
+            "列出内容相同的视频分组。指纹按 (inode, 大小, 修改时间) 缓存，重复扫描几乎不读文件。"
+        ),
+    )
+    parser.add_argument("root", help="媒体库根目录")
+    parser.add_argument("--workers", type=int, default=8, help="并行计算指纹的线程数")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出分组")
+    args = parser.parse_args(argv)
+
+    root = Path(args.root).expanduser().resolve()
+    if not root.is_dir():
+        raise SystemExit(f"目录不存在：{root}")
+
+    from app.services.dedupe_service import scan_duplicates
+
+    groups = scan_duplicates(root, get_settings(), workers=args.workers)
+    if args.json:
+        import json
+
+        print(
+            json.dumps(
+                [
+                    {
+                        "size": g.size,
+                        "primary": str(g.primary),
+                        "duplicates": [str(p) for p in g.duplicates],
+                    }
+                    for g in groups
+                ],
+                ensure_ascii=False,
+                indent=2,
+            )
+        )
+        return
+    for g in groups:
+        print(f"{g.primary}  ({g.size / 1024 / 1024:.1f} MiB)")
+        for dup in g.duplicates:
+            print(f"  = {dup}")
+    wasted = sum(g.size * len(g.duplicates) for g in groups)
+    print(f"共 {len(groups)} 组重复视频，多占用 {wasted / 1024 ** 3:.2f} GiB")
+
+
+def _probe_main(argv: list[str]) -> None:
+    """只读取容器头部，列出目录树下视频的时长、分辨率与编码。"""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli probe",
+        description=(
+            "读取 MP4/MOV 的 moov 与 MKV/WebM 的 EBML 头部，列出时长、分辨率与音视频编码；"
+            "不读取媒体数据，也不依赖 ffprobe。写入 NFO 请使用 regenerate。"
+        ),
+    )
+    parser.add_argument("root", help="媒体库根目录或单个视频文件")
+    parser.add_argument("--workers", type=int, default=8, help="并行探测的线程数")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+    args = parser.parse_args(argv)
+
+    root = Path(args.root).expanduser().resolve()
+    if not root.exists():
+        raise SystemExit(f"路径不存在：{root}")
+
+    from dataclasses import asdict
+
+    from app.services.probe_service import iter_videos, probe_many
+
+    videos = [root] if root.is_file() else sorted(iter_videos(root))
+    results = probe_many(videos, workers=args.workers)
+    if args.json:
+        import json
+
+        print(
+            json.dumps(
+                [{"path": str(p), **(asdict(r) if r else {})} for p, r in results],
+                ensure_ascii=False,
+                indent=2,
+            )
+        )
+        return
+    for path, r in results:
+        if r is None:
+            print(f"{path}  （不支持的格式）")
+            continue
+        minutes = f"{r.duration / 60:.1f} 分钟" if r.duration else "?"
+        size = f"{r.width}x{r.height}" if r.width else "?"
+        print(f"{path}  {minutes}  {size}  {r.video_codec or '?'} / {r.audio_codec or '?'}")
+
+
+def _index_main(argv: list[str]) -> None:
+    """把已有的 movie.nfo 导入本地索引，并按番号查询是否已刮削。"""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli index",
+        description=(
+            "扫描媒体库中已有的 NFO（包括其它工具生成的），把番号、标题、演员、片商、封面写入本地索引，"
+            "之后判断“是否已刮削”无需重新刮削。"
+        ),
+    )
+    sub = parser.add_subparsers(dest="action", required=True)
+    scan = sub.add_parser("scan", help="扫描目录树并更新索引（只重新解析有变化的 NFO）")
+    scan.add_argument("roots", nargs="+", help="媒体库根目录")
+    scan.add_argument("--workers", type=int, default=None, help="并行解析的进程数，默认 CPU 核数")
+    scan.add_argument("--full", action="store_true", help="忽略修改时间，全部重新解析")
+    find = sub.add_parser("find", help="按番号查询（忽略大小写与连字符）")
+    find.add_argument("numbers", nargs="+", metavar="NUMBER")
+    missing = sub.add_parser("missing", help="从标准输入读取番号（每行一个），输出索引中没有的")
+    missing.add_argument("--input", default="-", help="番号列表文件，默认标准输入")
+    args = parser.parse_args(argv)
+
+    from app.services.library_index import get_library_index
+
+    with get_library_index(get_settings()) as index:
+        if args.action == "scan":
+            for root_arg in args.roots:
+                root = Path(root_arg).expanduser().resolve()
+                if not root.is_dir():
+                    raise SystemExit(f"目录不存在：{root}")
+                report = index.scan(root, workers=args.workers, full=args.full)
+                print(
+                    f"{root}：共 {report.total} 个 NFO，解析 {report.parsed}，未变化 {report.unchanged}，"
+                    f"移除 {report.removed}，失败 {report.failed}"
+                )
+                for err in report.errors[:20]:
+                    print(f"  ✗ {err}")
+            print(f"索引中共 {index.count()} 部影片")
+        elif args.action == "find":
+            for number in args.numbers:
+                found = index.find(number)
+                if not found:
+                    print(f"{number}：未找到")
+                for movie in found:
+                    print(f"{movie.number}  {movie.title or ''}  {movie.dir}")
+        else:
+            stream = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+            with stream:
+                numbers = [line.strip() for line in stream if line.strip()]
+            for number in index.filter_unscraped(numbers):
+                print(number)
+
+
+def _bandwidth_main(argv: list[str]) -> None:
+    """查看或调整本机的下载限速。"""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli bandwidth",
+        description=(
+            "查看或调整图片、预告片下载的全局限速（如 2M、512K，off 表示不限速）。"
+            "调整保存在缓存目录的 bandwidth.json 中，本机运行中的 Web 服务与 worker 约 1 秒内生效。"
+        ),
+    )
+    parser.add_argument("--day", default=None, metavar="RATE", help="白天的限速（字节/秒）")
+    parser.add_argument("--night", default=None, metavar="RATE", help="夜间的限速（字节/秒）")
+    parser.add_argument("--night-hours", default=None, metavar="H-H", help="夜间时段，如 23-7")
+    parser.add_argument("--reset", action="store_true", help="撤销调整，恢复环境变量中的限速")
+    args = parser.parse_args(argv)
+
+    from app.services.bandwidth import format_rate, get_shaper
+
+    shaper = get_shaper(get_settings())
+    if args.reset:
+        status = shaper.reset()
+    elif args.day is not None or args.night is not None or args.night_hours is not None:
+        try:
+            status = shaper.update(day=args.day, night=args.night, night_hours=args.night_hours)
+        except ValueError as exc:
+            raise SystemExit(str(exc)) from None
+    else:
+        status = shaper.status()
+
+    print(
+        f"白天：{format_rate(status['day'])}  "
+        f"夜间（{status['night_hours']} 时）：{format_rate(status['night'])}"
+    )
+    period = "夜间" if status["period"] == "night" else "白天"
+    source = "运行中调整" if status["source"] == "live" else "环境变量"
+    print(f"当前（{period}）：{status['current_text']}，来自{source}")
+
+
+# 子命令 -> 处理函数；第一个参数不是子命令时按刮削单部影片处理，兼容原有用法。
+_SUBCOMMANDS: Dict[str, Callable[[list[str]], None]] = {
+    "regenerate": _regenerate_main,
+    "rename": _rename_main,
+    "enqueue": _enqueue_main,
+    "worker": _worker_main,
+    "bundle": _bundle_main,
+    "dedupe": _dedupe_main,
+    "probe": _probe_main,
+    "index": _index_main,
+    "bandwidth": _bandwidth_main,
+}
+
+
+def main(argv: list[str] | None = None) -> None:
+    """命令行入口：
+
+    默认根据 javdb 影片页面 URL 和本地已存在的视频文件，在该视频所在目录
+    生成 Jellyfin 兼容的 movie.nfo、poster.jpg、fanart.jpg、extrafanart/* 等文件，
+    不会复制或移动原视频文件。
+
+    子命令：
+    - regenerate ROOT：根据已保存的元数据离线重新生成整个目录树的 movie.nfo；
+    - rename ROOT：根据已保存的元数据批量重命名视频（默认预览，支持撤销）；
+    - enqueue / worker：向共享任务队列提交任务 / 作为 worker 节点执行任务；
+    - bundle export / import：导出 / 导入刮削缓存包，在多个实例之间共享刮削结果；
+    - dedupe ROOT：按采样指纹查找内容重复的视频；
+    - probe ROOT：只读容器头部，列出视频时长、分辨率与编码；
+    - index scan / find / missing：把已有 NFO 导入本地索引，按番号判断是否已刮削；
+    - bandwidth：查看或调整下载限速（白天 / 夜间）。
+    """
+
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in _SUBCOMMANDS:
+        _SUBCOMMANDS[argv[0]](argv[1:])
+        return
+    _scrape_main(argv)
 
 
 if __name__ == "__main__":
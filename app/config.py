@@ -1,9 +1,36 @@
 from __future__ import annotations
 
 import os
+import re
+import tempfile
 from dataclasses import dataclass
 from functools import lru_cache
-from typing import Optional
+from typing import Optional, Tuple
+
+# 默认重命名格式（放在这里而非 file_service，CLI 的 --help 无需导入下载相关依赖）
+DEFAULT_RENAME_FORMAT = "[{actor}][{date}]{id}"
+
+_RATE_UNITS = {"": 1, "k": 1024, "m": 1024 * 1024, "g": 1024 * 1024 * 1024}
+_RATE = re.compile(r"(\d+(?:\.\d+)?)\s*([kmg]?)(?:i?b)?(?:/s)?")
+
+
+def parse_rate(value: str) -> int:
+    """带宽值 -> 字节/秒：`8M`、`500K`、`1.5MB/s`、`1048576`（单位按 1024 进位）；空、0、off 为不限速。"""
+    text = value.strip().lower()
+    if text in ("", "off", "none", "unlimited"):
+        return 0
+    m = _RATE.fullmatch(text)
+    if m is None:
+        raise ValueError(f"无法识别的带宽：{value}")
+    return int(float(m.group(1)) * _RATE_UNITS[m.group(2)])
+
+
+def parse_hours(value: str) -> Tuple[int, int]:
+    """时间段 `23-7` -> (23, 7)，表示本地时间 23:00 至次日 7:00；起止相同表示没有该时段。"""
+    start, sep, end = value.strip().partition("-")
+    if not sep or not start.strip().isdigit() or not end.strip().isdigit():
+        raise ValueError(f"无法识别的时间段：{value}")
+    return int(start) % 24, int(end) % 24
 
 
 @dataclass
@@ -12,13 +39,51 @@ class Settings:
 
     可以通过环境变量覆盖默认值：
     - NFOFETCH_USER_AGENT : HTTP User-Agent
-    - NFOFETCH_HTTP_PROXY : HTTP 代理，例如 http://127.0.0.1:7890
+    - NFOFETCH_HTTP_PROXY : HTTP 代理，例如 http://127.0.0.1:7890；可用逗号分隔多个代理组成代理池
+    - NFOFETCH_PROXY_CONCURRENCY: 每个代理同时进行的请求数上限，默认 4
+    - NFOFETCH_UPSTREAM_CONCURRENCY: 按优先级调度的上游并发名额，默认 代理数 × 每代理并发数（直连时为 8）
     - NFOFETCH_JAVDB_COOKIE: 访问 javdb 时使用的 Cookie（含 cf_clearance 等）
+    - NFOFETCH_IDENTITIES_FILE: 多组 Cookie / User-Agent 身份的 JSON 文件，设置后轮换使用并可热加载
+    - NFOFETCH_CACHE_DIR  : 图片缓存等本地缓存目录，默认系统临时目录下的 nfofetch-cache
+    - NFOFETCH_IMAGE_CACHE_MB: 图片缓存容量上限（MB），超出后按最近最少使用淘汰
+    - NFOFETCH_METADATA_CACHE_DAYS: 刮削结果缓存的有效天数，默认 7，0 表示不使用缓存
+    - NFOFETCH_IMAGE_HEDGE_MS: 图片请求多久未完成就发出对冲（重复）请求，默认 auto（近期下载耗时的 p90），0 表示关闭
+    - NFOFETCH_IMAGE_HEDGE_PERCENT: 对冲请求数占图片请求数的上限（百分比），默认 10
+    - NFOFETCH_TRAILER: 设为 1 时写入影片时同时下载预告片（`<视频名>-trailer.mp4`），默认关闭
+    - NFOFETCH_TRAILER_CONNECTIONS: 预告片分段并行下载的连接数，默认 4
+    - NFOFETCH_BANDWIDTH_DAY / NFOFETCH_BANDWIDTH_NIGHT: 图片、预告片下载的全局限速（每秒字节数，可带 K/M/G），
+      默认 0 不限速；运行中可通过 /bandwidth 或 `python -m app.cli bandwidth` 调整
+    - NFOFETCH_NIGHT_HOURS: 使用夜间限速的本地时段，默认 23-7
+    - NFOFETCH_JOB_DEADLINE: 单部影片刮削 + 写入的总时间预算（秒），默认 120，0 表示不限
+    - NFOFETCH_QUEUE_PATH : 分布式任务队列（SQLite 文件，可放在共享存储上），设置后 Web 端可提交任务
+    - NFOFETCH_EMBEDDED_WORKERS: Web 进程内以后台优先级执行队列任务的 worker 线程数，默认 0
+    - NFOFETCH_PARSE_WORKERS: 队列任务解析详情页使用的进程数，auto 为 CPU 核数，默认 0（在 worker 线程内解析）
     """
 
     user_agent: str
     http_proxy: Optional[str]
     javdb_cookie: Optional[str]
+    proxy_concurrency: int = 4
+    # 0 表示按代理配置自动计算
+    upstream_concurrency: int = 0
+    cache_dir: str = os.path.join(tempfile.gettempdir(), "nfofetch-cache")
+    image_cache_bytes: int = 512 * 1024 * 1024
+    metadata_cache_ttl: float = 7 * 86400.0
+    job_deadline: float = 120.0
+    queue_path: Optional[str] = None
+    embedded_workers: int = 0
+    # -1 表示按 CPU 核数；0 表示不使用解析进程池
+    parse_workers: int = 0
+    identities_file: Optional[str] = None
+    # None 表示按近期耗时自动决定；0 表示关闭对冲
+    image_hedge_delay: Optional[float] = None
+    image_hedge_budget: float = 0.1
+    download_trailer: bool = False
+    trailer_connections: int = 4
+    # 字节/秒，0 表示不限速
+    bandwidth_day: int = 0
+    bandwidth_night: int = 0
+    night_hours: Tuple[int, int] = (23, 7)
 
 
 @lru_cache(maxsize=1)
@@ -34,10 +99,87 @@ def get_settings() -> Settings:
 
     http_proxy = os.getenv("NFOFETCH_HTTP_PROXY") or None
     javdb_cookie = os.getenv("NFOFETCH_JAVDB_COOKIE") or None
+    cache_dir = os.getenv("NFOFETCH_CACHE_DIR") or os.path.join(
+        tempfile.gettempdir(), "nfofetch-cache"
+    )
+    try:
+        image_cache_mb = int(os.getenv("NFOFETCH_IMAGE_CACHE_MB", "512"))
+    except ValueError:
+        image_cache_mb = 512
+    try:
+        metadata_cache_days = float(os.getenv("NFOFETCH_METADATA_CACHE_DAYS", "7"))
+    except ValueError:
+        metadata_cache_days = 7.0
+    try:
+        proxy_concurrency = int(os.getenv("NFOFETCH_PROXY_CONCURRENCY", "4"))
+    except ValueError:
+        proxy_concurrency = 4
+    try:
+        upstream_concurrency = max(0, int(os.getenv("NFOFETCH_UPSTREAM_CONCURRENCY", "0")))
+    except ValueError:
+        upstream_concurrency = 0
+    try:
+        embedded_workers = max(0, int(os.getenv("NFOFETCH_EMBEDDED_WORKERS", "0")))
+    except ValueError:
+        embedded_workers = 0
+    parse_env = os.getenv("NFOFETCH_PARSE_WORKERS", "0").strip().lower()
+    try:
+        parse_workers = -1 if parse_env == "auto" else max(0, int(parse_env or "0"))
+    except ValueError:
+        parse_workers = 0
+    try:
+        job_deadline = max(0.0, float(os.getenv("NFOFETCH_JOB_DEADLINE", "120")))
+    except ValueError:
+        job_deadline = 120.0
+    hedge_ms = os.getenv("NFOFETCH_IMAGE_HEDGE_MS", "auto").strip().lower()
+    try:
+        image_hedge_delay = None if hedge_ms in ("", "auto") else max(0.0, float(hedge_ms) / 1000)
+    except ValueError:
+        image_hedge_delay = None
+    try:
+        image_hedge_budget = max(0.0, float(os.getenv("NFOFETCH_IMAGE_HEDGE_PERCENT", "10")) / 100)
+    except ValueError:
+        image_hedge_budget = 0.1
+    download_trailer = os.getenv("NFOFETCH_TRAILER", "").strip().lower() in ("1", "true", "yes", "on")
+    try:
+        trailer_connections = max(1, int(os.getenv("NFOFETCH_TRAILER_CONNECTIONS", "4")))
+    except ValueError:
+        trailer_connections = 4
+    try:
+        bandwidth_day = parse_rate(os.getenv("NFOFETCH_BANDWIDTH_DAY", "0"))
+    except ValueError:
+        bandwidth_day = 0
+    try:
+        bandwidth_night = parse_rate(os.getenv("NFOFETCH_BANDWIDTH_NIGHT", "0"))
+    except ValueError:
+        bandwidth_night = 0
+    try:
+        night_hours = parse_hours(os.getenv("NFOFETCH_NIGHT_HOURS", "23-7"))
+    except ValueError:
+        night_hours = (23, 7)
+    queue_path = os.getenv("NFOFETCH_QUEUE_PATH") or None
+    identities_file = os.getenv("NFOFETCH_IDENTITIES_FILE") or None
 
     return Settings(
         user_agent=user_agent,
         http_proxy=http_proxy,
         javdb_cookie=javdb_cookie,
+        proxy_concurrency=proxy_concurrency,
+        upstream_concurrency=upstream_concurrency,
+        cache_dir=cache_dir,
+        image_cache_bytes=image_cache_mb * 1024 * 1024,
+        metadata_cache_ttl=metadata_cache_days * 86400.0,
+        job_deadline=job_deadline,
+        queue_path=queue_path,
+        embedded_workers=embedded_workers,
+        parse_workers=parse_workers,
+        identities_file=identities_file,
+        image_hedge_delay=image_hedge_delay,
+        image_hedge_budget=image_hedge_budget,
+        download_trailer=download_trailer,
+        trailer_connections=trailer_connections,
+        bandwidth_day=bandwidth_day,
+        bandwidth_night=bandwidth_night,
+        night_hours=night_hours,
     )
 
@@ -0,0 +1,141 @@
+"""单次刮削任务的截止时间与协作式取消。
+
+一次任务（Web 请求、队列任务、命令行刮削）开始时用 `job_deadline()` 设定总预算，
+截止时间通过 contextvar 传递到抓取、调度等待与图片下载等各阶段：
+
+- 各上游请求的超时取 `min(默认超时, 剩余时间)`（见 `stage_timeout`）；
+- 预算用尽或任务被取消（例如浏览器断开连接）后，后续阶段直接跳过，
+  进行中的下载在下一个数据块处放弃；
+- 被跳过或中断的阶段由各阶段的发起方（刮削、写入图片）用 `note_cut` 记录，写入结果供展示。
+
+未设定截止时间时各函数均为空操作，行为与之前一致。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+
+
+class DeadlineExceeded(RuntimeError):
+    """任务预算用尽或已被取消。"""
+
+    def __init__(self, stage: str, *, cancelled: bool = False) -> None:
+        reason = "任务已取消" if cancelled else "任务超出时间预算"
+        super().__init__(f"{reason}（{stage}）")
+        self.stage = stage
+        self.cancelled = cancelled
+
+
+class Deadline:
+    """一次任务的截止时间；seconds 为 None 时不限时，但仍可被取消。"""
+
+    def __init__(self, seconds: Optional[float]) -> None:
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self.cancelled = threading.Event()
+        self.cut: List[str] = []
+        self._lock = threading.Lock()
+        self._children: List["Deadline"] = []
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        if self.cancelled.is_set():
+            return True
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        with self._lock:
+            children = list(self._children)
+        for child in children:
+            child.cancel()
+
+    def child(self) -> "Deadline":
+        """派生子任务（例如多源刮削中的单个站点）：截止时间相同，父任务取消时一并取消，
+        也可以单独取消而不影响父任务。"""
+        child = Deadline(None)
+        child.expires_at = self.expires_at
+        with self._lock:
+            self._children.append(child)
+        if self.cancelled.is_set():
+            child.cancel()
+        return child
+
+    def note_cut(self, stage: str) -> None:
+        with self._lock:
+            if stage not in self.cut:
+                self.cut.append(stage)
+
+    def check(self, stage: str) -> None:
+        """预算用尽或已取消时抛出 DeadlineExceeded。"""
+        if self.expired():
+            raise DeadlineExceeded(stage, cancelled=self.cancelled.is_set())
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("nfofetch_deadline", default=None)
+
+
+@contextmanager
+def job_deadline(
+    seconds: Optional[float] = None, deadline: Optional[Deadline] = None
+) -> Iterator[Deadline]:
+    """在块内设定任务截止时间（也可传入已创建的 Deadline，以便在别处取消）。"""
+    dl = deadline or Deadline(seconds)
+    token = _current.set(dl)
+    try:
+        yield dl
+    finally:
+        _current.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def check_deadline(stage: str) -> None:
+    dl = _current.get()
+    if dl is not None:
+        dl.check(stage)
+
+
+def deadline_expired() -> bool:
+    dl = _current.get()
+    return dl is not None and dl.expired()
+
+
+def note_cut(stage: str) -> None:
+    dl = _current.get()
+    if dl is not None:
+        dl.note_cut(stage)
+
+
+def stage_timeout(default: float, stage: str) -> float:
+    """某个上游请求的超时：默认值与剩余预算中的较小者；预算已用尽时抛出 DeadlineExceeded。"""
+    dl = _current.get()
+    if dl is None:
+        return default
+    dl.check(stage)
+    remaining = dl.remaining()
+    return default if remaining is None else max(0.001, min(default, remaining))
+
+
+def bounded(default: float) -> float:
+    """默认等待时间与剩余预算中的较小者（不小于 0），不抛出异常。"""
+    dl = _current.get()
+    remaining = dl.remaining() if dl is not None else None
+    if dl is not None and dl.cancelled.is_set():
+        return 0.0
+    return default if remaining is None else max(0.0, min(default, remaining))
+
+
+def cut_stages() -> List[str]:
+    dl = _current.get()
+    return list(dl.cut) if dl is not None else []
@@ -1,17 +1,40 @@
+import asyncio
 import os
 import re
+from contextlib import AbstractContextManager, nullcontext
 from pathlib import Path
+from typing import Callable, TypeVar
 
-from fastapi import FastAPI, Form, Request, Query
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Form, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from app.config import get_settings
+from app.deadline import Deadline, bounded, job_deadline
+from app.metrics import render_metrics, start_snapshot_writer
 from app.schemas import ScrapeResult
+from app.services.bandwidth import get_shaper
 from app.services.file_service import save_assets_for_existing_video
+from app.services.image_cache import (
+    allow_image_urls,
+    fetch_original,
+    fetch_thumbnail,
+    guess_media_type,
+    is_allowed_image_url,
+)
 from app.services.nfo_service import build_movie_nfo
+from app.services.prefetch_service import (
+    PREFETCH_WAIT_SECONDS,
+    cancel_prefetch,
+    finish_prefetch,
+    start_prefetch,
+)
+from app.services.probe_service import probe_video
+from app.services.scheduler import PREVIEW, WRITE, priority
 from app.services.scrape_service import scrape_movie
+from app.tracing import list_traces, slow_threshold, start_trace, trace_dir, trace_mode
 
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -38,6 +61,24 @@ app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 
 
+def _request_trace(request: Request, name: str) -> AbstractContextManager:
+    """根据 NFOFETCH_TRACE 与请求参数决定是否追踪本次请求。
+
+    请求带 `?trace=1` 或 `X-Nfofetch-Trace: 1` 时总是追踪；
+    NFOFETCH_TRACE=slow 时只保存耗时超过 NFOFETCH_TRACE_SLOW_SECONDS 的请求。
+    """
+    forced = (
+        request.query_params.get("trace") == "1"
+        or request.headers.get("X-Nfofetch-Trace") == "1"
+    )
+    mode = trace_mode()
+    if forced or mode == "all":
+        return start_trace(name)
+    if mode == "slow":
+        return start_trace(name, keep_if_slower_than=slow_threshold())
+    return nullcontext()
+
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request) -> HTMLResponse:
     """首页：渲染包含 HTMX 表单的页面。"""
@@ -106,25 +147,71 @@ async def browse(
     )
 
 
+T = TypeVar("T")
+
+# 刮削进行中检查浏览器是否已断开连接的间隔（秒）。
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+async def _run_job(request: Request, fn: Callable[[], T]) -> T:
+    """在线程池中执行一次刮削任务，时间预算为 NFOFETCH_JOB_DEADLINE。
+
+    等待期间定期检查客户端是否已断开（关闭标签页、刷新页面），断开时取消任务：
+    排队中的上游请求放弃排队，进行中的下载在下一个数据块处中止，剩余阶段直接跳过。
+    """
+    dl = Deadline(get_settings().job_deadline or None)
+    with job_deadline(deadline=dl):
+        # Task 创建时复制当前上下文（追踪、优先级与截止时间），线程池同样沿用
+        task = asyncio.ensure_future(run_in_threadpool(fn))
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if not dl.cancelled.is_set() and await request.is_disconnected():
+                dl.cancel()
+    except asyncio.CancelledError:
+        dl.cancel()
+        raise
+
+
+def _client_key(request: Request) -> str:
+    """同一优先级内按客户端轮转分配上游名额。"""
+    return request.client.host if request.client else ""
+
+
 @app.post("/scrape/fetch", response_class=HTMLResponse)
 async def scrape_fetch(
     request: Request,
     url: str = Form(...),
+    refresh: bool = Form(default=False),
 ) -> HTMLResponse:
-    """仅刮削元数据和图片，不写入磁盘。返回预览供用户选择后点击「写入」。"""
+    """仅刮削元数据和图片，不写入磁盘。返回预览供用户选择后点击「写入」。
+
+    refresh 为真时忽略刮削结果缓存重新刮削，之后的「写入」会用到刷新后的缓存。
+    """
     settings = get_settings()
     error: str | None = None
     metadata = None
     poster_candidates: list[str] = []
+    prefetch_id: str | None = None
+    client = _client_key(request)
 
-    try:
-        metadata = scrape_movie(url, settings=settings)
-        seen: set[str] = set()
+    def work():
+        metadata = scrape_movie(url, settings=settings, use_cache=not refresh)
+        candidates: list[str] = []
         for u in list(metadata.posters) + list(metadata.art):
             s = str(u)
-            if s not in seen:
-                seen.add(s)
-                poster_candidates.append(s)
+            if s not in candidates:
+                candidates.append(s)
+        allow_image_urls(candidates)
+        # 用户挑选图片期间在后台预取全部候选图，写入时基本只剩本地复制。
+        prefetch = start_prefetch(candidates, settings, tenant=client) if candidates else None
+        return metadata, candidates, prefetch
+
+    try:
+        with _request_trace(request, "scrape_fetch"), priority(PREVIEW, client):
+            metadata, poster_candidates, prefetch_id = await _run_job(request, work)
     except Exception as exc:  # noqa: BLE001
         error = str(exc)
 
@@ -134,6 +221,7 @@ async def scrape_fetch(
             "request": request,
             "metadata": metadata,
             "poster_candidates": poster_candidates,
+            "prefetch_id": prefetch_id,
             "error": error,
             "url": url,
         },
@@ -148,18 +236,22 @@ async def scrape(
     poster_url: str | None = Form(default=None),
     fanart_url: str | None = Form(default=None),
     rename_format: str | None = Form(default=None),
+    prefetch_id: str | None = Form(default=None),
+    refresh: bool = Form(default=False),
 ) -> HTMLResponse:
-    """处理 HTMX 表单：刮削 javdb 并生成 NFO / 图片 / 影片目录。"""
+    """处理 HTMX 表单：刮削 javdb 并生成 NFO / 图片 / 影片目录（refresh 为真时忽略刮削结果缓存）。"""
     settings = get_settings()
-    try:
-        metadata = scrape_movie(url, settings=settings)
-        nfo_text = build_movie_nfo(metadata)
 
+    def work() -> ScrapeResult:
+        metadata = scrape_movie(url, settings=settings, use_cache=not refresh)
+        if prefetch_id:
+            finish_prefetch(prefetch_id, timeout=bounded(PREFETCH_WAIT_SECONDS))
         vp = Path(video_path).expanduser()
         if not vp.is_file():
             raise FileNotFoundError(f"视频文件不存在或不可读：{vp}")
+        nfo_text = build_movie_nfo(metadata, probe_video(vp))
 
-        result: ScrapeResult = save_assets_for_existing_video(
+        return save_assets_for_existing_video(
             metadata=metadata,
             nfo_text=nfo_text,
             video_path=vp,
@@ -168,6 +260,10 @@ async def scrape(
             fanart_url=fanart_url,
             rename_format=rename_format or None,
         )
+
+    try:
+        with _request_trace(request, "scrape"), priority(WRITE, _client_key(request)):
+            result: ScrapeResult = await _run_job(request, work)
     except Exception as exc:  # noqa: BLE001 - 用户侧希望看到原始错误
         result = ScrapeResult(success=False, message=str(exc))
 
@@ -180,11 +276,157 @@ async def scrape(
     )
 
 
+def _job_queue():
+    from app.services.job_queue import JobQueue
+
+    queue_path = get_settings().queue_path
+    if not queue_path:
+        raise HTTPException(status_code=404, detail="未配置任务队列（NFOFETCH_QUEUE_PATH）")
+    return JobQueue(queue_path)
+
+
+@app.post("/jobs")
+def enqueue_job(
+    url: str = Form(...),
+    video_path: str = Form(...),
+    rename_format: str | None = Form(default=None),
+) -> JSONResponse:
+    """提交刮削任务到共享队列，由 worker 节点（python -m app.cli worker）执行。"""
+    with _job_queue() as queue:
+        job_id = queue.enqueue(url, video_path, rename_format or None)
+    return JSONResponse({"id": job_id})
+
+
+@app.get("/jobs")
+def job_counts() -> JSONResponse:
+    with _job_queue() as queue:
+        return JSONResponse(queue.counts())
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: int) -> JSONResponse:
+    with _job_queue() as queue:
+        job = queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return JSONResponse(
+        {
+            "id": job.id,
+            "url": job.url,
+            "video_path": job.video_path,
+            "status": job.status,
+            "attempts": job.attempts,
+            "worker": job.worker,
+            "result": job.result,
+            "error": job.error,
+        }
+    )
+
+
+@app.post("/prefetch/{prefetch_id}/cancel")
+async def prefetch_cancel(prefetch_id: str) -> JSONResponse:
+    """放弃预览（重新刮削 / 离开页面）时由前端调用，取消尚未开始的图片预取。"""
+    return JSONResponse({"cancelled": cancel_prefetch(prefetch_id)})
+
+
+@app.get("/img")
+def image_proxy(
+    request: Request,
+    url: str = Query(..., description="原始图片 URL"),
+    w: int | None = Query(default=None, ge=1, le=4096, description="缩略图宽度，留空返回原图"),
+) -> FileResponse:
+    """图片代理：经配置的代理下载图片并缓存到本地，可按宽度生成缩略图。
+
+    只代理已知图床与刮削结果中出现过的主机，其它 URL 返回 403。
+
+    同步函数由 FastAPI 放到线程池执行，下载不会阻塞事件循环。
+    """
+    if not url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="仅支持 http/https 图片 URL")
+    if not is_allowed_image_url(url):
+        raise HTTPException(status_code=403, detail="只代理刮削结果中的图片")
+    settings = get_settings()
+    with priority(PREVIEW, _client_key(request)):
+        path = fetch_thumbnail(url, w, settings) if w else fetch_original(url, settings)
+    if path is None:
+        raise HTTPException(status_code=502, detail="图片下载失败")
+    return FileResponse(
+        path,
+        media_type=guess_media_type(path),
+        headers={"Cache-Control": "public, max-age=86400"},
+    )
+
+
 @app.get("/health", response_class=HTMLResponse)
 async def health() -> HTMLResponse:
     return HTMLResponse("OK")
 
 
+@app.on_event("startup")
+async def _start_metrics_writer() -> None:
+    # 多 worker 部署时每个进程定期把指标快照写入 NFOFETCH_METRICS_DIR。
+    start_snapshot_writer()
+
+
+@app.on_event("startup")
+async def _start_embedded_workers() -> None:
+    # 配置了 NFOFETCH_EMBEDDED_WORKERS 时，在本进程内以后台优先级执行队列任务。
+    from app.services.worker_service import start_embedded_workers
+
+    start_embedded_workers(get_settings())
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Prometheus 文本格式的运行指标（各阶段耗时、上游状态码、下载量等）。"""
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/bandwidth")
+def bandwidth_status() -> JSONResponse:
+    """当前的下载限速（字节/秒，0 为不限速）及所处时段。"""
+    return JSONResponse(get_shaper(get_settings()).status())
+
+
+@app.post("/bandwidth")
+def bandwidth_update(
+    day: str | None = Form(default=None),
+    night: str | None = Form(default=None),
+    night_hours: str | None = Form(default=None),
+) -> JSONResponse:
+    """运行中调整下载限速（如 day=2M、night=off、night_hours=1-8），本机各进程随后生效。"""
+    try:
+        status = get_shaper(get_settings()).update(day=day, night=night, night_hours=night_hours)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from None
+    return JSONResponse(status)
+
+
+@app.delete("/bandwidth")
+def bandwidth_reset() -> JSONResponse:
+    """撤销运行中的调整，恢复环境变量中的限速。"""
+    return JSONResponse(get_shaper(get_settings()).reset())
+
+
+@app.get("/traces")
+async def traces(limit: int = Query(default=20, ge=1, le=200)) -> JSONResponse:
+    """列出最近保存的追踪文件（新的在前）。"""
+    return JSONResponse(list_traces(limit))
+
+
+@app.get("/traces/{name}")
+async def trace_file(name: str) -> FileResponse:
+    """下载追踪文件（.trace.json 可在 chrome://tracing / Perfetto 中打开，.prof 为 cProfile 结果）。"""
+    if "/" in name or "\\" in name or not name.endswith((".trace.json", ".prof")):
+        raise HTTPException(status_code=404)
+    path = trace_dir() / name
+    if not path.is_file():
+        raise HTTPException(status_code=404)
+    return FileResponse(path, filename=name)
+
+
 if __name__ == "__main__":
     import uvicorn
 
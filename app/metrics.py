@@ -0,0 +1,497 @@
+"""进程内轻量指标（Prometheus 文本格式），无第三方依赖。
+
+- 每个指标一把锁，只保护字典里的一次加法，几乎无竞争；
+- 多 worker（uvicorn --workers N）时设置 NFOFETCH_METRICS_DIR 为各进程共享的目录：
+  每个进程定期把自己的快照写成 `metrics-<主机名>-<pid>-<启动时间>.json`，/metrics 汇总目录下所有快照。
+  已退出进程的计数器 / 直方图会保留（累计值），gauge 则只统计仍存活的进程；
+  停止更新超过几个写入周期的快照会被并入 `metrics-dead.json` 后删除。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.tracing import span
+
+
+LabelValues = Tuple[str, ...]
+
+REGISTRY: List["_Metric"] = []
+
+# 默认延迟桶（秒），覆盖从本地解析到慢速 CDN 下载的范围。
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 60.0,
+)
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[LabelValues, Any] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = [[list(k), _copy(v)] for k, v in self._values.items()]
+        return {
+            "type": self.type_name,
+            "help": self.help,
+            "labels": list(self.label_names),
+            "samples": samples,
+        }
+
+
+def _copy(value: Any) -> Any:
+    return list(value) if isinstance(value, list) else value
+
+
+class Counter(_Metric):
+    """只增不减的计数器。"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值。"""
+
+    type_name = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    """分桶直方图。内部按非累计的桶计数保存，输出时再累加。"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        idx = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                idx = i
+                break
+        with self._lock:
+            # [各桶计数..., +Inf 桶计数, sum, count]
+            row = self._values.get(key)
+            if row is None:
+                row = [0.0] * (len(self.buckets) + 3)
+                self._values[key] = row
+            row[idx] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        data = super().snapshot()
+        data["buckets"] = list(self.buckets)
+        return data
+
+
+STAGE_SECONDS = Histogram(
+    "nfofetch_stage_seconds",
+    "各处理阶段耗时（fetch/parse/nfo_build/image_download/rename）",
+    ["stage"],
+)
+UPSTREAM_RESPONSES = Counter(
+    "nfofetch_upstream_responses_total",
+    "上游响应数，按主机与状态码统计（error 表示连接失败 / 超时）",
+    ["host", "status"],
+)
+DOWNLOADED_BYTES = Counter(
+    "nfofetch_downloaded_bytes_total",
+    "从上游下载的字节数",
+    ["kind"],
+)
+PAGE_BYTES_SAVED = Counter(
+    "nfofetch_page_bytes_saved_total",
+    "详情页提前结束读取节省的字节数：download 为未下载的传输字节（需响应带 Content-Length），"
+    "parse 为下载了但未交给解析器的字节",
+    ["kind"],
+)
+SCRAPES_IN_FLIGHT = Gauge(
+    "nfofetch_scrapes_in_flight",
+    "正在进行中的刮削数量",
+)
+PROXY_UP = Gauge(
+    "nfofetch_proxy_up",
+    "代理是否可用（1 可用，0 因连续失败被暂时剔除）",
+    ["proxy"],
+)
+PROXY_IN_FLIGHT = Gauge(
+    "nfofetch_proxy_in_flight",
+    "经各代理进行中的请求数",
+    ["proxy"],
+)
+IDENTITIES = Gauge(
+    "nfofetch_identities",
+    "身份池中各状态（active / cooling / retired）的身份数量",
+    ["state"],
+)
+SCHEDULER_QUEUED = Gauge(
+    "nfofetch_scheduler_queued",
+    "等待上游名额的请求数，按优先级（preview / write / batch）统计",
+    ["priority"],
+)
+SCHEDULER_WAIT_SECONDS = Histogram(
+    "nfofetch_scheduler_wait_seconds",
+    "上游请求等待名额的时间，按优先级与阶段（fetch / image）统计",
+    ["priority", "stage"],
+)
+PARSE_QUEUED = Gauge(
+    "nfofetch_parse_queued",
+    "已提交给解析进程池、尚未解析完成的页面数（达到上限时下载线程等待）",
+)
+IMAGE_HEDGES = Counter(
+    "nfofetch_image_hedges_total",
+    "图片对冲请求：sent 为已发出，won 为对冲请求先完成，skipped 为因预算用尽未发出",
+    ["outcome"],
+)
+BANDWIDTH_LIMIT = Gauge(
+    "nfofetch_bandwidth_limit_bytes",
+    "当前生效的图片 / 预告片下载限速（字节/秒），0 表示不限速",
+)
+BANDWIDTH_WAIT_SECONDS = Counter(
+    "nfofetch_bandwidth_wait_seconds_total",
+    "下载因全局限速而等待的累计时间，按下载类型（image / trailer）统计",
+    ["kind"],
+)
+CACHE_REQUESTS = Counter(
+    "nfofetch_cache_requests_total",
+    "缓存查询次数，result 为 hit / miss，命中率 = hit / (hit + miss)",
+    ["cache", "result"],
+)
+
+
+@contextmanager
+def time_stage(stage: str, **span_args: Any) -> Iterator[None]:
+    """记录一个阶段的耗时（异常时同样记录），开启追踪时同时记录为一个 span。"""
+    start = time.perf_counter()
+    try:
+        with span(stage, **span_args):
+            yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def record_upstream(host: str, status: int | str, nbytes: int = 0, kind: str = "page") -> None:
+    """记录一次上游响应的状态码与下载字节数。"""
+    UPSTREAM_RESPONSES.inc(host=host, status=status)
+    if nbytes:
+        DOWNLOADED_BYTES.inc(nbytes, kind=kind)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+# ---- 多进程快照 ----
+
+
+def _metrics_dir() -> Optional[Path]:
+    value = os.getenv("NFOFETCH_METRICS_DIR")
+    return Path(value) if value else None
+
+
+# 已退出进程的计数器 / 直方图并入此快照，累计值不会因删除旧快照而回落。
+DEAD_SNAPSHOT_NAME = "metrics-dead.json"
+# 快照超过这么多个写入周期未更新即视为进程已退出，合并后删除。
+STALE_INTERVALS = 3
+# 合并锁超过该时长仍在视为持有者已崩溃。
+_FOLD_LOCK_STALE_SECONDS = 60.0
+# 已并入并删除的快照文件名在合并快照中保留的时长。
+_FOLDED_KEEP_SECONDS = 300.0
+
+_snapshot_interval = 5.0
+# (pid, 主机名, 启动时间)；fork 出的子进程 pid 不同，会重新生成
+_identity: Optional[Tuple[int, str, float]] = None
+
+
+def _process_identity() -> Tuple[int, str, float]:
+    global _identity
+    pid = os.getpid()
+    if _identity is None or _identity[0] != pid:
+        _identity = (pid, socket.gethostname(), time.time())
+    return _identity
+
+
+def _snapshot_name() -> str:
+    pid, host, started = _process_identity()
+    # 主机名 + 启动时间区分不同主机 / 容器里相同的 pid 以及 pid 复用
+    safe_host = re.sub(r"[^A-Za-z0-9_.]", "_", host) or "host"
+    return f"metrics-{safe_host}-{pid}-{int(started * 1000)}.json"
+
+
+def snapshot() -> Dict[str, Any]:
+    pid, host, started = _process_identity()
+    return {
+        "pid": pid,
+        "host": host,
+        "started": started,
+        "written": time.time(),
+        "interval": _snapshot_interval,
+        "metrics": {m.name: m.snapshot() for m in REGISTRY},
+    }
+
+
+def write_snapshot() -> None:
+    """把当前进程的快照写入共享目录（未配置时不做任何事）。"""
+    directory = _metrics_dir()
+    if directory is None:
+        return
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / _snapshot_name()
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(snapshot()), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+_writer_started = False
+_writer_lock = threading.Lock()
+
+
+def start_snapshot_writer(interval: float = 5.0) -> None:
+    """启动后台线程定期写快照；每个进程只会启动一次。"""
+    global _writer_started, _snapshot_interval
+    if _metrics_dir() is None:
+        return
+    with _writer_lock:
+        if _writer_started:
+            return
+        _writer_started = True
+        _snapshot_interval = interval
+
+    def _loop() -> None:
+        while True:
+            try:
+                write_snapshot()
+            except OSError:
+                pass
+            time.sleep(interval)
+
+    threading.Thread(target=_loop, name="nfofetch-metrics", daemon=True).start()
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_snapshot(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        snap = json.loads(path.read_text(encoding="utf-8"))
+        if not snap.get("written"):
+            # 旧格式快照没有写入时间，以文件修改时间代替
+            snap["written"] = path.stat().st_mtime
+    except (OSError, ValueError, AttributeError):
+        return None
+    return snap if isinstance(snap.get("metrics"), dict) else None
+
+
+def _is_stale(snap: Dict[str, Any], now: float) -> bool:
+    interval = float(snap.get("interval") or _snapshot_interval)
+    return now - float(snap["written"]) > STALE_INTERVALS * interval
+
+
+def _is_alive(snap: Dict[str, Any], now: float) -> bool:
+    pid, host, started = _process_identity()
+    if snap.get("pid") == pid and snap.get("host") == host and snap.get("started") == started:
+        return True
+    if _is_stale(snap, now):
+        return False
+    # 只有同一主机上的 pid 才能直接检查；其它主机 / 容器的快照以是否按时更新为准
+    return snap.get("host") != host or _pid_alive(int(snap.get("pid", 0)))
+
+
+def _collect_snapshots() -> List[Dict[str, Any]]:
+    """读取目录下所有进程的快照。
+
+    已停止更新的快照在这里并入 DEAD_SNAPSHOT_NAME 后删除。合并快照记录了已并入的文件名，
+    且最后读取：先读到的快照若已被并入则以合并快照为准，同一份计数不会算两次，也不会漏算。
+    """
+    directory = _metrics_dir()
+    if directory is None:
+        return [snapshot()]
+    write_snapshot()
+    now = time.time()
+    snaps: Dict[str, Dict[str, Any]] = {}
+    stale: List[Path] = []
+    for path in directory.glob("metrics-*.json"):
+        if path.name == DEAD_SNAPSHOT_NAME:
+            continue
+        snap = _read_snapshot(path)
+        if snap is None:
+            continue
+        snap["alive"] = _is_alive(snap, now)
+        snaps[path.name] = snap
+        if not snap["alive"] and _is_stale(snap, now):
+            stale.append(path)
+    if stale:
+        _fold_dead(directory, stale)
+    dead = _read_snapshot(directory / DEAD_SNAPSHOT_NAME)
+    if dead is None:
+        return list(snaps.values())
+    folded = dict(dead.get("folded") or {})
+    dead["alive"] = False
+    return [dead] + [
+        snap for name, snap in snaps.items() if folded.get(name) != snap["written"]
+    ]
+
+
+def _fold_dead(directory: Path, paths: List[Path]) -> None:
+    """把已退出进程的快照并入 DEAD_SNAPSHOT_NAME 后删除；其它进程正在合并时跳过。"""
+    lock = directory / (DEAD_SNAPSHOT_NAME + ".lock")
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - lock.stat().st_mtime > _FOLD_LOCK_STALE_SECONDS:
+                lock.unlink()
+        except OSError:
+            pass
+        return
+    except OSError:
+        return
+    os.close(fd)
+    try:
+        dead_path = directory / DEAD_SNAPSHOT_NAME
+        dead = _read_snapshot(dead_path) or {"metrics": {}}
+        now = time.time()
+        # 文件名 -> 已并入快照的写入时间；已删除的条目保留一段时间，
+        # 覆盖读取方先读到原快照、后读到合并快照的情况
+        folded: Dict[str, float] = {
+            name: written
+            for name, written in dict(dead.get("folded") or {}).items()
+            if (directory / name).exists() or now - written < _FOLDED_KEEP_SECONDS
+        }
+        snaps = [{**dead, "alive": False}]
+        for path in paths:
+            snap = _read_snapshot(path)
+            if snap is not None and folded.get(path.name) != snap["written"]:
+                snaps.append({**snap, "alive": False})
+                folded[path.name] = snap["written"]
+        merged = _merge(snaps)
+        for data in merged.values():
+            data["samples"] = [[list(k), v] for k, v in data["samples"].items()]
+        # 先写合并快照（含已并入的文件名）再删除原快照，读取方不会漏算
+        tmp = dead_path.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps({"written": now, "folded": folded, "metrics": merged}),
+            encoding="utf-8",
+        )
+        os.replace(tmp, dead_path)
+        for path in paths:
+            path.unlink(missing_ok=True)
+    except OSError:
+        pass
+    finally:
+        lock.unlink(missing_ok=True)
+
+
+def _merge(snaps: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    merged: Dict[str, Dict[str, Any]] = {}
+    for snap in snaps:
+        alive = snap.get("alive", True)
+        for name, data in snap.get("metrics", {}).items():
+            if data["type"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**data, "samples": {}})
+            values: Dict[LabelValues, Any] = target["samples"]
+            for labels, value in data["samples"]:
+                key = tuple(labels)
+                if isinstance(value, list):
+                    prev = values.get(key)
+                    values[key] = (
+                        [a + b for a, b in zip(prev, value)] if prev else list(value)
+                    )
+                else:
+                    values[key] = values.get(key, 0.0) + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_metrics() -> str:
+    """以 Prometheus 文本格式（0.0.4）输出所有进程汇总后的指标。"""
+    lines: List[str] = []
+    for name, data in _merge(_collect_snapshots()).items():
+        lines.append(f"# HELP {name} {data['help']}")
+        lines.append(f"# TYPE {name} {data['type']}")
+        label_names = data["labels"]
+        for labels, value in sorted(data["samples"].items()):
+            if data["type"] == "histogram":
+                cumulative = 0.0
+                for bound, count in zip(data["buckets"], value):
+                    cumulative += count
+                    le = _labels_text(label_names, labels, f'le="{bound}"')
+                    lines.append(f"{name}_bucket{le} {_fmt(cumulative)}")
+                cumulative += value[len(data["buckets"])]
+                le = _labels_text(label_names, labels, 'le="+Inf"')
+                lines.append(f"{name}_bucket{le} {_fmt(cumulative)}")
+                lbl = _labels_text(label_names, labels)
+                lines.append(f"{name}_sum{lbl} {_fmt(value[-2])}")
+                lines.append(f"{name}_count{lbl} {_fmt(value[-1])}")
+            else:
+                lines.append(f"{name}{_labels_text(label_names, labels)} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
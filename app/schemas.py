@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from typing import List, Optional
+from dataclasses import dataclass
+from dataclasses import field as dc_field
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field, HttpUrl
 
@@ -54,6 +56,9 @@ class MovieMetadata(BaseModel):
     art: List[HttpUrl] = Field(
         default_factory=list, description="背景图 / 剧照 URL 列表"
     )
+    trailer: Optional[HttpUrl] = Field(
+        default=None, description="预告片 / 样品视频 URL，可选"
+    )
 
     source_url: Optional[HttpUrl] = Field(
         default=None, description="原始站点页面 URL，便于溯源"
@@ -74,8 +79,80 @@ class ScrapeResult(BaseModel):
     poster_path: Optional[str] = None
     fanart_path: Optional[str] = None
     extra_images: List[str] = Field(default_factory=list)
+    trailer_path: Optional[str] = None
 
     # 前端选择的封面 / 背景图源 URL，用于预览展示。
     chosen_poster_url: Optional[str] = None
     chosen_fanart_url: Optional[str] = None
 
+    # 因任务预算用尽或任务被取消而跳过 / 中断的阶段（poster / fanart / extrafanart 等）
+    cut_stages: List[str] = Field(default_factory=list)
+
+
+@dataclass(slots=True)
+class ActorRecord:
+    """Actor 的轻量内部表示（URL 以字符串保存，不做校验）。"""
+
+    name: str
+    role: Optional[str] = None
+    thumb: Optional[str] = None
+
+
+@dataclass(slots=True)
+class MovieRecord:
+    """MovieMetadata 的轻量内部表示，只用于离线路径（从 sidecar 重新生成 NFO、整库重命名）。
+
+    字段名与 MovieMetadata 保持一致，`build_movie_nfo` 等下游函数可直接使用。
+    不做任何校验，只应由本程序写出的 sidecar 等可信数据构造；刮削与 API 路径仍使用 MovieMetadata。
+    """
+
+    title: str
+    original_title: Optional[str] = None
+    number: Optional[str] = None
+    plot: Optional[str] = None
+    year: Optional[int] = None
+    premiered: Optional[str] = None
+    releasedate: Optional[str] = None
+    runtime: Optional[int] = None
+    genres: List[str] = dc_field(default_factory=list)
+    tags: List[str] = dc_field(default_factory=list)
+    actors: List[ActorRecord] = dc_field(default_factory=list)
+    studio: Optional[str] = None
+    label: Optional[str] = None
+    series: Optional[str] = None
+    directors: List[str] = dc_field(default_factory=list)
+    rating: Optional[float] = None
+    posters: List[str] = dc_field(default_factory=list)
+    art: List[str] = dc_field(default_factory=list)
+    trailer: Optional[str] = None
+    source_url: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MovieRecord":
+        """从可信的字典（例如 `MovieMetadata.model_dump(mode="json")` 的结果）快速构造。"""
+        get = data.get
+        return cls(
+            title=data["title"],
+            original_title=get("original_title"),
+            number=get("number"),
+            plot=get("plot"),
+            year=get("year"),
+            premiered=get("premiered"),
+            releasedate=get("releasedate"),
+            runtime=get("runtime"),
+            genres=list(get("genres") or ()),
+            tags=list(get("tags") or ()),
+            actors=[
+                ActorRecord(a["name"], a.get("role"), a.get("thumb"))
+                for a in get("actors") or ()
+            ],
+            studio=get("studio"),
+            label=get("label"),
+            series=get("series"),
+            directors=list(get("directors") or ()),
+            rating=get("rating"),
+            posters=list(get("posters") or ()),
+            art=list(get("art") or ()),
+            trailer=get("trailer"),
+            source_url=get("source_url"),
+        )
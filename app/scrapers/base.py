@@ -1,16 +1,27 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from typing import Protocol
 
 from app.config import Settings
 from app.schemas import MovieMetadata
 
 
+@dataclass
+class RawPage:
+    """已下载、尚未解析的页面，可在进程间传递（交给解析进程池）。"""
+
+    url: str
+    body: bytes
+    encoding: str = "utf-8"
+
+
 class BaseScraper(ABC):
     """站点刮削器抽象基类。
 
-    每个具体站点实现 `supports` 与 `scrape` 方法。
+    每个具体站点实现 `supports` 与 `scrape` 方法。下载与解析可以拆开的站点改为继承
+    `SplitScraper`，批量任务会把解析交给进程池执行。
     """
 
     name: str = "base"
@@ -24,6 +35,24 @@ class BaseScraper(ABC):
         """从 URL 抓取并解析影片信息，返回统一的 MovieMetadata。"""
 
 
+class SplitScraper(BaseScraper):
+    """下载与解析可以拆开的刮削器：`scrape` 即 `parse_page(fetch_page(...))`。
+
+    只有继承该类的站点才会在批量任务中把解析交给进程池。
+    """
+
+    @abstractmethod
+    def fetch_page(self, url: str, settings: Settings) -> RawPage:  # pragma: no cover
+        """只下载页面不解析。"""
+
+    @abstractmethod
+    def parse_page(self, page: RawPage) -> MovieMetadata:  # pragma: no cover
+        """解析 `fetch_page` 返回的页面（可能在另一个进程中执行，不应依赖网络或进程内状态）。"""
+
+    def scrape(self, url: str, settings: Settings) -> MovieMetadata:
+        return self.parse_page(self.fetch_page(url, settings))
+
+
 class ScraperFactory(Protocol):
     """用于 typing 的工厂协议，便于后续扩展。"""
 
@@ -1,26 +1,122 @@
 from __future__ import annotations
 
-import os
-from typing import List, Optional
+import codecs
+import re
+from importlib.util import find_spec
+from typing import Iterable, Iterator, List, Optional, Tuple
 from urllib.parse import urljoin, urlparse
 
-import httpx
 from selectolax.parser import HTMLParser
 
 from app.config import Settings
+from app.deadline import DeadlineExceeded, check_deadline, deadline_expired, stage_timeout
+from app.metrics import PAGE_BYTES_SAVED, record_upstream, time_stage
 from app.schemas import Actor, MovieMetadata
-from app.scrapers.base import BaseScraper
-
-try:  # 尝试使用 curl_cffi 来模拟浏览器指纹，绕过 Cloudflare
-    from curl_cffi import requests as curl_requests
+from app.scrapers.base import RawPage, SplitScraper
+from app.services.identity_pool import get_identity_pool
+from app.services.proxy_pool import get_http_client, get_proxy_pool
+from app.services.scheduler import get_scheduler
+
+_curl_requests = None
+_CURL_CFFI_CHECKED = False
+
+
+def _get_curl_requests():
+    """延迟导入 curl_cffi（导入开销较大），未安装时返回 None。"""
+    global _curl_requests, _CURL_CFFI_CHECKED
+    if not _CURL_CFFI_CHECKED:
+        _CURL_CFFI_CHECKED = True
+        try:  # 尝试使用 curl_cffi 来模拟浏览器指纹，绕过 Cloudflare
+            from curl_cffi import requests as curl_requests
+
+            _curl_requests = curl_requests
+        except Exception:  # pragma: no cover - 运行环境未安装 curl_cffi 时兜底
+            _curl_requests = None
+    return _curl_requests
+
+
+# 解析用到的字段全部位于 div.video-detail 起、div.preview-images 结束的区间内，
+# 之后的评论、磁链、页脚等内容无需下载，也无需交给解析器。
+_DETAIL_START = re.compile(rb'<div[^>]*class="[^"]*\bvideo-detail\b')
+_PREVIEW_START = re.compile(rb'<div[^>]*class="[^"]*\bpreview-images\b[^>]*>')
+_DIV_TAG = re.compile(rb"<(/?)div\b", re.IGNORECASE)
+_STREAM_CHUNK = 16 * 1024
+# 详情页请求的默认超时；设定了任务截止时间时取两者中的较小者。
+_FETCH_TIMEOUT = 20.0
+
+
+def _section_end(buf: bytes, preview_at: int) -> Optional[int]:
+    """返回从 preview_at 开始的 div.preview-images 闭合之后的位置，尚未完整到达时返回 None。"""
+    m = _PREVIEW_START.match(buf, preview_at)
+    if m is None:
+        return None
+    depth = 1
+    for tag in _DIV_TAG.finditer(buf, m.end()):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            close = buf.find(b">", tag.end())
+            return None if close < 0 else close + 1
+    return None
 
-    _HAS_CURL_CFFI = True
-except Exception:  # pragma: no cover - 运行环境未安装 curl_cffi 时兜底
-    curl_requests = None  # type: ignore[assignment]
-    _HAS_CURL_CFFI = False
 
+def read_detail_sections(chunks: Iterable[bytes]) -> Tuple[bytes, bool]:
+    """逐块读取详情页，读到 div.preview-images 结束即停止。
 
-class JavdbScraper(BaseScraper):
+    返回 (已读取内容, 是否提前结束)；页面中没有预览图区块时会读完整页。
+    """
+    buf = bytearray()
+    preview_at = -1
+    for chunk in chunks:
+        scan_from = max(0, len(buf) - 256)
+        buf += chunk
+        if preview_at < 0:
+            m = _PREVIEW_START.search(buf, scan_from)
+            if m is None:
+                continue
+            preview_at = m.start()
+        if _section_end(buf, preview_at) is not None:
+            return bytes(buf), True
+    return bytes(buf), False
+
+
+def detail_slice(html: bytes) -> bytes:
+    """截取解析所需的区间（div.video-detail 至 div.preview-images 结束），找不到标记时原样返回。"""
+    m = _PREVIEW_START.search(html)
+    end = (_section_end(html, m.start()) if m else None) or len(html)
+    start_m = _DETAIL_START.search(html, 0, end)
+    return html[start_m.start() if start_m else 0 : end]
+
+
+def _until_deadline(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """逐块读取，任务预算用尽或被取消时在下一个数据块处放弃。"""
+    for chunk in chunks:
+        check_deadline("fetch")
+        yield chunk
+
+
+def _charset(content_type: str) -> str:
+    m = re.search(r"charset=[\"']?([\w.-]+)", content_type, re.IGNORECASE)
+    if m:
+        try:
+            return codecs.lookup(m.group(1)).name
+        except LookupError:
+            pass
+    return "utf-8"
+
+
+def _accept_encoding(curl: bool) -> str:
+    """只声明客户端能解压的编码：curl-impersonate 自带 br / zstd，httpx 需要可选依赖。"""
+    if curl:
+        return "gzip, deflate, br, zstd"
+    encodings = ["gzip", "deflate"]
+    if find_spec("brotli") or find_spec("brotlicffi"):
+        encodings.append("br")
+    if find_spec("zstandard"):
+        encodings.append("zstd")
+    return ", ".join(encodings)
+
+
+class JavdbScraper(SplitScraper):
     """javdb 站点刮削实现。
 
     由于站点结构可能调整，这里采用相对宽松的 CSS 选择器，并在字段缺失时做容错。
@@ -33,7 +129,8 @@ class JavdbScraper(BaseScraper):
         host = parsed.netloc.lower()
         return "javdb" in host and parsed.path.startswith("/v/")
 
-    def scrape(self, url: str, settings: Settings) -> MovieMetadata:
+    def fetch_page(self, url: str, settings: Settings) -> RawPage:
+        """下载详情页并截取解析所需的区块（截取很快，且减少交给解析进程的数据量）。"""
         parsed = urlparse(url)
         # 如果用户用了主域名 javdb.com，尝试改成当前常见镜像域名，减少被墙/403 概率。
         host = parsed.netloc.lower()
@@ -41,46 +138,102 @@ class JavdbScraper(BaseScraper):
             url = parsed._replace(netloc="javdb565.com").geturl()
             parsed = urlparse(url)
 
+        pool = get_identity_pool(settings)
+        identity = pool.acquire()
         headers = {
-            "User-Agent": settings.user_agent,
+            "User-Agent": identity.user_agent,
             "Referer": f"{parsed.scheme}://{parsed.netloc}/",
             "Accept": (
                 "text/html,application/xhtml+xml,application/xml;q=0.9,"
                 "image/avif,image/webp,image/apng,*/*;q=0.8"
             ),
             "Accept-Language": "zh-CN,zh;q=0.7,en;q=0.5",
-            "Accept-Encoding": "gzip, deflate, br",
             "Connection": "keep-alive",
             "Upgrade-Insecure-Requests": "1",
         }
 
-        # 如果通过环境变量配置了 javdb Cookie，这里会原样带上。
-        if settings.javdb_cookie:
-            headers["Cookie"] = settings.javdb_cookie
-        # 代理通过环境变量传递，curl_cffi / httpx 都能识别。
-        if settings.http_proxy:
-            os.environ.setdefault("HTTP_PROXY", settings.http_proxy)
-            os.environ.setdefault("HTTPS_PROXY", settings.http_proxy)
-
+        # Cookie 来自身份池（未配置身份文件时即 NFOFETCH_JAVDB_COOKIE），这里会原样带上。
+        if identity.cookie:
+            headers["Cookie"] = identity.cookie
+        with time_stage("fetch", identity=identity.name):
+            try:
+                body, encoding = self._fetch_html(url, headers, settings)
+            except Exception as exc:
+                response = getattr(exc, "response", None)
+                pool.report(identity, getattr(response, "status_code", None))
+                raise
+        pool.report(identity, 200)
+        section = detail_slice(body)
+        PAGE_BYTES_SAVED.inc(len(body) - len(section), kind="parse")
+        return RawPage(url=url, body=section, encoding=encoding)
+
+    def parse_page(self, page: RawPage) -> MovieMetadata:
+        with time_stage("parse"):
+            tree = HTMLParser(page.body.decode(page.encoding, errors="replace"))
+            return self._parse_metadata(tree, base_url=page.url)
+
+    def _fetch_html(
+        self, url: str, headers: dict[str, str], settings: Settings
+    ) -> Tuple[bytes, str]:
+        """经代理池流式下载详情页，读到所需区块结束即断开，返回 (已读取内容, 字符编码)。
+
+        同时记录上游状态码、传输字节数，以及提前结束节省的字节数。
+        """
+        host = urlparse(url).netloc.lower()
+        try:
+            with get_scheduler(settings).slot("fetch"), get_proxy_pool(settings).lease() as proxy:
+                try:
+                    resp, body, early, wire, nbytes = self._stream_page(
+                        url, headers, proxy.url if proxy else None
+                    )
+                except Exception as exc:
+                    # 超时由任务预算缩短或任务已取消：不算作代理故障
+                    if deadline_expired() and not isinstance(exc, DeadlineExceeded):
+                        raise DeadlineExceeded("fetch") from None
+                    raise
+        except Exception:
+            record_upstream(host, "error")
+            raise
+        record_upstream(host, resp.status_code, nbytes, kind="page")
+        length = resp.headers.get("content-length", "")
+        if early and wire is not None and length.isdigit():
+            PAGE_BYTES_SAVED.inc(max(0, int(length) - wire), kind="download")
+        resp.raise_for_status()
+        return body, _charset(resp.headers.get("content-type", ""))
+
+    def _stream_page(
+        self, url: str, headers: dict[str, str], proxy_url: Optional[str]
+    ) -> tuple:
+        """发出请求并流式读取，返回 (响应, 内容, 是否提前结束, 传输字节数, 下载字节数)。"""
+        curl_requests = _get_curl_requests()
         # 优先使用 curl_cffi 模拟浏览器指纹，减少 Cloudflare 403 可能性。
-        if _HAS_CURL_CFFI:
-            resp = curl_requests.get(  # type: ignore[union-attr]
+        if curl_requests is not None:
+            headers = {**headers, "Accept-Encoding": _accept_encoding(curl=True)}
+            resp = curl_requests.get(
                 url,
                 headers=headers,
                 impersonate="chrome",
-                timeout=20.0,
+                timeout=stage_timeout(_FETCH_TIMEOUT, "fetch"),
+                stream=True,
+                proxy=proxy_url,
             )
-            resp.raise_for_status()
-            html = resp.text
-        else:
-            with httpx.Client(headers=headers, timeout=20.0) as client:
-                resp = client.get(url)
-                resp.raise_for_status()
-                html = resp.text
-        tree = HTMLParser(html)
-        metadata = self._parse_metadata(tree, base_url=url)
-        metadata.source_url = url  # type: ignore[assignment]
-        return metadata
+            try:
+                body, early = read_detail_sections(
+                    _until_deadline(resp.iter_content(chunk_size=_STREAM_CHUNK))
+                )
+            finally:
+                resp.close()
+            # curl 不提供已传输的压缩字节数，压缩响应只能按解压后的大小近似
+            wire = None if resp.headers.get("content-encoding") else len(body)
+            return resp, body, early, wire, len(body)
+
+        headers = {**headers, "Accept-Encoding": _accept_encoding(curl=False)}
+        client = get_http_client(proxy_url)
+        timeout = stage_timeout(_FETCH_TIMEOUT, "fetch")
+        with client.stream("GET", url, headers=headers, timeout=timeout) as resp:
+            body, early = read_detail_sections(_until_deadline(resp.iter_bytes(_STREAM_CHUNK)))
+            wire = resp.num_bytes_downloaded
+        return resp, body, early, wire, wire
 
     def _parse_metadata(self, tree: HTMLParser, base_url: str) -> MovieMetadata:
         number = self._parse_number(tree)
@@ -97,6 +250,7 @@ class JavdbScraper(BaseScraper):
         studio, label, series = self._parse_companies(tree)
         directors, rating = self._parse_directors_and_rating(tree)
         posters, art = self._parse_images(tree, base_url)
+        trailer = self._parse_trailer(tree, base_url)
 
         return MovieMetadata(
             title=title,
@@ -117,6 +271,8 @@ class JavdbScraper(BaseScraper):
             rating=rating,
             posters=posters,
             art=art,
+            trailer=trailer,
+            source_url=base_url,
         )
 
     # ---- 字段解析辅助方法 ----
@@ -412,6 +568,18 @@ class JavdbScraper(BaseScraper):
 
         return posters, art
 
+    def _parse_trailer(self, tree: HTMLParser, base_url: str) -> Optional[str]:
+        # 预告片位于预览图区块内：
+        # <div class="tile-images preview-images">
+        #   <a class="preview-video-container" href="#preview-video">...</a>
+        #   <video id="preview-video"><source src="//.../xxx.mp4" type="video/mp4"></video>
+        for sel in ("video#preview-video source", "video#preview-video"):
+            for node in tree.css(sel):
+                url = self._get_img_url(node, base_url)
+                if url and not url.startswith(("blob:", "data:")):
+                    return url
+        return None
+
     # ---- 通用辅助 ----
 
     def _get_img_url(self, node, base_url: str) -> Optional[str]:
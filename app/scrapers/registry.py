@@ -1,24 +1,90 @@
 from __future__ import annotations
 
-from typing import List
+import importlib
+import re
+from typing import Dict, Optional
+from urllib.parse import urlparse
 
 from app.scrapers.base import BaseScraper
-from app.scrapers.javdb import JavdbScraper
 
+# 第三方插件可通过该 entry point 组注册 scraper，name 为站点键，value 为 `模块:类名`，例如：
+# [project.entry-points."nfofetch.scrapers"]
+# javlib = "nfofetch_javlib:JavlibScraper"
+ENTRY_POINT_GROUP = "nfofetch.scrapers"
 
-SCRAPERS: List[BaseScraper] = [
-    JavdbScraper(),
-]
+# 站点键 -> `模块:类名`。模块只在第一次匹配到该站点时才导入，避免启动时加载
+# curl_cffi / selectolax 等重量级依赖。
+SCRAPER_TARGETS: Dict[str, str] = {
+    "javdb": "app.scrapers.javdb:JavdbScraper",
+}
+
+# 已实例化的 scraper 缓存，站点键 -> 实例。
+_INSTANCES: Dict[str, BaseScraper] = {}
+_ENTRY_POINTS_LOADED = False
+
+_TRAILING_DIGITS = re.compile(r"\d+$")
 
 
 class NoSupportedScraperError(RuntimeError):
     """没有找到能够处理给定 URL 的 scraper。"""
 
 
+def host_key(url: str) -> str:
+    """从 URL 中提取站点键：取主域名并去掉镜像编号，例如 javdb565.com -> javdb。"""
+    host = (urlparse(url).hostname or "").lower()
+    labels = [p for p in host.split(".") if p]
+    if not labels:
+        return ""
+    name = labels[-2] if len(labels) >= 2 else labels[0]
+    return _TRAILING_DIGITS.sub("", name) or name
+
+
+def register_scraper(key: str, target: str | BaseScraper) -> None:
+    """注册站点 scraper：target 可以是 `模块:类名`（延迟导入）或已创建的实例。"""
+    if isinstance(target, BaseScraper):
+        _INSTANCES[key] = target
+    else:
+        _INSTANCES.pop(key, None)
+        SCRAPER_TARGETS[key] = target
+
+
+def _load_entry_points() -> None:
+    global _ENTRY_POINTS_LOADED
+    if _ENTRY_POINTS_LOADED:
+        return
+    _ENTRY_POINTS_LOADED = True
+
+    from importlib.metadata import entry_points
+
+    for ep in entry_points(group=ENTRY_POINT_GROUP):
+        SCRAPER_TARGETS.setdefault(ep.name, ep.value)
+
+
+def _instantiate(key: str) -> Optional[BaseScraper]:
+    scraper = _INSTANCES.get(key)
+    if scraper is not None:
+        return scraper
+    target = SCRAPER_TARGETS.get(key)
+    if target is None:
+        return None
+    module_name, _, attr = target.partition(":")
+    cls = getattr(importlib.import_module(module_name), attr)
+    scraper = cls()
+    _INSTANCES[key] = scraper
+    return scraper
+
+
 def get_scraper(url: str) -> BaseScraper:
-    """根据 URL 选择合适的站点 scraper。"""
-    for scraper in SCRAPERS:
-        if scraper.supports(url):
-            return scraper
-    raise NoSupportedScraperError(f"暂不支持该 URL: {url}")
+    """根据 URL 选择合适的站点 scraper。
 
+    按站点键做 O(1) 查找，内置映射未命中时才扫描 entry points；
+    找到后仍由 scraper 的 `supports` 做最终确认（例如路径是否为详情页）。
+    """
+    key = host_key(url)
+    scraper = _instantiate(key)
+    if scraper is None:
+        _load_entry_points()
+        scraper = _instantiate(key)
+    if scraper is not None and scraper.supports(url):
+        return scraper
+    raise NoSupportedScraperError(f"暂不支持该 URL: {url}")
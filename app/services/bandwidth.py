@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from app.config import Settings, parse_hours, parse_rate
+from app.deadline import check_deadline
+from app.metrics import BANDWIDTH_LIMIT, BANDWIDTH_WAIT_SECONDS
+from app.services.scheduler import PREVIEW, current_priority
+
+logger = logging.getLogger(__name__)
+
+# 运行中调整的限速保存在缓存目录下的该文件中，同一台机器上的各进程（多个 uvicorn worker、
+# 命令行 worker）共享，修改后自动生效。
+LIVE_FILE_NAME = "bandwidth.json"
+# 检查限速文件与昼夜时段是否变化的最小间隔。
+RELOAD_CHECK_SECONDS = 1.0
+# 允许的突发量：1 秒的流量，但不小于该值（避免低限速下单个数据块就要等待）。
+MIN_BURST_BYTES = 256 * 1024
+# 等待令牌期间检查任务预算 / 取消状态的间隔。
+_WAIT_SLICE = 0.25
+
+
+def _in_hours(hour: int, hours: Tuple[int, int]) -> bool:
+    start, end = hours
+    if start == end:
+        return False
+    if start < end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def format_rate(rate: int) -> str:
+    """把字节/秒格式化为便于阅读的文本，0 为“不限速”。"""
+    if not rate:
+        return "不限速"
+    for unit, size in (("GiB", 1024**3), ("MiB", 1024**2), ("KiB", 1024)):
+        if rate >= size:
+            return f"{rate / size:g} {unit}/s"
+    return f"{rate} B/s"
+
+
+class BandwidthShaper:
+    """进程级的下载限速器（令牌桶），图片、预告片等资源下载共享同一预算。
+
+    白天与夜间（night_hours 时段）各有一个速率，0 表示不限速。实现上按 GCRA 为每个数据块
+    预约发送时间：各线程按到达顺序排队、各自只睡眠自己的等待时间，不会因为别的线程持续
+    下载而饿死；空闲后最多积累 1 秒（至少 MIN_BURST_BYTES）的突发额度。
+    速率可在运行中通过 update() 调整，调整写入限速文件，本机其它进程随后自动采用。
+    """
+
+    def __init__(self, settings: Settings, live_path: Optional[Path] = None) -> None:
+        self.defaults: Dict[str, Any] = {
+            "day": settings.bandwidth_day,
+            "night": settings.bandwidth_night,
+            "night_hours": settings.night_hours,
+        }
+        self.live_path = live_path
+        self.config: Dict[str, Any] = dict(self.defaults)
+        self.live = False
+        self._lock = threading.Lock()
+        self._rate = 0
+        # 理论上下一个数据块可以发送的时间（monotonic）
+        self._tat = 0.0
+        self._checked = float("-inf")
+        self._mtime: Optional[float] = None
+        with self._lock:
+            self._refresh_locked(time.monotonic(), force=True)
+
+    # ---- 配置 ----
+
+    def _load_live_locked(self) -> None:
+        if self.live_path is None:
+            return
+        try:
+            mtime = os.stat(self.live_path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        config = dict(self.defaults)
+        live = False
+        if mtime is not None:
+            try:
+                data = json.loads(self.live_path.read_text(encoding="utf-8"))
+                if "day" in data:
+                    config["day"] = max(0, int(data["day"]))
+                if "night" in data:
+                    config["night"] = max(0, int(data["night"]))
+                if "night_hours" in data:
+                    config["night_hours"] = parse_hours(str(data["night_hours"]))
+                live = True
+            except (OSError, ValueError, TypeError) as exc:
+                logger.warning("读取限速文件 %s 失败：%s", self.live_path, exc)
+        self.config, self.live = config, live
+
+    def _refresh_locked(self, now: float, force: bool = False) -> None:
+        if not force and now - self._checked < RELOAD_CHECK_SECONDS:
+            return
+        self._checked = now
+        self._load_live_locked()
+        night = _in_hours(datetime.now().hour, self.config["night_hours"])
+        rate = self.config["night" if night else "day"]
+        if rate != self._rate:
+            # 速率变化后重新开始计算，旧速率下排好的预约不再拖累后续数据块
+            self._rate = rate
+            self._tat = 0.0
+            BANDWIDTH_LIMIT.set(rate)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh_locked(time.monotonic(), force=True)
+            night = _in_hours(datetime.now().hour, self.config["night_hours"])
+            start, end = self.config["night_hours"]
+            return {
+                "day": self.config["day"],
+                "night": self.config["night"],
+                "night_hours": f"{start}-{end}",
+                "period": "night" if night else "day",
+                "current": self._rate,
+                "current_text": format_rate(self._rate),
+                "source": "live" if self.live else "env",
+            }
+
+    def update(
+        self,
+        *,
+        day: Optional[str] = None,
+        night: Optional[str] = None,
+        night_hours: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """运行中调整限速（未给出的项保持不变），写入限速文件后立即生效。参数无效时抛出 ValueError。"""
+        with self._lock:
+            # 先读入其它进程可能刚写入的调整，未给出的项以它为准
+            self._refresh_locked(time.monotonic(), force=True)
+            config = dict(self.config)
+            if day is not None:
+                config["day"] = parse_rate(day)
+            if night is not None:
+                config["night"] = parse_rate(night)
+            if night_hours is not None:
+                config["night_hours"] = parse_hours(night_hours)
+            if self.live_path is None:
+                self.config, self.live = config, True
+            else:
+                start, end = config["night_hours"]
+                data = {"day": config["day"], "night": config["night"], "night_hours": f"{start}-{end}"}
+                self.live_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.live_path.with_name(self.live_path.name + ".tmp")
+                tmp.write_text(json.dumps(data), encoding="utf-8")
+                os.replace(tmp, self.live_path)
+                self._mtime = None
+        return self.status()
+
+    def reset(self) -> Dict[str, Any]:
+        """删除运行中的调整，恢复环境变量中的限速。"""
+        with self._lock:
+            if self.live_path is not None:
+                self.live_path.unlink(missing_ok=True)
+            self._mtime = None
+            self.config, self.live = dict(self.defaults), False
+        return self.status()
+
+    # ---- 限速 ----
+
+    @property
+    def rate(self) -> int:
+        """当前生效的速率（字节/秒），0 表示不限速。"""
+        with self._lock:
+            self._refresh_locked(time.monotonic())
+            return self._rate
+
+    def consume(
+        self, nbytes: int, kind: str = "download", cancel: Optional[threading.Event] = None
+    ) -> None:
+        """为 nbytes 字节预约发送时间，超出速率时阻塞；等待期间预算用尽会抛出 DeadlineExceeded。
+
+        cancel 被设置时提前结束等待（已预约的额度由调用方通过 refund 退回）。
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._refresh_locked(now)
+            rate = self._rate
+            if not rate:
+                return
+            burst = max(MIN_BURST_BYTES, rate) / rate
+            self._tat = max(self._tat, now) + nbytes / rate
+            wait = self._tat - now - burst
+        if wait <= 0:
+            return
+        until = now + wait
+        try:
+            while True:
+                remaining = until - time.monotonic()
+                if remaining <= 0 or (cancel is not None and cancel.is_set()):
+                    return
+                check_deadline(kind)
+                time.sleep(min(remaining, _WAIT_SLICE))
+        finally:
+            BANDWIDTH_WAIT_SECONDS.inc(time.monotonic() - now, kind=kind)
+
+    def refund(self, nbytes: int) -> None:
+        """退回预约了但没有用到的额度（例如实际下载量小于预估）。"""
+        if nbytes <= 0:
+            return
+        with self._lock:
+            if self._rate:
+                self._tat = max(time.monotonic(), self._tat - nbytes / self._rate)
+
+
+class Prepaid:
+    """预先支付的下载额度。
+
+    在申请调度器名额、租用代理之前调用 prepay() 等待限速，名额内的下载在额度用完前不再
+    因限速睡眠，不会占着上游名额和代理空等；超出额度的部分照常限速，没用完的额度在
+    close() 时退回。
+    """
+
+    def __init__(self, shaper: Optional[BandwidthShaper], kind: str, nbytes: int) -> None:
+        self.shaper = shaper
+        self.kind = kind
+        self.left = nbytes if shaper is not None else 0
+
+    def throttle(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """逐块放行下载内容：额度内的部分直接放行，超出的部分按限速等待。"""
+        for chunk in chunks:
+            over = len(chunk) - self.left
+            self.left = max(0, self.left - len(chunk))
+            if over > 0 and self.shaper is not None:
+                self.shaper.consume(over, self.kind)
+            yield chunk
+
+    def close(self) -> None:
+        if self.shaper is not None:
+            self.shaper.refund(self.left)
+            self.left = 0
+
+    def __enter__(self) -> "Prepaid":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def current_rate(settings: Settings) -> int:
+    """当前请求的下载适用的速率（字节/秒）；交互式预览或未设置限速时为 0。"""
+    if current_priority()[0] == PREVIEW:
+        return 0
+    return get_shaper(settings).rate
+
+
+def is_limited(settings: Settings) -> bool:
+    """当前请求的下载是否受限速约束（已设置限速，且不是交互式预览）。"""
+    return current_rate(settings) > 0
+
+
+def prepay(
+    settings: Settings, kind: str, nbytes: int, cancel: Optional[threading.Event] = None
+) -> Prepaid:
+    """按预估的下载量预先等待限速（应在申请调度器名额之前调用）；不受限速时立即返回。"""
+    if not is_limited(settings):
+        return Prepaid(None, kind, 0)
+    shaper = get_shaper(settings)
+    nbytes = max(0, nbytes)
+    prepaid = Prepaid(shaper, kind, nbytes)
+    try:
+        shaper.consume(nbytes, kind, cancel)
+    except BaseException:
+        prepaid.close()
+        raise
+    return prepaid
+
+
+_shapers: Dict[Tuple[Any, ...], BandwidthShaper] = {}
+_lock = threading.Lock()
+
+
+def get_shaper(settings: Settings) -> BandwidthShaper:
+    """进程内共享的限速器；运行中的调整保存在 cache_dir 下的限速文件中。"""
+    live_path = Path(settings.cache_dir).expanduser() / LIVE_FILE_NAME
+    key = (settings.bandwidth_day, settings.bandwidth_night, settings.night_hours, str(live_path))
+    with _lock:
+        shaper = _shapers.get(key)
+        if shaper is None:
+            shaper = _shapers[key] = BandwidthShaper(settings, live_path)
+        return shaper
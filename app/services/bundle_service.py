@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import math
+import time
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from app.config import Settings
+from app.schemas import MovieMetadata
+from app.services.image_cache import cached_original, store_original
+from app.services.metadata_cache import cache_key, get_metadata_cache
+from app.services.regenerate_service import iter_sidecars
+
+logger = logging.getLogger(__name__)
+
+# 缓存包格式版本，不兼容的修改时递增。
+BUNDLE_FORMAT = 1
+_MANIFEST = "manifest.json"
+_METADATA = "metadata.jsonl"
+_IMAGES = "images.jsonl"
+# 导入时允许的时钟偏差（秒）：缓存包来自其它机器，fetched 略晚于本机时间仍视为有效。
+_CLOCK_SKEW = 300.0
+
+
+@dataclass
+class BundleStats:
+    records: int = 0
+    skipped: int = 0
+    images: int = 0
+
+
+def _normalize_number(number: Optional[str]) -> str:
+    return (number or "").strip().upper()
+
+
+def _library_entries(root: Path) -> Iterable[Dict[str, Any]]:
+    """从媒体库中各影片目录的元数据 sidecar 生成缓存记录（以 sidecar 修改时间作为刮削时间）。"""
+    for sidecar in iter_sidecars(root):
+        try:
+            data = json.loads(sidecar.read_bytes())
+            url = data.get("source_url")
+            if not url:
+                continue
+            yield {
+                "key": cache_key(url),
+                "url": url,
+                "fetched": sidecar.stat().st_mtime,
+                "metadata": data,
+            }
+        except (OSError, ValueError):
+            continue
+
+
+def export_bundle(
+    out_path: Path,
+    settings: Settings,
+    *,
+    numbers: Optional[Iterable[str]] = None,
+    include_images: bool = False,
+    library_root: Optional[Path] = None,
+) -> BundleStats:
+    """把本地缓存（及可选的媒体库 sidecar）中的刮削结果打包为 zip 缓存包。
+
+    包内 metadata.jsonl 每行一条记录；include_images 时附带图片缓存中已有的封面 / 剧照原图，
+    images.jsonl 记录 URL 与包内文件名的对应关系。numbers 为空时导出全部。
+    """
+    wanted = {_normalize_number(n) for n in numbers} if numbers else None
+
+    entries: Dict[str, Dict[str, Any]] = {}
+    sources = [get_metadata_cache(settings).iter_entries()]
+    if library_root is not None:
+        sources.append(_library_entries(library_root))
+    for source in sources:
+        for entry in source:
+            if wanted is not None and _normalize_number(entry["metadata"].get("number")) not in wanted:
+                continue
+            current = entries.get(entry["key"])
+            if current is None or entry.get("fetched", 0) > current.get("fetched", 0):
+                entries[entry["key"]] = entry
+
+    stats = BundleStats()
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(
+            _METADATA,
+            "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries.values()),
+        )
+        stats.records = len(entries)
+
+        image_lines = []
+        if include_images:
+            seen = set()
+            for entry in entries.values():
+                meta = entry["metadata"]
+                for url in list(meta.get("posters") or []) + list(meta.get("art") or []):
+                    if url in seen:
+                        continue
+                    seen.add(url)
+                    path = cached_original(url, settings)
+                    if path is None:
+                        continue
+                    blob = "images/" + hashlib.sha256(url.encode("utf-8")).hexdigest()
+                    # 图片本身已是压缩格式，不再压缩
+                    zf.write(path, blob, compress_type=zipfile.ZIP_STORED)
+                    image_lines.append(json.dumps({"url": url, "blob": blob}) + "\n")
+            zf.writestr(_IMAGES, "".join(image_lines))
+        stats.images = len(image_lines)
+
+        zf.writestr(
+            _MANIFEST,
+            json.dumps(
+                {
+                    "format": BUNDLE_FORMAT,
+                    "created": time.time(),
+                    "records": stats.records,
+                    "images": stats.images,
+                }
+            ),
+        )
+    tmp.replace(out_path)
+    return stats
+
+
+def _checked_entry(entry: Any) -> Dict[str, Any]:
+    """校验缓存包中的一条刮削记录并补上缓存键；无效时抛出 ValueError / TypeError / KeyError。"""
+    if not isinstance(entry, dict):
+        raise TypeError("记录不是 JSON 对象")
+    url, fetched = entry["url"], entry["fetched"]
+    if not isinstance(url, str):
+        raise TypeError(f"url 不是字符串：{url!r}")
+    if isinstance(fetched, bool) or not isinstance(fetched, (int, float)) or not math.isfinite(fetched):
+        raise TypeError(f"fetched 不是有效的时间戳：{fetched!r}")
+    if fetched > time.time() + _CLOCK_SKEW:
+        # 未来的时间戳会让这条记录永不过期、也不会被更新的记录替换
+        raise ValueError(f"fetched 晚于当前时间：{fetched!r}")
+    MovieMetadata.model_validate(entry["metadata"])
+    entry["key"] = cache_key(url)
+    return entry
+
+
+def import_bundle(path: Path, settings: Settings, *, overwrite: bool = False) -> BundleStats:
+    """导入缓存包：刮削结果写入本地元数据缓存，图片写入图片缓存。
+
+    默认只在本地没有该影片或本地记录更旧时写入；overwrite=True 时总是覆盖。
+    """
+    stats = BundleStats()
+    cache = get_metadata_cache(settings)
+    with zipfile.ZipFile(path) as zf:
+        manifest = json.loads(zf.read(_MANIFEST))
+        if manifest.get("format") != BUNDLE_FORMAT:
+            raise ValueError(f"不支持的缓存包格式：{manifest.get('format')}")
+
+        with zf.open(_METADATA) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                # 校验后再写入，避免损坏的记录进入缓存；单条记录无效时跳过，不中断整个导入
+                try:
+                    entry = _checked_entry(json.loads(line))
+                except (ValueError, KeyError, TypeError, AttributeError) as exc:
+                    logger.warning("跳过缓存包中无效的记录：%s", exc)
+                    stats.skipped += 1
+                    continue
+                if cache.put_entry(entry, overwrite=overwrite):
+                    stats.records += 1
+                else:
+                    stats.skipped += 1
+
+        if _IMAGES in zf.namelist():
+            with zf.open(_IMAGES) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        item = json.loads(line)
+                        url, blob_name = item["url"], item["blob"]
+                        if not isinstance(url, str) or not isinstance(blob_name, str):
+                            raise TypeError("url / blob 必须是字符串")
+                    except (ValueError, KeyError, TypeError, AttributeError) as exc:
+                        logger.warning("跳过缓存包中无效的图片记录：%s", exc)
+                        continue
+                    if not overwrite and cached_original(url, settings) is not None:
+                        continue
+                    try:
+                        with zf.open(blob_name) as blob:
+                            if store_original(url, blob, settings):
+                                stats.images += 1
+                    except KeyError:
+                        logger.warning("缓存包中缺少图片 %s", blob_name)
+    return stats
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.config import Settings
+from app.services.file_service import is_video_file
+from app.services.nfo_service import METADATA_SIDECAR_NAME
+
+logger = logging.getLogger(__name__)
+
+# 每个采样块的大小；采样位置为文件头、1/4、中间、3/4 与文件尾。
+SAMPLE_BYTES = 64 * 1024
+_SAMPLE_POINTS = (0.0, 0.25, 0.5, 0.75, 1.0)
+# 小于该大小的视频直接完整计算哈希。
+_FULL_HASH_BELOW = SAMPLE_BYTES * len(_SAMPLE_POINTS) * 2
+
+
+def fingerprint(path: Path, size: int) -> str:
+    """根据文件大小与若干位置的采样块计算指纹，只读取约 320 KiB，不读取整个文件。"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(size.to_bytes(8, "little"))
+    if size == 0:
+        return h.hexdigest()
+    with path.open("rb") as f:
+        if size < _FULL_HASH_BELOW:
+            h.update(f.read())
+            return h.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for point in _SAMPLE_POINTS:
+                offset = min(int(size * point), size - SAMPLE_BYTES)
+                h.update(mm[offset : offset + SAMPLE_BYTES])
+    return h.hexdigest()
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    inode TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    fp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fingerprints_fp ON fingerprints (fp);
+"""
+
+_UPSERT = "INSERT OR REPLACE INTO fingerprints (inode, path, size, mtime_ns, fp) VALUES (?, ?, ?, ?, ?)"
+
+
+class FingerprintCache:
+    """指纹缓存（SQLite），键为 (设备号, inode)，文件大小或修改时间不变时直接复用指纹。
+
+    同时记录最近一次见到的路径，便于按指纹反查已刮削过的同一视频。每次只读写涉及的记录，
+    多个进程（批量运行的 CLI）可以同时使用；新记录先留在内存中，save() 时一次写入。
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 扫描时由多个线程计算指纹，连接的访问由 _lock 串行化
+        self._conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._pending: Dict[str, tuple] = {}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "FingerprintCache":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    @staticmethod
+    def _key(st: os.stat_result) -> str:
+        return f"{st.st_dev}:{st.st_ino}"
+
+    def get(self, path: Path, st: os.stat_result) -> str:
+        key = self._key(st)
+        with self._lock:
+            row = self._pending.get(key) or self._conn.execute(
+                "SELECT inode, path, size, mtime_ns, fp FROM fingerprints WHERE inode = ?", (key,)
+            ).fetchone()
+            if row and row[2] == st.st_size and row[3] == st.st_mtime_ns:
+                if row[1] != str(path):
+                    self._pending[key] = (key, str(path), row[2], row[3], row[4])
+                return str(row[4])
+        fp = fingerprint(path, st.st_size)
+        with self._lock:
+            self._pending[key] = (key, str(path), st.st_size, st.st_mtime_ns, fp)
+        return fp
+
+    def paths_with(self, fp: str) -> List[Path]:
+        self.save()
+        with self._lock:
+            rows = self._conn.execute("SELECT path FROM fingerprints WHERE fp = ?", (fp,))
+            return [Path(r[0]) for r in rows]
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._pending:
+                return
+            with self._conn:
+                self._conn.executemany(_UPSERT, list(self._pending.values()))
+            self._pending.clear()
+
+
+def get_fingerprint_cache(settings: Settings) -> FingerprintCache:
+    return FingerprintCache(Path(settings.cache_dir).expanduser() / "fingerprints.sqlite")
+
+
+@dataclass
+class DuplicateGroup:
+    """内容相同的一组视频；primary 为保留刮削的那一个（已刮削过的优先）。"""
+
+    fingerprint: str
+    size: int
+    paths: List[Path] = field(default_factory=list)
+
+    @property
+    def primary(self) -> Path:
+        scraped = [p for p in self.paths if _is_scraped(p)]
+        return min(scraped or self.paths, key=lambda p: (len(str(p)), str(p)))
+
+    @property
+    def duplicates(self) -> List[Path]:
+        primary = self.primary
+        return [p for p in self.paths if p != primary]
+
+
+def _is_scraped(video: Path) -> bool:
+    return (video.parent / METADATA_SIDECAR_NAME).is_file()
+
+
+def _iter_videos(root: Path) -> Iterator[Tuple[Path, os.stat_result]]:
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    elif (
+                        entry.is_file(follow_symlinks=False)
+                        and is_video_file(entry.name)
+                    ):
+                        yield Path(entry.path), entry.stat()
+        except OSError:
+            continue
+
+
+def scan_duplicates(
+    root: Path, settings: Settings, *, workers: int = 8
+) -> List[DuplicateGroup]:
+    """扫描 root 下的视频，返回内容重复的分组。
+
+    先按文件大小分组，只有大小相同的文件才需要计算指纹；同一 inode（硬链接）视为同一文件。
+    """
+    by_size: Dict[int, Dict[str, Tuple[Path, os.stat_result]]] = {}
+    for path, st in _iter_videos(root):
+        by_size.setdefault(st.st_size, {}).setdefault(f"{st.st_dev}:{st.st_ino}", (path, st))
+
+    candidates = [item for files in by_size.values() if len(files) > 1 for item in files.values()]
+    with get_fingerprint_cache(settings) as cache:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            fps = list(pool.map(lambda item: cache.get(*item), candidates))
+        cache.save()
+
+    groups: Dict[str, DuplicateGroup] = {}
+    for (path, st), fp in zip(candidates, fps):
+        group = groups.setdefault(fp, DuplicateGroup(fingerprint=fp, size=st.st_size))
+        group.paths.append(path)
+    return sorted(
+        (g for g in groups.values() if len(g.paths) > 1), key=lambda g: str(g.primary)
+    )
+
+
+def find_scraped_duplicate(video: Path, settings: Settings) -> Optional[Path]:
+    """若缓存中记录的另一份相同视频已经刮削过，返回它的路径。
+
+    指纹缓存不可用（例如被其它进程长时间锁住）时只记录警告并返回 None，不影响刮削。
+    """
+    try:
+        with get_fingerprint_cache(settings) as cache:
+            fp = cache.get(video, video.stat())
+            others = cache.paths_with(fp)
+    except (OSError, sqlite3.Error) as exc:
+        logger.warning("读取指纹缓存失败，不检查重复：%s", exc)
+        return None
+    for other in others:
+        try:
+            if other.samefile(video):
+                continue
+        except OSError:
+            continue
+        if _is_scraped(other):
+            return other
+    return None
+
+
+def remember_video(video: Path, settings: Settings) -> None:
+    """刮削完成后记录视频指纹，之后遇到相同内容的视频即可跳过。"""
+    try:
+        with get_fingerprint_cache(settings) as cache:
+            cache.get(video, video.stat())
+            cache.save()
+    except (OSError, sqlite3.Error) as exc:
+        logger.warning("写入指纹缓存失败：%s", exc)
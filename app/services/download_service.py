@@ -0,0 +1,466 @@
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Deque, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from app.config import Settings
+from app.deadline import DeadlineExceeded, current_deadline, deadline_expired, stage_timeout
+from app.metrics import DOWNLOADED_BYTES, IMAGE_HEDGES, UPSTREAM_RESPONSES, time_stage
+from app.services.bandwidth import Prepaid, is_limited, prepay
+from app.services.proxy_pool import get_http_client, get_proxy_pool
+from app.services.scheduler import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+# 单次图片请求的默认超时；设定了任务截止时间时取两者中的较小者。
+IMAGE_TIMEOUT = 20.0
+# 单张图片最多尝试次数；失败后保留已下载部分，下一次用 Range 续传。
+IMAGE_DOWNLOAD_ATTEMPTS = 3
+# 单张图片大小上限，超过即视为异常响应。
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+# 下载中的临时文件后缀，完成并校验通过后原子地重命名为目标文件。
+PARTIAL_SUFFIX = ".part"
+
+# 对冲请求：首个请求超过延迟仍未完成时，经另一代理 / 连接再发一个相同请求，取先完成者。
+# 自动延迟取最近 HEDGE_WINDOW 次成功下载耗时的 p90，样本不足时使用默认值。
+HEDGE_DEFAULT_DELAY = 2.0
+HEDGE_MIN_DELAY = 0.2
+HEDGE_WINDOW = 200
+_HEDGE_MIN_SAMPLES = 20
+# 对冲预算最多累积的令牌数，即突发时最多连续发出的对冲请求数。
+HEDGE_BURST = 10.0
+# 限速时申请上游名额前预先等待的图片大小：最近若干张图片的平均大小，没有样本时用默认值。
+IMAGE_SIZE_DEFAULT = 256 * 1024
+IMAGE_SIZE_WINDOW = 50
+
+# 常见图片格式的文件头
+_IMAGE_MAGIC = (
+    b"\xff\xd8\xff",  # JPEG
+    b"\x89PNG\r\n\x1a\n",  # PNG
+    b"GIF87a",
+    b"GIF89a",
+    b"BM",  # BMP
+)
+
+
+class ImageDownloadError(RuntimeError):
+    """图片下载失败。retryable 为 False 时重试也无意义（例如返回的不是图片）。"""
+
+    def __init__(self, message: str, *, retryable: bool = True) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def looks_like_image(head: bytes) -> bool:
+    """根据文件头判断内容是否为图片。"""
+    if head.startswith(_IMAGE_MAGIC):
+        return True
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return True
+    # AVIF / HEIF 等 ISO BMFF 容器
+    return head[4:8] == b"ftyp"
+
+
+def _check_content_type(content_type: str) -> None:
+    ctype = content_type.split(";", 1)[0].strip().lower()
+    if ctype and not (ctype.startswith("image/") or ctype == "application/octet-stream"):
+        raise ImageDownloadError(f"响应不是图片：{ctype}", retryable=False)
+
+
+class _LatencyWindow:
+    """最近若干次成功下载的耗时，用于估计自动对冲延迟。"""
+
+    def __init__(self, size: int) -> None:
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p90(self) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < _HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[int(len(ordered) * 0.9) - 1]
+
+
+class _HedgeBudget:
+    """全局对冲预算：每个图片请求存入 ratio 个令牌，每发出一个对冲请求消耗 1 个，
+    保证对冲请求数不超过图片请求数的 ratio 倍。"""
+
+    def __init__(self) -> None:
+        self._tokens = 1.0
+        self._lock = threading.Lock()
+
+    def deposit(self, ratio: float) -> None:
+        with self._lock:
+            self._tokens = min(HEDGE_BURST, self._tokens + ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+class _SizeWindow:
+    """最近若干张图片的大小，用于估计限速时需要预先等待的字节数。"""
+
+    def __init__(self, size: int) -> None:
+        self._samples: Deque[int] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, nbytes: int) -> None:
+        with self._lock:
+            self._samples.append(nbytes)
+
+    def mean(self) -> int:
+        with self._lock:
+            if not self._samples:
+                return IMAGE_SIZE_DEFAULT
+            return sum(self._samples) // len(self._samples)
+
+
+_LATENCY = _LatencyWindow(HEDGE_WINDOW)
+_BUDGET = _HedgeBudget()
+_SIZES = _SizeWindow(IMAGE_SIZE_WINDOW)
+
+
+def _abort_response(resp: Any) -> None:
+    """从另一个线程中止进行中的响应：关闭底层连接的 socket，阻塞在读取上的线程立即出错返回。"""
+    stream = resp.extensions.get("network_stream")
+    sock = stream.get_extra_info("socket") if stream is not None else None
+    if sock is None:
+        resp.close()
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class _Race:
+    """同一张图片的首个请求与对冲请求。
+
+    先完成者胜出后调用 cancel()：立即归还落败请求占用的调度器名额与代理，并中止它进行中的
+    响应，不必等它读到下一个数据块或卡到超时。
+    """
+
+    def __init__(self) -> None:
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._responses: List[Any] = []
+        self._held: List["_Held"] = []
+
+    def hold(self, held: "_Held") -> None:
+        with self._lock:
+            self._held.append(held)
+        if self.cancelled.is_set():
+            held.release()
+
+    def attach(self, resp: Any) -> None:
+        with self._lock:
+            self._responses.append(resp)
+        if self.cancelled.is_set():
+            _abort_response(resp)
+
+    def detach(self, held: Optional["_Held"] = None, resp: Any = None) -> None:
+        with self._lock:
+            if held in self._held:
+                self._held.remove(held)
+            if resp in self._responses:
+                self._responses.remove(resp)
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        with self._lock:
+            held, responses = list(self._held), list(self._responses)
+        for h in held:
+            h.release()
+        for resp in responses:
+            _abort_response(resp)
+
+
+class _Held:
+    """一次请求占用的名额与代理；可由请求线程或 _Race.cancel() 释放，只释放一次。"""
+
+    def __init__(self, stack: ExitStack) -> None:
+        self._stack = stack
+        self._lock = threading.Lock()
+
+    def release(self, *exc: Any) -> None:
+        with self._lock:
+            # ExitStack 退出后回调已清空，重复调用为空操作
+            self._stack.__exit__(*(exc or (None, None, None)))
+
+
+def _hedge_delay(settings: Settings) -> Optional[float]:
+    """本次请求的对冲延迟（秒），None 表示不对冲。
+
+    限速生效时不对冲：慢是限速造成的，再发一个请求只会让同一份数据下载两遍。
+    """
+    if is_limited(settings):
+        return None
+    if settings.image_hedge_delay is not None:
+        return settings.image_hedge_delay or None
+    p90 = _LATENCY.p90()
+    return HEDGE_DEFAULT_DELAY if p90 is None else max(HEDGE_MIN_DELAY, p90)
+
+
+def _download_attempt(
+    client,
+    url: str,
+    part: Path,
+    settings: Settings,
+    allowance: Prepaid,
+    race: Optional[_Race] = None,
+) -> None:
+    """下载一次到临时文件；已有部分内容时通过 Range 续传。
+
+    race 为对冲竞速时的协调对象：落败后在下一个数据块处放弃，进行中的响应也会被直接中止。
+
+    allowance 为申请名额前预先等待过的限速额度，超出的部分边下载边限速。
+    """
+    import httpx
+
+    host = urlparse(url).netloc.lower()
+    offset = part.stat().st_size if part.exists() else 0
+    headers = {"User-Agent": settings.user_agent}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+
+    timeout = stage_timeout(IMAGE_TIMEOUT, "image")
+    try:
+        with client.stream("GET", url, headers=headers, timeout=timeout) as resp:
+            if race is not None:
+                race.attach(resp)
+            UPSTREAM_RESPONSES.inc(host=host, status=resp.status_code)
+            if resp.status_code == 416:
+                # 已下载部分无效（例如远端文件变了），从头开始。
+                part.unlink(missing_ok=True)
+                raise ImageDownloadError("续传范围无效，重新下载")
+            if resp.status_code >= 400:
+                raise ImageDownloadError(
+                    f"HTTP {resp.status_code}", retryable=resp.status_code >= 500
+                )
+            _check_content_type(resp.headers.get("content-type", ""))
+
+            if resp.status_code != 206 or not resp.headers.get(
+                "content-range", ""
+            ).startswith(f"bytes {offset}-"):
+                # 服务器不支持 Range、返回的范围不对，或这是首次请求：从头写入。
+                offset = 0
+            length = resp.headers.get("content-length")
+            if length and length.isdigit() and offset + int(length) > MAX_IMAGE_BYTES:
+                raise ImageDownloadError(
+                    f"图片过大：{offset + int(length)} 字节", retryable=False
+                )
+
+            written = offset
+            with part.open("ab" if offset else "wb") as f:
+                for chunk in allowance.throttle(resp.iter_bytes()):
+                    written += len(chunk)
+                    if written > MAX_IMAGE_BYTES:
+                        raise ImageDownloadError(
+                            f"图片超过 {MAX_IMAGE_BYTES} 字节", retryable=False
+                        )
+                    if race is not None and race.cancelled.is_set():
+                        raise ImageDownloadError("已被对冲请求取代", retryable=False)
+                    if deadline_expired():
+                        raise DeadlineExceeded("image")
+                    f.write(chunk)
+                    DOWNLOADED_BYTES.inc(len(chunk), kind="image")
+            _SIZES.record(written)
+    except httpx.TransportError as exc:
+        if race is not None and race.cancelled.is_set():
+            # 落败后连接被中止：不算作上游错误
+            raise ImageDownloadError("已被对冲请求取代", retryable=False) from None
+        UPSTREAM_RESPONSES.inc(host=host, status="error")
+        if deadline_expired():
+            # 超时由任务预算缩短或任务已取消：不算作代理故障，也不再重试
+            raise DeadlineExceeded("image") from None
+        raise ImageDownloadError(f"{type(exc).__name__}: {exc}") from exc
+    except (httpx.HTTPError, httpx.InvalidURL) as exc:
+        # 解码失败、重定向过多、URL 无效等：重试也不会成功
+        UPSTREAM_RESPONSES.inc(host=host, status="error")
+        raise ImageDownloadError(f"{type(exc).__name__}: {exc}", retryable=False) from exc
+
+
+def _leased_attempt(
+    url: str, part: Path, settings: Settings, race: Optional[_Race] = None
+) -> None:
+    # 先按预估大小等待限速，再申请名额与代理：限速等待不占用上游名额，
+    # 也不会让排在后面的写入任务等着正在睡眠的下载。
+    offset = part.stat().st_size if part.exists() else 0
+    cancel = race.cancelled if race is not None else None
+    with prepay(settings, "image", _SIZES.mean() - offset, cancel) as allowance:
+        if race is None:
+            with get_scheduler(settings).slot("image"), get_proxy_pool(settings).lease() as proxy:
+                client = get_http_client(proxy.url if proxy else None)
+                _download_attempt(client, url, part, settings, allowance)
+            return
+
+        # 竞速中的请求：名额与代理可能由胜出方提前释放（见 _Race.cancel）
+        stack = ExitStack()
+        stack.enter_context(get_scheduler(settings).slot("image"))
+        try:
+            proxy = stack.enter_context(get_proxy_pool(settings).lease())
+        except BaseException:
+            stack.close()
+            raise
+        held = _Held(stack)
+        race.hold(held)
+        try:
+            if race.cancelled.is_set():
+                raise ImageDownloadError("已被对冲请求取代", retryable=False)
+            client = get_http_client(proxy.url if proxy else None)
+            _download_attempt(client, url, part, settings, allowance, race)
+        except BaseException as exc:
+            held.release(type(exc), exc, exc.__traceback__)
+            raise
+        finally:
+            race.detach(held)
+            held.release()
+
+
+def _hedged_attempt(url: str, part: Path, settings: Settings) -> Path:
+    """执行一次下载尝试，超过对冲延迟仍未完成时（在预算内）再发一个相同请求。
+
+    对冲请求写入独立的临时文件，从代理池另行租用代理（进行中请求最少者，通常不是首个请求
+    所用的代理）；未配置代理时，共享客户端会为它新建一条连接。返回先成功完成的临时文件，
+    另一个请求立即归还名额与代理，进行中的响应被中止，并删除自己的临时文件（见 _Race）。
+    两个请求都失败时抛出首个请求的异常。
+    """
+    delay = _hedge_delay(settings)
+    _BUDGET.deposit(settings.image_hedge_budget)
+    if delay is None:
+        start = time.monotonic()
+        _leased_attempt(url, part, settings)
+        if not is_limited(settings):
+            # 限速下的耗时不代表上游快慢，不计入自动对冲延迟的样本
+            _LATENCY.record(time.monotonic() - start)
+        return part
+
+    race = _Race()
+    results: "queue.Queue[Tuple[Path, Optional[BaseException]]]" = queue.Queue()
+
+    def run(target: Path) -> None:
+        start = time.monotonic()
+        try:
+            _leased_attempt(url, target, settings, race)
+        except BaseException as exc:  # noqa: BLE001 - 交给等待方处理
+            # 首个请求的临时文件保留用于续传；对冲请求或已落败的请求删除自己的文件
+            if target != part or race.cancelled.is_set():
+                target.unlink(missing_ok=True)
+            results.put((target, exc))
+            return
+        _LATENCY.record(time.monotonic() - start)
+        results.put((target, None))
+
+    def launch(target: Path) -> None:
+        # 复制当前上下文，子线程沿用调用方的调度优先级
+        ctx = contextvars.copy_context()
+        threading.Thread(
+            target=ctx.run, args=(run, target), name="nfofetch-image", daemon=True
+        ).start()
+
+    launch(part)
+    deadline = current_deadline()
+    started = time.monotonic()
+    running, hedged = 1, False
+    error: Optional[BaseException] = None
+    while running:
+        timeout = None if hedged else max(0.0, started + delay - time.monotonic())
+        if deadline is not None:
+            # 定期醒来检查任务预算与取消状态
+            timeout = min(timeout if timeout is not None else 0.5, 0.5)
+        try:
+            target, exc = results.get(timeout=timeout)
+        except queue.Empty:
+            if deadline is not None and deadline.expired():
+                race.cancel()
+                deadline.check("image")
+            if hedged or time.monotonic() < started + delay:
+                continue
+            hedged = True
+            if _BUDGET.try_spend():
+                hedge = part.with_name(part.name[: -len(PARTIAL_SUFFIX)] + ".hedge" + PARTIAL_SUFFIX)
+                hedge.unlink(missing_ok=True)
+                IMAGE_HEDGES.inc(outcome="sent")
+                launch(hedge)
+                running += 1
+            else:
+                IMAGE_HEDGES.inc(outcome="skipped")
+            continue
+        running -= 1
+        hedged = True
+        if exc is None:
+            race.cancel()
+            if target != part:
+                IMAGE_HEDGES.inc(outcome="won")
+            return target
+        if error is None or target == part:
+            error = exc
+    assert error is not None
+    raise error
+
+
+def download_image(url: str, dest: Path, settings: Settings) -> bool:
+    """下载图片到 dest，成功返回 True。
+
+    - 先写入 `dest.part`，校验文件头通过后再原子地重命名为 dest，
+      失败时不会留下截断或损坏的图片（已存在的 dest 也不会被破坏）；
+    - 超时 / 连接中断 / 5xx 时重试，并用 Range 从已下载处续传；
+    - 响应不是图片（例如 200 状态的 HTML 错误页）或超过大小上限时直接放弃；
+    - 每次尝试都从代理池重新选择代理，并复用该代理的共享 HTTP 客户端；
+    - 单次尝试超过对冲延迟仍未完成时发出对冲请求，取先完成者（见 _hedged_attempt）。
+    """
+    part = dest.with_name(dest.name + PARTIAL_SUFFIX)
+    # 残留的临时文件可能来自其它 URL，不能用于续传。
+    part.unlink(missing_ok=True)
+
+    with time_stage("image_download", url=url, dest=dest.name):
+        for attempt in range(1, IMAGE_DOWNLOAD_ATTEMPTS + 1):
+            try:
+                done = _hedged_attempt(url, part, settings)
+                with done.open("rb") as f:
+                    head = f.read(16)
+                if not looks_like_image(head):
+                    done.unlink(missing_ok=True)
+                    raise ImageDownloadError("内容不是有效图片", retryable=False)
+                os.replace(done, dest)
+                if done != part:
+                    part.unlink(missing_ok=True)
+                return True
+            except DeadlineExceeded as exc:
+                logger.info("图片下载中止 %s -> %s：%s", url, dest, exc)
+                part.unlink(missing_ok=True)
+                return False
+            except ImageDownloadError as exc:
+                if not exc.retryable or attempt == IMAGE_DOWNLOAD_ATTEMPTS or deadline_expired():
+                    logger.warning("图片下载失败 %s -> %s：%s", url, dest, exc)
+                    part.unlink(missing_ok=True)
+                    return False
+                time.sleep(0.5 * attempt)
+            except OSError as exc:
+                logger.warning("图片写入失败 %s -> %s：%s", url, dest, exc)
+                part.unlink(missing_ok=True)
+                return False
+            except Exception:  # noqa: BLE001 - 单张图片失败不应中断整个写入
+                logger.exception("图片下载出错 %s -> %s", url, dest)
+                part.unlink(missing_ok=True)
+                return False
+    return False
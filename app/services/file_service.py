@@ -1,31 +1,43 @@
 from __future__ import annotations
 
+import json
 import os
 import re
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterable, List, Optional, TextIO, Tuple
 
-import httpx
-
-from app.config import Settings
-from app.schemas import MovieMetadata, ScrapeResult
+from app.config import DEFAULT_RENAME_FORMAT, Settings  # noqa: F401 - 兼容旧导入路径
+from app.deadline import cut_stages, deadline_expired, note_cut
+from app.metrics import time_stage
+from app.schemas import MovieMetadata, MovieRecord, ScrapeResult
+from app.services.image_cache import fetch_to
+from app.services.nfo_service import METADATA_SIDECAR_NAME
+from app.services.trailer_service import download_trailer, trailer_path_for
+from app.tracing import span
 
 # 支持的视频扩展名
 VIDEO_EXTENSIONS = (".mp4", ".mkv", ".avi", ".wmv", ".mov", ".webm", ".m4v", ".flv")
+# Jellyfin / Kodi 识别的本地预告片文件名后缀（<视频名>-trailer.mp4 等），这类文件不作为正片处理
+TRAILER_STEM_SUFFIXES = ("-trailer", ".trailer", "_trailer")
 
 # 文件名中不允许的字符（Windows/Linux 通用）
 _FILENAME_UNSAFE = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
 
-# 默认重命名格式
-DEFAULT_RENAME_FORMAT = "[{actor}][{date}]{id}"
-
 # 常见文件系统单文件名最大字节数（ext4/Windows 等）
 MAX_FILENAME_BYTES = 255
 # 为重名冲突时追加的 _2、_3 等后缀预留字节
 RESERVED_SUFFIX_BYTES = 8
 
 
-def _is_vr(metadata: MovieMetadata) -> bool:
+def is_video_file(name: str) -> bool:
+    """按扩展名判断是否为正片视频（预告片不算）。"""
+    path = Path(name)
+    return path.suffix.lower() in VIDEO_EXTENSIONS and not path.stem.lower().endswith(
+        TRAILER_STEM_SUFFIXES
+    )
+
+
+def _is_vr(metadata: MovieMetadata | MovieRecord) -> bool:
     """根据元数据判断是否为 VR 视频。"""
     number = (metadata.number or "").upper()
     if "VR" in number:
@@ -58,7 +70,7 @@ def _truncate_to_bytes(s: str, max_bytes: int) -> str:
 
 
 def _format_rename(
-    metadata: MovieMetadata,
+    metadata: MovieMetadata | MovieRecord,
     idx: int,
     is_vr: bool,
     format_str: str,
@@ -85,27 +97,133 @@ def _format_rename(
     return _sanitize_filename_part(result)
 
 
+def _target_base_name(
+    metadata: MovieMetadata | MovieRecord, idx: int, is_vr: bool, format_str: str, ext: str
+) -> str:
+    """生成不含扩展名的目标文件名，并按文件系统限制截断。"""
+    base_name = _format_rename(metadata, idx, is_vr, format_str)
+    ext_bytes = len(ext.encode("utf-8"))
+    max_base_bytes = max(1, MAX_FILENAME_BYTES - ext_bytes - RESERVED_SUFFIX_BYTES)
+    return _truncate_to_bytes(base_name, max_base_bytes)
+
+
+def _is_companion(name: str, stem: str) -> bool:
+    """是否为跟随视频同名的附属文件（<stem>.nfo、<stem>-poster.jpg、<stem>.zh.srt 等）。"""
+    return len(name) > len(stem) and name.startswith(stem) and name[len(stem)] in ".-"
+
+
+def _companion_targets(companions: List[str], old_stem: str, new_stem: str) -> List[str]:
+    return [new_stem + name[len(old_stem):] for name in companions]
+
+
+def plan_dir_renames(
+    movie_dir: Path,
+    metadata: MovieMetadata | MovieRecord,
+    format_str: str,
+    *,
+    names: Optional[Iterable[str]] = None,
+    only: Optional[str] = None,
+) -> List[Tuple[Path, Path]]:
+    """规划一个目录内的重命名，返回 (原路径, 新路径) 列表，不做任何文件操作。
+
+    - 只列一次目录（或直接使用调用方传入的 names），冲突在内存中解决，
+      视频或其附属文件的目标名已被占用时追加 _2、_3 等后缀；
+    - only 为文件名时只重命名该视频，否则重命名目录下所有视频（按文件名排序决定 {idx}）；
+    - 与视频同名的附属文件（字幕、<视频名>.nfo、<视频名>-poster.jpg、<视频名>-trailer.mp4 等）一并改名。
+    """
+    if names is None:
+        with os.scandir(movie_dir) as it:
+            names = [e.name for e in it if e.is_file()]
+    all_names = list(names)
+    videos = sorted(
+        (n for n in all_names if is_video_file(n)),
+        key=str.lower,
+    )
+    if only is not None:
+        videos = [only] if only in videos else []
+    if not videos:
+        return []
+
+    # 附属文件归属于文件名前缀最长的那个视频（例如 A-2.srt 属于 A-2.mp4 而不是 A.mp4）。
+    all_video_stems = [Path(n).stem for n in all_names if is_video_file(n)]
+    companions: dict[str, List[str]] = {}
+    for name in all_names:
+        if is_video_file(name):
+            continue
+        owners = [stem for stem in all_video_stems if _is_companion(name, stem)]
+        if owners:
+            companions.setdefault(max(owners, key=len), []).append(name)
+
+    is_vr = _is_vr(metadata)
+    moving = set(videos)
+    taken = set(all_names) - moving
+    plan: List[Tuple[Path, Path]] = []
+    for i, name in enumerate(videos, start=1):
+        ext = Path(name).suffix
+        old_stem = Path(name).stem
+        own = companions.get(old_stem, [])
+        base_name = _target_base_name(metadata, i, is_vr, format_str, ext)
+        # 视频与它的附属文件的目标名都未被占用（附属文件自己的原名除外）才可用，
+        # 否则继续追加后缀，避免视频改了名而字幕等附属文件被落下
+        new_stem, n = base_name, 1
+        while new_stem + ext in taken or any(
+            t in taken and t not in own for t in _companion_targets(own, old_stem, new_stem)
+        ):
+            n += 1
+            new_stem = f"{base_name}_{n}"
+        target = new_stem + ext
+        taken.add(target)
+        if name == target:
+            continue
+        plan.append((movie_dir / name, movie_dir / target))
+        for companion, companion_target in zip(own, _companion_targets(own, old_stem, new_stem)):
+            taken.discard(companion)
+            taken.add(companion_target)
+            plan.append((movie_dir / companion, movie_dir / companion_target))
+    return plan
+
+
+def apply_renames(
+    plan: List[Tuple[Path, Path]],
+    journal: Optional[TextIO] = None,
+) -> None:
+    """执行 plan_dir_renames 规划出的重命名。
+
+    目标名与其它原文件名相同（链式 / 环形重命名）时先改到临时名再改到最终名。
+    提供 journal 时，每一步重命名之前先写入一行 JSON（src/dst），用于撤销。
+    """
+
+    def _rename(src: Path, dst: Path) -> None:
+        if journal is not None:
+            journal.write(json.dumps({"src": str(src), "dst": str(dst)}, ensure_ascii=False) + "\n")
+            journal.flush()
+        src.rename(dst)
+
+    sources = {src for src, _ in plan}
+    if not any(dst in sources for _, dst in plan):
+        for src, dst in plan:
+            _rename(src, dst)
+        return
+
+    # 两阶段重命名：先到临时名，再到最终名，避免冲突
+    staged: List[Tuple[Path, Path]] = []
+    for i, (src, dst) in enumerate(plan, start=1):
+        temp = src.with_name(f"__nfofetch_tmp_{i}{src.suffix}")
+        _rename(src, temp)
+        staged.append((temp, dst))
+    for temp, dst in staged:
+        _rename(temp, dst)
+
+
 def _rename_single_video(
     video_path: Path,
     metadata: MovieMetadata,
     format_str: str,
 ) -> Path:
     """仅重命名指定的单个视频文件，返回新路径。"""
-    movie_dir = video_path.parent
-    ext = video_path.suffix
-    is_vr = _is_vr(metadata)
-    base_name = _format_rename(metadata, 1, is_vr, format_str)
-    ext_bytes = len(ext.encode("utf-8"))
-    max_base_bytes = max(1, MAX_FILENAME_BYTES - ext_bytes - RESERVED_SUFFIX_BYTES)
-    base_name = _truncate_to_bytes(base_name, max_base_bytes)
-    new_path = movie_dir / (base_name + ext)
-    n = 1
-    while new_path.exists() and new_path != video_path:
-        n += 1
-        new_path = movie_dir / f"{base_name}_{n}{ext}"
-    if new_path != video_path:
-        video_path.rename(new_path)
-    return new_path
+    plan = plan_dir_renames(video_path.parent, metadata, format_str, only=video_path.name)
+    apply_renames(plan)
+    return dict(plan).get(video_path, video_path)
 
 
 def _rename_videos_in_dir(
@@ -114,48 +232,11 @@ def _rename_videos_in_dir(
     format_str: str,
 ) -> dict[Path, Path]:
     """重命名目录下所有视频文件，返回 旧路径 -> 新路径 映射。"""
-    video_files = sorted(
-        [p for p in movie_dir.iterdir() if p.is_file() and p.suffix.lower() in VIDEO_EXTENSIONS],
-        key=lambda p: p.name.lower(),
-    )
-    if not video_files:
-        return {}
-
-    is_vr = _is_vr(metadata)
-    # 两阶段重命名：先到临时名，再到最终名，避免冲突
-    temp_renames: list[tuple[Path, Path]] = []
-    for i, old_path in enumerate(video_files, start=1):
-        base_name = _format_rename(metadata, i, is_vr, format_str)
-        ext = old_path.suffix
-        ext_bytes = len(ext.encode("utf-8"))
-        max_base_bytes = max(1, MAX_FILENAME_BYTES - ext_bytes - RESERVED_SUFFIX_BYTES)
-        base_name = _truncate_to_bytes(base_name, max_base_bytes)
-        temp_path = movie_dir / f"__nfofetch_tmp_{i}{ext}"
-        temp_renames.append((old_path, temp_path))
-
-    # 执行临时重命名
-    for old_p, temp_p in temp_renames:
-        old_p.rename(temp_p)
-
-    # 最终重命名
-    result: dict[Path, Path] = {}
-    for i, (_, temp_p) in enumerate(temp_renames, start=1):
-        base_name = _format_rename(metadata, i, is_vr, format_str)
-        ext = temp_p.suffix
-        ext_bytes = len(ext.encode("utf-8"))
-        max_base_bytes = max(1, MAX_FILENAME_BYTES - ext_bytes - RESERVED_SUFFIX_BYTES)
-        base_name = _truncate_to_bytes(base_name, max_base_bytes)
-        new_path = movie_dir / (base_name + ext)
-        # 避免重名冲突，若已存在则追加 _2, _3 等
-        final_path = new_path
-        n = 1
-        while final_path.exists():
-            n += 1
-            final_path = movie_dir / f"{base_name}_{n}{ext}"
-        temp_p.rename(final_path)
-        result[temp_renames[i - 1][0]] = final_path
-
-    return result
+    plan = plan_dir_renames(movie_dir, metadata, format_str)
+    apply_renames(plan)
+    return {
+        src: dst for src, dst in plan if is_video_file(src.name)
+    }
 
 
 def _write_nfo_and_images(
@@ -175,6 +256,11 @@ def _write_nfo_and_images(
     with nfo_path.open("w", encoding="utf-8") as f:
         f.write(nfo_text)
 
+    # 同时保存元数据 sidecar，后续修改 NFO 规则时可离线重新生成，无需重新刮削。
+    sidecar_path = movie_dir / METADATA_SIDECAR_NAME
+    with sidecar_path.open("w", encoding="utf-8") as f:
+        f.write(metadata.model_dump_json(indent=2))
+
     # 下载图片
     poster_path: Optional[Path] = None
     fanart_path: Optional[Path] = None
@@ -195,30 +281,22 @@ def _write_nfo_and_images(
         if s not in art_urls:
             art_urls.append(s)
 
-    def download_image(url: str, dest: Path) -> bool:
-        try:
-            # httpx 1.x 不再支持 proxies 关键字，这里通过环境变量传递代理。
-            if settings.http_proxy:
-                os.environ.setdefault("HTTP_PROXY", settings.http_proxy)
-                os.environ.setdefault("HTTPS_PROXY", settings.http_proxy)
-
-            with httpx.Client(
-                headers={"User-Agent": settings.user_agent},
-                timeout=20.0,
-            ) as client:
-                with client.stream("GET", url) as resp:
-                    resp.raise_for_status()
-                    with dest.open("wb") as f:
-                        for chunk in resp.iter_bytes():
-                            f.write(chunk)
-            return True
-        except Exception:
+    def download_image(url: str, dest: Path, stage: str) -> bool:
+        # 任务预算已用尽（或任务已取消）时跳过剩余图片，NFO 已先行写入。
+        if deadline_expired():
+            note_cut(stage)
             return False
+        # 预览阶段经 /img 代理下载过（或从缓存包导入）的原图直接从缓存复制，不再重复下载。
+        if fetch_to(url, dest, settings):
+            return True
+        if deadline_expired():
+            note_cut(stage)
+        return False
 
     # 1. poster.jpg
     if poster_urls:
         poster_path = movie_dir / "poster.jpg"
-        if not download_image(str(poster_urls[0]), poster_path):
+        if not download_image(str(poster_urls[0]), poster_path, "poster"):
             poster_path = None
 
     # 2. fanart.jpg
@@ -237,8 +315,11 @@ def _write_nfo_and_images(
     ]
 
     for url in fanart_candidates:
+        if deadline_expired():
+            note_cut("fanart")
+            break
         fanart_path_candidate = movie_dir / "fanart.jpg"
-        if download_image(url, fanart_path_candidate):
+        if download_image(url, fanart_path_candidate, "fanart"):
             fanart_path = fanart_path_candidate
             break
 
@@ -265,14 +346,18 @@ def _write_nfo_and_images(
             continue
         if idx > max_extra_images:
             break
+        if deadline_expired():
+            note_cut("extrafanart")
+            break
         dest = extra_dir / f"{idx:02d}.jpg"
-        if download_image(url, dest):
+        if download_image(url, dest, "extrafanart"):
             extra_paths.append(dest)
             idx += 1
 
     return nfo_path, poster_path, fanart_path, extra_paths
 
 
+@span("save_assets_for_existing_video")
 def save_assets_for_existing_video(
     *,
     metadata: MovieMetadata,
@@ -299,11 +384,12 @@ def save_assets_for_existing_video(
     if rename_format and rename_format.strip():
         fmt = rename_format.strip()
         try:
-            if "{idx}" in fmt:
-                renames = _rename_videos_in_dir(movie_dir, metadata, fmt)
-                final_video_path = renames.get(video_path, video_path)
-            else:
-                final_video_path = _rename_single_video(video_path, metadata, fmt)
+            with time_stage("rename"):
+                if "{idx}" in fmt:
+                    renames = _rename_videos_in_dir(movie_dir, metadata, fmt)
+                    final_video_path = renames.get(video_path, video_path)
+                else:
+                    final_video_path = _rename_single_video(video_path, metadata, fmt)
         except OSError as e:
             return ScrapeResult(
                 success=False,
@@ -321,6 +407,16 @@ def save_assets_for_existing_video(
         fanart_url=fanart_url,
     )
 
+    # 4. 预告片（可选）：体积最大，放在最后，预算不足时优先保证 NFO 与图片
+    trailer_path: Optional[Path] = None
+    if settings.download_trailer and metadata.trailer:
+        if deadline_expired():
+            note_cut("trailer")
+        else:
+            dest = trailer_path_for(final_video_path, str(metadata.trailer))
+            if download_trailer(str(metadata.trailer), dest, settings):
+                trailer_path = dest
+
     return ScrapeResult(
         success=True,
         message=None,
@@ -331,7 +427,9 @@ def save_assets_for_existing_video(
         poster_path=str(poster_path) if poster_path else None,
         fanart_path=str(fanart_path) if fanart_path else None,
         extra_images=[str(p) for p in extra_paths],
+        trailer_path=str(trailer_path) if trailer_path else None,
         chosen_poster_url=poster_url,
         chosen_fanart_url=fanart_url,
+        cut_stages=cut_stages(),
     )
 
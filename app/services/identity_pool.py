@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.config import Settings
+from app.metrics import IDENTITIES
+
+logger = logging.getLogger(__name__)
+
+# 连续收到多少次 403 后停用该身份（通常意味着 cf_clearance 已失效或被封）。
+RETIRE_AFTER_403 = 2
+# 收到 429 后该身份冷却的秒数，冷却期间优先使用其它身份。
+THROTTLE_COOLDOWN_SECONDS = 60.0
+# 检查身份文件是否有修改的最小间隔。
+RELOAD_CHECK_SECONDS = 2.0
+
+
+@dataclass
+class Identity:
+    """一组访问站点所用的身份：Cookie + User-Agent。"""
+
+    name: str
+    cookie: Optional[str]
+    user_agent: str
+    last_used: float = 0.0
+    last_throttled: float = 0.0
+    cooldown_until: float = 0.0
+    consecutive_403: int = 0
+    retired: bool = False
+
+    @property
+    def key(self) -> str:
+        # Cookie 变了（例如更新了 cf_clearance）视为新身份，之前的停用状态不再沿用
+        raw = f"{self.cookie or ''}\n{self.user_agent}".encode("utf-8")
+        return hashlib.sha1(raw).hexdigest()
+
+
+class IdentityPool:
+    """可热加载的身份池。
+
+    身份文件为 JSON 数组，每项形如
+    `{"name": "a", "cookie": "cf_clearance=...; _jdb_session=...", "user_agent": "..."}`，
+    user_agent 可省略（使用 NFOFETCH_USER_AGENT）。文件修改后自动重新加载，无需重启。
+    选择策略：跳过已停用和冷却中的身份，优先最久未被限流、其次最久未使用的身份（即轮询）。
+    """
+
+    def __init__(self, settings: Settings, path: Optional[str] = None) -> None:
+        self.settings = settings
+        self.path = path
+        self._lock = threading.Lock()
+        self._identities: List[Identity] = []
+        self._mtime: Optional[float] = None
+        self._checked = 0.0
+        self._load()
+
+    def _default_identity(self) -> Identity:
+        return Identity(
+            name="default",
+            cookie=self.settings.javdb_cookie,
+            user_agent=self.settings.user_agent,
+        )
+
+    def _load(self) -> None:
+        """（重新）读取身份文件，沿用未变化身份的健康状态。"""
+        if not self.path:
+            self._identities = [self._default_identity()]
+            self._update_gauge()
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self._mtime:
+                return
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as exc:
+            logger.warning("读取身份文件 %s 失败：%s", self.path, exc)
+            if not self._identities:
+                self._identities = [self._default_identity()]
+                self._update_gauge()
+            return
+
+        previous: Dict[str, Identity] = {i.key: i for i in self._identities}
+        loaded: List[Identity] = []
+        for idx, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                continue
+            identity = Identity(
+                name=str(entry.get("name") or f"identity-{idx + 1}"),
+                cookie=entry.get("cookie") or None,
+                user_agent=entry.get("user_agent") or self.settings.user_agent,
+            )
+            old = previous.get(identity.key)
+            if old is not None:
+                old.name = identity.name
+                identity = old
+            loaded.append(identity)
+        self._identities = loaded or [self._default_identity()]
+        self._mtime = mtime
+        logger.info("已加载 %d 个身份：%s", len(self._identities), self.path)
+        self._update_gauge()
+
+    def _maybe_reload(self, now: float) -> None:
+        if self.path and now - self._checked >= RELOAD_CHECK_SECONDS:
+            self._checked = now
+            self._load()
+
+    def _update_gauge(self) -> None:
+        now = time.monotonic()
+        counts = {"active": 0, "cooling": 0, "retired": 0}
+        for i in self._identities:
+            if i.retired:
+                counts["retired"] += 1
+            elif i.cooldown_until > now:
+                counts["cooling"] += 1
+            else:
+                counts["active"] += 1
+        for state, count in counts.items():
+            IDENTITIES.set(count, state=state)
+
+    def acquire(self) -> Identity:
+        """选出本次请求使用的身份。全部停用时仍返回其中之一，以免彻底停摆。"""
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_reload(time.time())
+            candidates = [i for i in self._identities if not i.retired] or self._identities
+            ready = [i for i in candidates if i.cooldown_until <= now] or candidates
+            identity = min(ready, key=lambda i: (i.last_throttled, i.last_used))
+            identity.last_used = now
+            return identity
+
+    def report(self, identity: Identity, status: Optional[int]) -> None:
+        """根据响应状态码更新身份健康状态（status 为 None 表示连接失败，不计入）。"""
+        if status is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if status == 403:
+                identity.consecutive_403 += 1
+                if identity.consecutive_403 >= RETIRE_AFTER_403 and not identity.retired:
+                    identity.retired = True
+                    logger.warning(
+                        "身份 %s 连续 %d 次返回 403，已停用；更新身份文件中的 Cookie 后会重新启用",
+                        identity.name,
+                        identity.consecutive_403,
+                    )
+            elif status == 429:
+                identity.last_throttled = now
+                identity.cooldown_until = now + THROTTLE_COOLDOWN_SECONDS
+            elif status < 400:
+                identity.consecutive_403 = 0
+            self._update_gauge()
+
+    def identities(self) -> List[Identity]:
+        with self._lock:
+            return list(self._identities)
+
+
+_pools: Dict[Optional[str], IdentityPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_identity_pool(settings: Settings) -> IdentityPool:
+    path = settings.identities_file
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = IdentityPool(settings, path)
+        return pool
@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Optional, Set
+from urllib.parse import urlparse
+
+from app.config import Settings
+from app.metrics import record_cache
+from app.services.download_service import MAX_IMAGE_BYTES, download_image, looks_like_image
+
+try:  # Pillow 为可选依赖，未安装时缩略图直接返回原图
+    from PIL import Image
+
+    _HAS_PIL = True
+except Exception:  # pragma: no cover - 运行环境未安装 Pillow 时兜底
+    Image = None  # type: ignore[assignment]
+    _HAS_PIL = False
+
+# 允许的缩略图宽度，请求的宽度会向上取到最近的一档，避免缓存被任意尺寸撑爆。
+THUMBNAIL_WIDTHS = (160, 320, 480, 640)
+
+# 已知图床的域名（含子域名），/img 总是允许代理这些主机上的图片。
+KNOWN_IMAGE_HOSTS = ("jdbstatic.com",)
+
+_MEDIA_TYPES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG", "image/png"),
+    (b"GIF8", "image/gif"),
+    (b"BM", "image/bmp"),
+)
+
+
+def guess_media_type(path: Path) -> str:
+    """根据文件头判断图片的 Content-Type。"""
+    with path.open("rb") as f:
+        head = f.read(16)
+    for magic, media_type in _MEDIA_TYPES:
+        if head.startswith(magic):
+            return media_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        return "image/avif"
+    return "application/octet-stream"
+
+
+class DiskLRUCache:
+    """容量受限的磁盘缓存，按最近访问时间淘汰。
+
+    文件按 key 的前两位分目录存放；命中时更新 mtime 作为访问时间。
+    总大小只在首次使用时扫描一次，之后在内存中维护。
+    """
+
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sizes: Optional[Dict[Path, int]] = None
+        self._total = 0
+
+    def path_for(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def _load(self) -> Dict[Path, int]:
+        if self._sizes is None:
+            sizes: Dict[Path, int] = {}
+            if self.directory.is_dir():
+                for path in self.directory.glob("??/*"):
+                    if path.is_file() and not path.name.endswith(".part"):
+                        sizes[path] = path.stat().st_size
+            self._sizes = sizes
+            self._total = sum(sizes.values())
+        return self._sizes
+
+    def get(self, key: str) -> Optional[Path]:
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def add(self, key: str) -> None:
+        """登记刚写入 path_for(key) 的文件，并在超出容量时淘汰最久未访问的文件。"""
+        path = self.path_for(key)
+        with self._lock:
+            sizes = self._load()
+            size = path.stat().st_size
+            self._total += size - sizes.get(path, 0)
+            sizes[path] = size
+            if self._total <= self.max_bytes:
+                return
+            by_age = sorted(sizes, key=lambda p: _mtime(p))
+            for victim in by_age:
+                if self._total <= self.max_bytes:
+                    break
+                if victim == path:
+                    continue
+                victim.unlink(missing_ok=True)
+                self._total -= sizes.pop(victim)
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+# 刮削结果中出现过的图片主机。/img 只代理这些主机与 KNOWN_IMAGE_HOSTS 上的图片，
+# 避免被当作开放代理，经配置的代理访问内网或任意地址。
+_allowed_hosts: Set[str] = set()
+_allowed_lock = threading.Lock()
+
+
+def allow_image_urls(urls: Iterable[str]) -> None:
+    """登记刮削结果中的图片 URL，之后 /img 才会代理其所在主机。"""
+    hosts = {urlparse(u).hostname for u in urls}
+    with _allowed_lock:
+        _allowed_hosts.update(h for h in hosts if h)
+
+
+def is_allowed_image_url(url: str) -> bool:
+    """URL 是否为 http/https，且主机是已知图床或出现在刮削结果中。"""
+    parsed = urlparse(url)
+    host = parsed.hostname
+    if parsed.scheme not in ("http", "https") or not host:
+        return False
+    with _allowed_lock:
+        if host in _allowed_hosts:
+            return True
+    return any(host == known or host.endswith("." + known) for known in KNOWN_IMAGE_HOSTS)
+
+
+_caches: Dict[str, DiskLRUCache] = {}
+_caches_lock = threading.Lock()
+# 分段锁：同一 URL 并发请求时只下载一次
+_URL_LOCKS = [threading.Lock() for _ in range(64)]
+
+
+def get_image_cache(settings: Settings) -> DiskLRUCache:
+    directory = Path(settings.cache_dir).expanduser() / "images"
+    with _caches_lock:
+        cache = _caches.get(str(directory))
+        if cache is None:
+            cache = DiskLRUCache(directory, settings.image_cache_bytes)
+            _caches[str(directory)] = cache
+        return cache
+
+
+def _key(url: str, variant: str = "orig") -> str:
+    return hashlib.sha256(f"{variant}:{url}".encode("utf-8")).hexdigest()
+
+
+def _url_lock(key: str) -> threading.Lock:
+    return _URL_LOCKS[int(key[:8], 16) % len(_URL_LOCKS)]
+
+
+def cached_original(url: str, settings: Settings) -> Optional[Path]:
+    """只查询缓存，不下载。"""
+    return get_image_cache(settings).get(_key(url))
+
+
+def fetch_original(url: str, settings: Settings) -> Optional[Path]:
+    """返回原图的缓存路径，未缓存时通过配置的代理下载；下载失败返回 None。"""
+    cache = get_image_cache(settings)
+    key = _key(url)
+    path = cache.get(key)
+    if path is not None:
+        record_cache("image", True)
+        return path
+    with _url_lock(key):
+        path = cache.get(key)
+        if path is not None:
+            record_cache("image", True)
+            return path
+        record_cache("image", False)
+        dest = cache.path_for(key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if not download_image(url, dest, settings):
+            return None
+        cache.add(key)
+        return dest
+
+
+def fetch_thumbnail(url: str, width: int, settings: Settings) -> Optional[Path]:
+    """返回缩略图的缓存路径；未安装 Pillow 或无法解码时返回原图。"""
+    original = fetch_original(url, settings)
+    if original is None or not _HAS_PIL:
+        return original
+
+    width = next((w for w in THUMBNAIL_WIDTHS if w >= width), THUMBNAIL_WIDTHS[-1])
+    cache = get_image_cache(settings)
+    key = _key(url, f"w{width}")
+    path = cache.get(key)
+    if path is not None:
+        record_cache("thumbnail", True)
+        return path
+    record_cache("thumbnail", False)
+
+    dest = cache.path_for(key)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    # 每个请求使用独立的临时文件：同一宽度的并发请求各自生成，最后一次 os.replace 生效
+    fd, tmp_name = tempfile.mkstemp(prefix=dest.name + ".", suffix=".part", dir=dest.parent)
+    tmp = Path(tmp_name)
+    try:
+        with os.fdopen(fd, "wb") as f, Image.open(original) as img:  # type: ignore[union-attr]
+            img.thumbnail((width, width * 4))
+            img.convert("RGB").save(f, "JPEG", quality=80, optimize=True)
+        os.replace(tmp, dest)
+    except Exception:  # noqa: BLE001 - 无法解码的图片直接返回原图
+        tmp.unlink(missing_ok=True)
+        return original
+    cache.add(key)
+    return dest
+
+
+def fetch_to(url: str, dest: Path, settings: Settings) -> bool:
+    """经图片缓存把原图写到 dest：已缓存（预览、预取或导入缓存包）时直接复制，
+    否则先下载到缓存。新下载的图片也留在缓存中，之后可随缓存包导出。"""
+    path = fetch_original(url, settings)
+    if path is None:
+        return False
+    tmp = dest.with_name(dest.name + ".part")
+    try:
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, dest)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        return False
+    return True
+
+
+def store_original(url: str, src: BinaryIO, settings: Settings) -> bool:
+    """把外部来源（例如缓存包）的原图写入缓存；内容不是图片或超过 MAX_IMAGE_BYTES 时
+    放弃并返回 False。与 fetch_original 持有同一把 URL 锁，不会和同一图片的下载交错写入。"""
+    cache = get_image_cache(settings)
+    key = _key(url)
+    dest = cache.path_for(key)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    with _url_lock(key):
+        fd, tmp_name = tempfile.mkstemp(prefix=dest.name + ".", suffix=".part", dir=dest.parent)
+        tmp = Path(tmp_name)
+        try:
+            written = 0
+            head = b""
+            with os.fdopen(fd, "wb") as f:
+                while chunk := src.read(64 * 1024):
+                    written += len(chunk)
+                    if written > MAX_IMAGE_BYTES:
+                        tmp.unlink(missing_ok=True)
+                        return False
+                    if len(head) < 16:
+                        head += chunk[: 16 - len(head)]
+                    f.write(chunk)
+            if not looks_like_image(head):
+                tmp.unlink(missing_ok=True)
+                return False
+            os.replace(tmp, dest)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+    cache.add(key)
+    return True
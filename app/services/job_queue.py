@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# 任务状态
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# 默认租约时长：worker 需在此时间内发送心跳，否则任务会被其它 worker 重新领取。
+DEFAULT_LEASE_SECONDS = 120.0
+# 单个任务最多领取次数（含因 worker 崩溃、租约过期而被重新领取的次数）。
+DEFAULT_MAX_ATTEMPTS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    video_path TEXT NOT NULL,
+    rename_format TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until);
+"""
+
+
+@dataclass
+class Job:
+    id: int
+    url: str
+    video_path: str
+    rename_format: Optional[str]
+    status: str
+    attempts: int
+    worker: Optional[str]
+    lease_until: Optional[float]
+    result: Optional[Dict[str, Any]]
+    error: Optional[str]
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        return cls(
+            id=row["id"],
+            url=row["url"],
+            video_path=row["video_path"],
+            rename_format=row["rename_format"],
+            status=row["status"],
+            attempts=row["attempts"],
+            worker=row["worker"],
+            lease_until=row["lease_until"],
+            result=json.loads(row["result"]) if row["result"] else None,
+            error=row["error"],
+        )
+
+
+class JobQueue:
+    """基于 SQLite 的刮削任务队列，可放在多台机器共享的存储上。
+
+    worker 通过租约领取任务：领取后须定期 heartbeat 续约，租约过期的任务
+    （worker 崩溃、断网）会被其它 worker 重新领取，直到达到最大尝试次数。
+    不使用 WAL，以兼容网络文件系统；所有写操作都在 BEGIN IMMEDIATE 事务中完成。
+    """
+
+    def __init__(self, path: str | Path, *, timeout: float = 30.0) -> None:
+        self.path = str(path)
+        self._conn = sqlite3.connect(self.path, timeout=timeout, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "JobQueue":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def _write(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = self._conn.execute(sql, params)
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        return cur
+
+    def enqueue(
+        self,
+        url: str,
+        video_path: str,
+        rename_format: Optional[str] = None,
+        *,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> int:
+        now = time.time()
+        cur = self._write(
+            "INSERT INTO jobs (url, video_path, rename_format, max_attempts, created, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (url, video_path, rename_format, max_attempts, now, now),
+        )
+        return int(cur.lastrowid)
+
+    def lease(self, worker: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> Optional[Job]:
+        """领取一个待处理或租约已过期的任务，没有可领取的任务时返回 None。"""
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 租约过期且已用完尝试次数的任务直接标记失败
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = COALESCE(error, '租约过期'), updated = ?"
+                " WHERE status = ? AND lease_until < ? AND attempts >= max_attempts",
+                (FAILED, now, RUNNING, now),
+            )
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? OR (status = ? AND lease_until < ?)"
+                " ORDER BY id LIMIT 1",
+                (PENDING, RUNNING, now),
+            ).fetchone()
+            if row is None:
+                self._conn.execute("COMMIT")
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, lease_until = ?,"
+                " attempts = attempts + 1, updated = ? WHERE id = ?",
+                (RUNNING, worker, now + lease_seconds, now, row["id"]),
+            )
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        return Job.from_row(row)
+
+    def heartbeat(
+        self, job_id: int, worker: str, lease_seconds: float = DEFAULT_LEASE_SECONDS
+    ) -> bool:
+        """续约。返回 False 表示租约已被其它 worker 接管。"""
+        now = time.time()
+        cur = self._write(
+            "UPDATE jobs SET lease_until = ?, updated = ?"
+            " WHERE id = ? AND worker = ? AND status = ?",
+            (now + lease_seconds, now, job_id, worker, RUNNING),
+        )
+        return cur.rowcount == 1
+
+    def complete(self, job_id: int, worker: str, result: Dict[str, Any]) -> bool:
+        cur = self._write(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_until = NULL, updated = ?"
+            " WHERE id = ? AND worker = ? AND status = ?",
+            (DONE, json.dumps(result, ensure_ascii=False), time.time(), job_id, worker, RUNNING),
+        )
+        return cur.rowcount == 1
+
+    def fail(self, job_id: int, worker: str, error: str, *, retry: bool = True) -> bool:
+        """报告失败：可重试且未达最大尝试次数时放回队列，否则标记为 failed。"""
+        cur = self._write(
+            "UPDATE jobs SET status = CASE WHEN ? AND attempts < max_attempts THEN ? ELSE ? END,"
+            " error = ?, lease_until = NULL, updated = ?"
+            " WHERE id = ? AND worker = ? AND status = ?",
+            (int(retry), PENDING, FAILED, error, time.time(), job_id, worker, RUNNING),
+        )
+        return cur.rowcount == 1
+
+    def get(self, job_id: int) -> Optional[Job]:
+        row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def counts(self) -> Dict[str, int]:
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for row in self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+            counts[row["status"]] = row["n"]
+        return counts
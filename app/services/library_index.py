@@ -0,0 +1,335 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from xml.etree.ElementTree import ParseError, iterparse
+
+from app.config import Settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS movies (
+    nfo_path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    number TEXT,
+    number_key TEXT,
+    title TEXT,
+    original_title TEXT,
+    studio TEXT,
+    premiered TEXT,
+    thumb TEXT,
+    actors TEXT NOT NULL DEFAULT '[]',
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS movies_number ON movies (number_key);
+CREATE INDEX IF NOT EXISTS movies_dir ON movies (dir);
+-- 不入索引的 NFO（剧集、演员等非 <movie> NFO，或解析失败的文件）：只记录大小与修改时间，
+-- 未变化时重新扫描直接跳过，不再反复解析
+CREATE TABLE IF NOT EXISTS ignored (
+    nfo_path TEXT PRIMARY KEY,
+    reason TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+_UPSERT = (
+    "INSERT OR REPLACE INTO movies (nfo_path, dir, number, number_key, title,"
+    " original_title, studio, premiered, thumb, actors, mtime_ns, size)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+# movie.nfo 中读取的顶层字段（与 build_movie_nfo 写出的字段对应）-> 记录字段
+_TEXT_FIELDS = {
+    "id": "number",
+    "title": "title",
+    "originaltitle": "original_title",
+    "studio": "studio",
+    "premiered": "premiered",
+    "thumb": "thumb",
+}
+
+# 文件名中的番号，例如 abc-123、ABC123、[xx]ABC-123-C
+_NUMBER_IN_NAME = re.compile(r"(?<![A-Za-z])([A-Za-z]{2,6})-?(\d{2,5})(?!\d)")
+
+
+def number_key(number: Optional[str]) -> str:
+    """番号的比较键：忽略大小写、连字符与数字部分的前导零，ABC-123 / abc123 / abc00123 视为相同。"""
+    key = re.sub(r"[^0-9A-Z]", "", (number or "").upper())
+    return re.sub(r"(?<=[A-Z])0+(?=\d)", "", key)
+
+
+def guess_number(filename: str) -> Optional[str]:
+    """从视频文件名中猜测番号，猜不到时返回 None。"""
+    m = _NUMBER_IN_NAME.search(Path(filename).stem)
+    return f"{m.group(1).upper()}-{m.group(2)}" if m else None
+
+
+@dataclass
+class IndexedMovie:
+    nfo_path: str
+    number: Optional[str] = None
+    title: Optional[str] = None
+    original_title: Optional[str] = None
+    studio: Optional[str] = None
+    premiered: Optional[str] = None
+    thumb: Optional[str] = None
+    actors: List[str] = field(default_factory=list)
+
+    @property
+    def dir(self) -> str:
+        return os.path.dirname(self.nfo_path)
+
+
+@dataclass
+class IndexReport:
+    """一次扫描的统计结果。"""
+
+    total: int = 0
+    parsed: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    failed: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+def parse_nfo(path: str) -> Optional[IndexedMovie]:
+    """用 iterparse 流式读取 movie.nfo 的顶层字段，根元素不是 <movie> 时返回 None。
+
+    每个顶层元素读完即清空，超长的 plot 等内容不会在内存中堆积。
+    """
+    movie = IndexedMovie(nfo_path=path)
+    depth = 0
+    root = None
+    actor_name: Optional[str] = None
+    with open(path, "rb") as f:
+        for event, el in iterparse(f, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 1:
+                    if el.tag != "movie":
+                        return None
+                    root = el
+                continue
+            depth -= 1
+            if depth == 2 and el.tag == "name":
+                actor_name = (el.text or "").strip() or None
+            elif depth == 1:
+                if el.tag == "actor":
+                    if actor_name:
+                        movie.actors.append(actor_name)
+                    actor_name = None
+                elif el.tag in _TEXT_FIELDS:
+                    attr = _TEXT_FIELDS[el.tag]
+                    if getattr(movie, attr) is None:
+                        setattr(movie, attr, (el.text or "").strip() or None)
+                elif el.tag == "uniqueid" and movie.number is None and el.text:
+                    # 其它工具常把番号写在 <uniqueid> 中
+                    movie.number = el.text.strip() or None
+                if root is not None:
+                    root.clear()
+    return movie
+
+
+def _parse_one(path: str) -> Tuple[str, Optional[IndexedMovie], Optional[str]]:
+    try:
+        return path, parse_nfo(path), None
+    except (OSError, ParseError, UnicodeDecodeError) as exc:
+        return path, None, str(exc)
+
+
+def iter_nfos(root: Path) -> Iterator[Tuple[str, int, int]]:
+    """递归列出 root 下的 .nfo 文件，产出 (路径, mtime_ns, 大小)；stat 来自 scandir，无额外系统调用。"""
+    stack = [str(root)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith("."):
+                            stack.append(entry.path)
+                    elif entry.name.lower().endswith(".nfo") and entry.is_file():
+                        st = entry.stat()
+                        yield entry.path, st.st_mtime_ns, st.st_size
+        except OSError:
+            continue
+
+
+class LibraryIndex:
+    """已有 movie.nfo 的本地索引（SQLite），用于快速判断影片是否已刮削过。"""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "LibraryIndex":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def scan(
+        self,
+        root: Path,
+        *,
+        workers: Optional[int] = None,
+        full: bool = False,
+        chunksize: int = 64,
+    ) -> IndexReport:
+        """扫描 root 并更新索引。
+
+        大小与修改时间未变的 NFO 直接跳过（full=True 时全部重新解析），包括上次判定为
+        非 <movie> 或解析失败的文件；变化的文件在进程池中并行解析；root 下已不存在的 NFO 从索引中删除。
+        """
+        report = IndexReport()
+        prefix = str(root).rstrip(os.sep) + os.sep
+        known: Dict[str, Tuple[int, int]] = {}
+        for table in ("movies", "ignored"):
+            known.update(
+                (row["nfo_path"], (row["mtime_ns"], row["size"]))
+                for row in self._conn.execute(
+                    f"SELECT nfo_path, mtime_ns, size FROM {table} WHERE substr(nfo_path, 1, ?) = ?",
+                    (len(prefix), prefix),
+                )
+            )
+
+        stats: Dict[str, Tuple[int, int]] = {}
+        for path, mtime_ns, size in iter_nfos(root):
+            report.total += 1
+            stats[path] = (mtime_ns, size)
+        todo = [p for p, st in stats.items() if full or known.get(p) != st]
+        report.unchanged = report.total - len(todo)
+        gone = [p for p in known if p not in stats]
+
+        rows = []
+        ignored = []
+        if todo:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for path, movie, error in pool.map(_parse_one, todo, chunksize=chunksize):
+                    if error is not None:
+                        report.failed += 1
+                        report.errors.append(f"{path}: {error}")
+                        ignored.append((path, "error", *stats[path]))
+                    elif movie is None:
+                        # 不是 <movie> NFO（剧集、演员等），不入索引
+                        ignored.append((path, "other", *stats[path]))
+                    else:
+                        report.parsed += 1
+                        rows.append(self._row(movie, *stats[path]))
+
+        with self._conn:
+            # 类型变化的文件（例如 movie.nfo 被改坏）需要从另一张表中删除
+            self._conn.executemany("DELETE FROM movies WHERE nfo_path = ?", [i[:1] for i in ignored])
+            self._conn.executemany("DELETE FROM ignored WHERE nfo_path = ?", [r[:1] for r in rows])
+            self._conn.executemany(_UPSERT, rows)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO ignored (nfo_path, reason, mtime_ns, size) VALUES (?, ?, ?, ?)",
+                ignored,
+            )
+            cur = self._conn.executemany(
+                "DELETE FROM movies WHERE nfo_path = ?", [(p,) for p in gone]
+            )
+            report.removed = max(0, cur.rowcount)
+            self._conn.executemany("DELETE FROM ignored WHERE nfo_path = ?", [(p,) for p in gone])
+        return report
+
+    def add(self, nfo_path: Path) -> bool:
+        """解析单个 NFO 并写入索引（刮削写入 movie.nfo 后调用）。返回是否写入。"""
+        movie = parse_nfo(str(nfo_path))
+        if movie is None:
+            return False
+        st = nfo_path.stat()
+        with self._conn:
+            self._conn.execute(_UPSERT, self._row(movie, st.st_mtime_ns, st.st_size))
+        return True
+
+    @staticmethod
+    def _row(movie: IndexedMovie, mtime_ns: int, size: int) -> tuple:
+        return (
+            movie.nfo_path,
+            movie.dir,
+            movie.number,
+            number_key(movie.number) or None,
+            movie.title,
+            movie.original_title,
+            movie.studio,
+            movie.premiered,
+            movie.thumb,
+            json.dumps(movie.actors, ensure_ascii=False),
+            mtime_ns,
+            size,
+        )
+
+    @staticmethod
+    def _movie(row: sqlite3.Row) -> IndexedMovie:
+        return IndexedMovie(
+            nfo_path=row["nfo_path"],
+            number=row["number"],
+            title=row["title"],
+            original_title=row["original_title"],
+            studio=row["studio"],
+            premiered=row["premiered"],
+            thumb=row["thumb"],
+            actors=json.loads(row["actors"]),
+        )
+
+    def find(self, number: str) -> List[IndexedMovie]:
+        rows = self._conn.execute(
+            "SELECT * FROM movies WHERE number_key = ? ORDER BY nfo_path", (number_key(number),)
+        )
+        return [self._movie(r) for r in rows]
+
+    def in_dir(self, directory: Path) -> List[IndexedMovie]:
+        rows = self._conn.execute(
+            "SELECT * FROM movies WHERE dir = ? ORDER BY nfo_path", (str(directory),)
+        )
+        return [self._movie(r) for r in rows]
+
+    def number_keys(self) -> Set[str]:
+        """索引中所有番号的比较键，用于批量生成跳过列表。"""
+        rows = self._conn.execute(
+            "SELECT DISTINCT number_key FROM movies WHERE number_key IS NOT NULL"
+        )
+        return {r[0] for r in rows}
+
+    def filter_unscraped(self, numbers: Iterable[str]) -> List[str]:
+        keys = self.number_keys()
+        return [n for n in numbers if number_key(n) not in keys]
+
+    def count(self) -> int:
+        return int(self._conn.execute("SELECT COUNT(*) FROM movies").fetchone()[0])
+
+
+def get_library_index(settings: Settings) -> LibraryIndex:
+    return LibraryIndex(Path(settings.cache_dir).expanduser() / "library.sqlite")
+
+
+def already_scraped(video: Path, settings: Settings) -> Optional[IndexedMovie]:
+    """该视频已刮削过时返回对应的索引记录。
+
+    同目录中与视频同名（`<视频名>.nfo`）或番号与文件名中的番号相同的 NFO 视为该视频的 NFO；
+    否则按文件名中的番号在整个索引中查找。平铺的下载目录中其它影片的 NFO 不会让该视频被跳过。
+    """
+    number = guess_number(video.name)
+    key = number_key(number) if number else ""
+    with get_library_index(settings) as index:
+        for movie in index.in_dir(video.parent):
+            if Path(movie.nfo_path).stem == video.stem:
+                return movie
+            if key and number_key(movie.number) == key:
+                return movie
+        found = index.find(number) if number else []
+    return found[0] if found else None
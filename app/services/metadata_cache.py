@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+from app.config import Settings
+from app.schemas import MovieMetadata
+from app.scrapers.registry import host_key
+
+
+def cache_key(url: str) -> str:
+    """同一影片在不同镜像域名下的 URL 对应同一个键，例如 javdb565.com/v/abc -> javdb/v/abc。"""
+    return f"{host_key(url)}{urlparse(url).path.rstrip('/')}"
+
+
+class MetadataCache:
+    """刮削结果的本地缓存，每条记录一个 JSON 文件：
+
+    `{"key": ..., "url": ..., "fetched": 时间戳, "metadata": {...}}`
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    def path_for(self, key: str) -> Path:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.json"
+
+    def _read(self, path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(path.read_bytes())
+        except (OSError, ValueError):
+            return None
+
+    def get(self, url: str, max_age: float) -> Optional[MovieMetadata]:
+        """返回未过期的缓存结果；max_age 为秒数。"""
+        entry = self._read(self.path_for(cache_key(url)))
+        if entry is None or time.time() - entry.get("fetched", 0) > max_age:
+            return None
+        try:
+            return MovieMetadata.model_validate(entry["metadata"])
+        except (KeyError, ValueError):
+            return None
+
+    def put(self, url: str, metadata: MovieMetadata) -> None:
+        self.put_entry(
+            {
+                "key": cache_key(url),
+                "url": url,
+                "fetched": time.time(),
+                "metadata": metadata.model_dump(mode="json"),
+            },
+            overwrite=True,
+        )
+
+    def put_entry(self, entry: Dict[str, Any], *, overwrite: bool = False) -> bool:
+        """写入一条记录；overwrite=False 时只在本地没有或本地更旧时写入。返回是否写入。"""
+        path = self.path_for(entry["key"])
+        if not overwrite:
+            existing = self._read(path)
+            if existing is not None and existing.get("fetched", 0) >= entry.get("fetched", 0):
+                return False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+        return True
+
+    def iter_entries(self) -> Iterator[Dict[str, Any]]:
+        if not self.directory.is_dir():
+            return
+        for path in self.directory.glob("??/*.json"):
+            entry = self._read(path)
+            if entry is not None and "key" in entry and "metadata" in entry:
+                yield entry
+
+
+def get_metadata_cache(settings: Settings) -> MetadataCache:
+    return MetadataCache(Path(settings.cache_dir).expanduser() / "metadata")
@@ -1,12 +1,28 @@
 from __future__ import annotations
 
+from typing import TYPE_CHECKING, Callable, Optional
 from xml.etree.ElementTree import Element, SubElement, tostring
 
-from app.schemas import MovieMetadata
+from app.metrics import time_stage
+from app.schemas import MovieMetadata, MovieRecord
 
+if TYPE_CHECKING:
+    from app.services.probe_service import VideoProbe
 
-def build_movie_nfo(metadata: MovieMetadata) -> str:
-    """根据影片元数据生成 Jellyfin/Kodi 兼容的 movie.nfo XML 字符串。"""
+# 与 movie.nfo 同目录保存的元数据 JSON，供离线重新生成 NFO 使用。
+METADATA_SIDECAR_NAME = ".nfofetch.json"
+
+
+@time_stage("nfo_build")
+def build_movie_nfo(
+    metadata: MovieMetadata | MovieRecord, probe: Optional["VideoProbe"] = None
+) -> str:
+    """根据影片元数据生成 Jellyfin/Kodi 兼容的 movie.nfo XML 字符串。
+
+    同时接受 pydantic 模型与轻量的 MovieRecord，两者字段一致。
+    传入 probe（视频文件头部探测结果）时补全 runtime 并写入 <fileinfo><streamdetails>，
+    Jellyfin 无需再对文件运行 ffprobe。
+    """
 
     movie_el = Element("movie")
 
@@ -26,8 +42,9 @@ def build_movie_nfo(metadata: MovieMetadata) -> str:
     set_text(movie_el, "releasedate", metadata.releasedate)
     set_text(movie_el, "premiered", metadata.premiered)
 
-    if metadata.runtime:
-        set_text(movie_el, "runtime", str(metadata.runtime))
+    runtime = metadata.runtime or (probe.runtime_minutes if probe else None)
+    if runtime:
+        set_text(movie_el, "runtime", str(runtime))
 
     # 用番号作为 <id>，便于 Jellyfin 识别
     set_text(movie_el, "id", metadata.number)
@@ -63,6 +80,34 @@ def build_movie_nfo(metadata: MovieMetadata) -> str:
     if metadata.posters:
         set_text(movie_el, "thumb", str(metadata.posters[0]))
 
+    if probe is not None:
+        _add_stream_details(movie_el, probe, set_text)
+
     xml_bytes = tostring(movie_el, encoding="utf-8")
     return xml_bytes.decode("utf-8")
 
+
+def _add_stream_details(
+    movie_el: Element,
+    probe: "VideoProbe",
+    set_text: Callable[[Element, str, Optional[str]], None],
+) -> None:
+    has_video = bool(probe.video_codec or (probe.width and probe.height))
+    if not has_video and not probe.audio_codec:
+        # 只探测到时长时不写入空的 <fileinfo><streamdetails />
+        return
+    streams = SubElement(SubElement(movie_el, "fileinfo"), "streamdetails")
+    if has_video:
+        video_el = SubElement(streams, "video")
+        set_text(video_el, "codec", probe.video_codec)
+        if probe.width and probe.height:
+            set_text(video_el, "aspect", f"{probe.width / probe.height:.2f}")
+            set_text(video_el, "width", str(probe.width))
+            set_text(video_el, "height", str(probe.height))
+        if probe.duration:
+            set_text(video_el, "durationinseconds", str(round(probe.duration)))
+    if probe.audio_codec:
+        audio_el = SubElement(streams, "audio")
+        set_text(audio_el, "codec", probe.audio_codec)
+        if probe.audio_channels:
+            set_text(audio_el, "channels", str(probe.audio_channels))
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Deque, Dict, Iterable, Iterator, Optional
+
+from app.config import Settings
+from app.deadline import bounded, check_deadline
+from app.metrics import PARSE_QUEUED, time_stage
+from app.schemas import MovieMetadata
+from app.scrapers.base import RawPage
+
+# 等待排队名额 / 解析结果期间检查任务预算与取消状态的间隔（秒）。
+_DEADLINE_POLL_SECONDS = 0.5
+
+
+def _parse_in_worker(page: RawPage) -> Dict[str, Any]:
+    """在解析进程中执行：按 URL 选择 scraper 解析页面，返回可序列化的元数据。"""
+    from app.scrapers.base import SplitScraper
+    from app.scrapers.registry import get_scraper
+
+    scraper = get_scraper(page.url)
+    if not isinstance(scraper, SplitScraper):
+        raise TypeError(f"{scraper.name} 不支持拆分下载与解析")
+    return scraper.parse_page(page).model_dump(mode="json")
+
+
+class ParsePool:
+    """详情页解析进程池。
+
+    下载是 I/O 密集的，可以由多个线程并发；而构建 DOM、执行大量 CSS 选择器是 CPU 密集的，
+    且持有 GIL，多线程下解析会成为瓶颈。这里把原始 HTML 交给独立进程解析，返回序列化的元数据。
+
+    同时等待解析的页面数不超过 max_pending：解析跟不上时，提交页面的下载线程在此阻塞，
+    不会继续下载、在内存中堆积页面（背压）。
+    """
+
+    def __init__(self, workers: int, max_pending: Optional[int] = None) -> None:
+        self.workers = max(1, workers)
+        self.max_pending = max_pending or self.workers * 2
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        # spawn：调用方通常是多线程进程（worker 线程、心跳线程），fork 可能复制到被持有的锁
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def submit(self, page: RawPage) -> "Future[Dict[str, Any]]":
+        """提交一个页面；队列已满时阻塞直到有页面解析完成。
+
+        排队期间任务预算用尽或任务被取消时放弃提交并抛出 DeadlineExceeded。
+        """
+        while not self._slots.acquire(timeout=bounded(_DEADLINE_POLL_SECONDS)):
+            check_deadline("parse")
+        PARSE_QUEUED.inc()
+        try:
+            future = self._executor.submit(_parse_in_worker, page)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self) -> None:
+        PARSE_QUEUED.dec()
+        self._slots.release()
+
+    def parse(self, page: RawPage) -> MovieMetadata:
+        """提交并等待解析结果（阶段耗时包含排队时间）。
+
+        与调度器排队一样，等待期间任务预算用尽或任务被取消时放弃等待（尚未开始的解析会被撤销）
+        并抛出 DeadlineExceeded。
+        """
+        with time_stage("parse"):
+            future = self.submit(page)
+            while True:
+                try:
+                    data = future.result(timeout=bounded(_DEADLINE_POLL_SECONDS))
+                    break
+                except FutureTimeout:
+                    try:
+                        check_deadline("parse")
+                    except BaseException:
+                        future.cancel()
+                        raise
+            return MovieMetadata.model_validate(data)
+
+    def parse_many(self, pages: Iterable[RawPage]) -> Iterator[MovieMetadata]:
+        """按输入顺序产出解析结果，同时保持最多 max_pending 个页面在解析中。"""
+        window: Deque["Future[Dict[str, Any]]"] = deque()
+        for page in pages:
+            if len(window) >= self.max_pending:
+                yield MovieMetadata.model_validate(window.popleft().result())
+            window.append(self.submit(page))
+        while window:
+            yield MovieMetadata.model_validate(window.popleft().result())
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "ParsePool":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def parse_workers(settings: Settings) -> int:
+    """解析进程数：显式配置优先，auto（-1）为 CPU 核数，0 表示在调用线程内解析。"""
+    if settings.parse_workers < 0:
+        return os.cpu_count() or 1
+    return settings.parse_workers
+
+
+_pools: Dict[int, ParsePool] = {}
+_lock = threading.Lock()
+
+
+def get_parse_pool(settings: Settings) -> Optional[ParsePool]:
+    """进程内共享的解析进程池；未启用时返回 None。"""
+    workers = parse_workers(settings)
+    if workers <= 0:
+        return None
+    with _lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ParsePool(workers)
+        return pool
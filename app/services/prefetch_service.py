@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from app.config import Settings
+from app.services.image_cache import fetch_original
+from app.services.scheduler import WRITE, priority
+
+# 后台预取的并发下载数（所有会话共享）。
+PREFETCH_WORKERS = 4
+# 预览后超过该时间仍未写入，视为会话已放弃，取消尚未开始的下载。
+PREFETCH_TTL_SECONDS = 15 * 60
+# 写入时等待进行中的预取完成的最长时间，超时后剩余图片按原流程下载。
+PREFETCH_WAIT_SECONDS = 30.0
+
+
+@dataclass
+class PrefetchSession:
+    """一次预览对应的预取任务。"""
+
+    urls: List[str]
+    tenant: str = ""
+    created: float = field(default_factory=time.monotonic)
+    futures: List[Future] = field(default_factory=list)
+    cancelled: threading.Event = field(default_factory=threading.Event)
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        for fut in self.futures:
+            fut.cancel()
+
+
+_sessions: Dict[str, PrefetchSession] = {}
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=PREFETCH_WORKERS, thread_name_prefix="nfofetch-prefetch"
+        )
+    return _executor
+
+
+def _expire_locked(now: float) -> None:
+    for sid in [sid for sid, s in _sessions.items() if now - s.created > PREFETCH_TTL_SECONDS]:
+        _sessions.pop(sid).cancel()
+
+
+def _prefetch_one(session: PrefetchSession, url: str, settings: Settings) -> None:
+    # 排队期间会话可能已被取消
+    if session.cancelled.is_set():
+        return
+    # 预取服务于随后的写入，按写入优先级调度（低于预览页本身的请求）
+    with priority(WRITE, session.tenant):
+        fetch_original(url, settings)
+
+
+def start_prefetch(urls: Iterable[str], settings: Settings, *, tenant: str = "") -> str:
+    """在后台把图片预取到本地图片缓存，返回会话 ID（写入时凭此等待预取完成）。"""
+    unique: List[str] = []
+    for u in urls:
+        s = str(u)
+        if s not in unique:
+            unique.append(s)
+
+    session = PrefetchSession(urls=unique, tenant=tenant)
+    session_id = uuid.uuid4().hex
+    with _lock:
+        _expire_locked(session.created)
+        _sessions[session_id] = session
+    executor = _get_executor()
+    session.futures = [executor.submit(_prefetch_one, session, u, settings) for u in unique]
+    return session_id
+
+
+def cancel_prefetch(session_id: str) -> bool:
+    """取消会话中尚未开始的下载；已下载的图片保留在缓存中。"""
+    with _lock:
+        session = _sessions.pop(session_id, None)
+    if session is None:
+        return False
+    session.cancel()
+    return True
+
+
+def finish_prefetch(session_id: str, timeout: float = PREFETCH_WAIT_SECONDS) -> int:
+    """写入前调用：等待会话中进行中的预取完成并结束会话，返回已完成的下载数。
+
+    未知或已过期的会话直接返回 0，写入流程照常下载。
+    """
+    with _lock:
+        session = _sessions.pop(session_id, None)
+    if session is None:
+        return 0
+    done, _ = wait_futures(session.futures, timeout=timeout)
+    return sum(1 for fut in done if not fut.cancelled())
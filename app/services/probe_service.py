@@ -0,0 +1,355 @@
+from __future__ import annotations
+
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.services.file_service import is_video_file
+
+# moov / Tracks 等头部区块的大小上限，超过即视为异常文件，避免误读大量数据。
+_MAX_HEADER_BYTES = 64 * 1024 * 1024
+
+# 容器内的编码标识 -> Kodi / Jellyfin 使用的编码名
+_MP4_CODECS = {
+    b"avc1": "h264",
+    b"avc3": "h264",
+    b"hvc1": "hevc",
+    b"hev1": "hevc",
+    b"av01": "av1",
+    b"vp09": "vp9",
+    b"mp4v": "mpeg4",
+    b"mp4a": "aac",
+    b"ac-3": "ac3",
+    b"ec-3": "eac3",
+    b"Opus": "opus",
+    b"fLaC": "flac",
+    b".mp3": "mp3",
+}
+_MKV_CODECS = {
+    "V_MPEG4/ISO/AVC": "h264",
+    "V_MPEGH/ISO/HEVC": "hevc",
+    "V_AV1": "av1",
+    "V_VP9": "vp9",
+    "V_VP8": "vp8",
+    "V_MPEG4/ISO/ASP": "mpeg4",
+    "A_AAC": "aac",
+    "A_AC3": "ac3",
+    "A_EAC3": "eac3",
+    "A_DTS": "dts",
+    "A_OPUS": "opus",
+    "A_FLAC": "flac",
+    "A_VORBIS": "vorbis",
+    "A_MPEG/L3": "mp3",
+}
+
+
+@dataclass
+class VideoProbe:
+    """从容器头部读出的视频信息，字段缺失时为 None。"""
+
+    duration: Optional[float] = None  # 秒
+    width: Optional[int] = None
+    height: Optional[int] = None
+    video_codec: Optional[str] = None
+    audio_codec: Optional[str] = None
+    audio_channels: Optional[int] = None
+
+    @property
+    def runtime_minutes(self) -> Optional[int]:
+        if not self.duration:
+            return None
+        return max(1, round(self.duration / 60))
+
+
+# ---- MP4 / MOV ----
+
+
+def _iter_boxes(data: bytes, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """遍历 [start, end) 内的 box，产出 (类型, 内容起始, 内容结束)。"""
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _child(data: bytes, start: int, end: int, kind: bytes) -> Optional[Tuple[int, int]]:
+    for k, s, e in _iter_boxes(data, start, end):
+        if k == kind:
+            return s, e
+    return None
+
+
+def _read_moov(f: BinaryIO, file_size: int) -> Optional[bytes]:
+    """只按 box 头跳转查找 moov，不读取 mdat 等媒体数据。"""
+    pos = 0
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        head = f.read(16)
+        if len(head) < 8:
+            return None
+        size, kind = struct.unpack_from(">I4s", head)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", head, 8)[0]
+            header = 16
+        elif size == 0:
+            size = file_size - pos
+        if size < header:
+            return None
+        if kind == b"moov":
+            if size > _MAX_HEADER_BYTES:
+                return None
+            f.seek(pos + header)
+            body = f.read(size - header)
+            # 文件被截断（例如仍在下载）时 moov 不完整，不据此给出结果
+            return body if len(body) == size - header else None
+        pos += size
+    return None
+
+
+def _probe_mp4(f: BinaryIO, file_size: int) -> Optional[VideoProbe]:
+    moov = _read_moov(f, file_size)
+    if moov is None:
+        return None
+    probe = VideoProbe()
+    end = len(moov)
+
+    mvhd = _child(moov, 0, end, b"mvhd")
+    if mvhd:
+        s = mvhd[0]
+        if moov[s] == 1:
+            timescale, duration = struct.unpack_from(">IQ", moov, s + 20)
+        else:
+            timescale, duration = struct.unpack_from(">II", moov, s + 12)
+        if timescale:
+            probe.duration = duration / timescale
+
+    for kind, ts, te in _iter_boxes(moov, 0, end):
+        if kind != b"trak":
+            continue
+        mdia = _child(moov, ts, te, b"mdia")
+        if not mdia:
+            continue
+        hdlr = _child(moov, mdia[0], mdia[1], b"hdlr")
+        handler = moov[hdlr[0] + 8 : hdlr[0] + 12] if hdlr else b""
+        stbl = None
+        minf = _child(moov, mdia[0], mdia[1], b"minf")
+        if minf:
+            stbl = _child(moov, minf[0], minf[1], b"stbl")
+        stsd = _child(moov, stbl[0], stbl[1], b"stsd") if stbl else None
+        entry = stsd[0] + 8 if stsd else None
+        fourcc = moov[entry + 4 : entry + 8] if entry is not None else b""
+
+        if handler == b"vide" and probe.video_codec is None:
+            probe.video_codec = _MP4_CODECS.get(fourcc, fourcc.decode("latin-1").strip() or None)
+            tkhd = _child(moov, ts, te, b"tkhd")
+            if tkhd:
+                offset = tkhd[0] + (88 if moov[tkhd[0]] == 1 else 76)
+                if offset + 8 <= tkhd[1]:
+                    w, h = struct.unpack_from(">II", moov, offset)
+                    probe.width, probe.height = w >> 16, h >> 16
+            if not probe.width and entry is not None and entry + 36 <= stsd[1]:  # type: ignore[index]
+                probe.width, probe.height = struct.unpack_from(">HH", moov, entry + 32)
+        elif handler == b"soun" and probe.audio_codec is None:
+            probe.audio_codec = _MP4_CODECS.get(fourcc, fourcc.decode("latin-1").strip() or None)
+            if entry is not None and entry + 26 <= stsd[1]:  # type: ignore[index]
+                probe.audio_channels = struct.unpack_from(">H", moov, entry + 24)[0]
+    return probe
+
+
+# ---- Matroska / WebM ----
+
+_EBML = 0x1A45DFA3
+_SEGMENT = 0x18538067
+_INFO = 0x1549A966
+_TRACKS = 0x1654AE6B
+_CLUSTER = 0x1F43B675
+_TIMECODE_SCALE = 0x2AD7B1
+_DURATION = 0x4489
+_TRACK_ENTRY = 0xAE
+_TRACK_TYPE = 0x83
+_CODEC_ID = 0x86
+_VIDEO = 0xE0
+_AUDIO = 0xE1
+_PIXEL_WIDTH = 0xB0
+_PIXEL_HEIGHT = 0xBA
+_CHANNELS = 0x9F
+
+
+def _vint(data: bytes, pos: int, *, keep_marker: bool) -> Tuple[Optional[int], int]:
+    """解析 EBML 变长整数，返回 (值, 新位置)；大小为全 1（未知大小）时值为 None。"""
+    first = data[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("无效的 EBML 变长整数")
+    value = first if keep_marker else first & (mask - 1)
+    all_ones = (first & (mask - 1)) == mask - 1
+    for b in data[pos + 1 : pos + length]:
+        value = (value << 8) | b
+        all_ones = all_ones and b == 0xFF
+    if not keep_marker and all_ones:
+        return None, pos + length
+    return value, pos + length
+
+
+def _iter_elements(data: bytes, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+    pos = start
+    while pos < end:
+        eid, pos = _vint(data, pos, keep_marker=True)
+        size, pos = _vint(data, pos, keep_marker=False)
+        stop = end if size is None else min(pos + size, end)
+        yield eid, pos, stop  # type: ignore[misc]
+        pos = stop
+
+
+def _uint(data: bytes, s: int, e: int) -> int:
+    return int.from_bytes(data[s:e], "big")
+
+
+def _parse_tracks(data: bytes, probe: VideoProbe) -> None:
+    for eid, s, e in _iter_elements(data, 0, len(data)):
+        if eid != _TRACK_ENTRY:
+            continue
+        fields: Dict[int, Tuple[int, int]] = {k: (ks, ke) for k, ks, ke in _iter_elements(data, s, e)}
+        track_type = _uint(data, *fields[_TRACK_TYPE]) if _TRACK_TYPE in fields else None
+        codec = data[slice(*fields[_CODEC_ID])].decode("ascii", "replace") if _CODEC_ID in fields else ""
+        if track_type == 1 and probe.video_codec is None:
+            probe.video_codec = _MKV_CODECS.get(codec, codec.lower() or None)
+            if _VIDEO in fields:
+                sub = {k: (ks, ke) for k, ks, ke in _iter_elements(data, *fields[_VIDEO])}
+                if _PIXEL_WIDTH in sub and _PIXEL_HEIGHT in sub:
+                    probe.width = _uint(data, *sub[_PIXEL_WIDTH])
+                    probe.height = _uint(data, *sub[_PIXEL_HEIGHT])
+        elif track_type == 2 and probe.audio_codec is None:
+            probe.audio_codec = _MKV_CODECS.get(codec, codec.lower() or None)
+            if _AUDIO in fields:
+                sub = {k: (ks, ke) for k, ks, ke in _iter_elements(data, *fields[_AUDIO])}
+                if _CHANNELS in sub:
+                    probe.audio_channels = _uint(data, *sub[_CHANNELS])
+
+
+def _parse_info(data: bytes, probe: VideoProbe) -> None:
+    scale = 1_000_000
+    duration = None
+    for eid, s, e in _iter_elements(data, 0, len(data)):
+        if eid == _TIMECODE_SCALE:
+            scale = _uint(data, s, e)
+        elif eid == _DURATION:
+            duration = struct.unpack(">f" if e - s == 4 else ">d", data[s:e])[0]
+    if duration:
+        probe.duration = duration * scale / 1e9
+
+
+def _probe_mkv(f: BinaryIO, file_size: int) -> Optional[VideoProbe]:
+    """按元素头在 Segment 内跳转，只读取 Info 与 Tracks，遇到 Cluster 即停止。"""
+
+    def read_header(pos: int) -> Tuple[int, Optional[int], int]:
+        f.seek(pos)
+        head = f.read(12)
+        eid, p = _vint(head, 0, keep_marker=True)
+        size, p = _vint(head, p, keep_marker=False)
+        return eid, size, pos + p  # type: ignore[return-value]
+
+    eid, size, pos = read_header(0)
+    if eid != _EBML or size is None:
+        return None
+    eid, seg_size, seg_start = read_header(pos + size)
+    if eid != _SEGMENT:
+        return None
+    seg_end = file_size if seg_size is None else min(file_size, seg_start + seg_size)
+
+    probe = VideoProbe()
+    found = set()
+    pos = seg_start
+    while pos < seg_end and found != {_INFO, _TRACKS}:
+        eid, size, data_start = read_header(pos)
+        if eid == _CLUSTER or size is None:
+            break
+        if eid in (_INFO, _TRACKS):
+            if size > _MAX_HEADER_BYTES:
+                break
+            f.seek(data_start)
+            body = f.read(size)
+            if len(body) < size:
+                return None
+            (_parse_info if eid == _INFO else _parse_tracks)(body, probe)
+            found.add(eid)
+        pos = data_start + size
+    return probe
+
+
+def probe_video(path: Path) -> Optional[VideoProbe]:
+    """读取 MP4/MOV 的 moov 或 MKV/WebM 的 EBML 头部，获取时长、分辨率与编码。
+
+    只按区块头 seek 跳转并读取头部区块，不读取媒体数据、不调用 ffprobe；
+    不支持的格式或解析失败时返回 None。
+    """
+    try:
+        with path.open("rb") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            head = f.read(12)
+            if head[:4] == b"\x1a\x45\xdf\xa3":
+                return _probe_mkv(f, file_size)
+            if head[4:8] in (b"ftyp", b"moov", b"free", b"mdat", b"wide", b"skip"):
+                return _probe_mp4(f, file_size)
+    except (OSError, ValueError, IndexError, struct.error, KeyError):
+        return None
+    return None
+
+
+def main_video_in(movie_dir: Path) -> Optional[Path]:
+    """目录中体积最大的视频文件（通常是正片）。"""
+    best: Optional[Tuple[int, Path]] = None
+    try:
+        with os.scandir(movie_dir) as it:
+            for entry in it:
+                if is_video_file(entry.name) and entry.is_file():
+                    size = entry.stat().st_size
+                    if best is None or size > best[0]:
+                        best = (size, Path(entry.path))
+    except OSError:
+        return None
+    return best[1] if best else None
+
+
+def iter_videos(root: Path) -> Iterator[Path]:
+    """递归列出 root 下的视频文件（跳过隐藏目录，不跟随符号链接目录）。"""
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    elif is_video_file(entry.name) and entry.is_file():
+                        yield Path(entry.path)
+        except OSError:
+            continue
+
+
+def probe_many(paths: Iterable[Path], *, workers: int = 8) -> List[Tuple[Path, Optional[VideoProbe]]]:
+    """用线程池并行探测多个视频（每个文件只有少量 seek + 读取，瓶颈在磁盘延迟）。"""
+    items = list(paths)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(zip(items, pool.map(probe_video, items)))
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import logging
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+from app.config import Settings
+from app.metrics import PROXY_IN_FLIGHT, PROXY_UP
+
+logger = logging.getLogger(__name__)
+
+# 连续失败多少次后暂时剔除该代理。
+EJECT_AFTER_FAILURES = 3
+# 被剔除的代理冷却这么久后进入半开状态：一次健康检查或试探请求成功才重新启用，失败则再冷却一轮。
+EJECT_SECONDS = 30.0
+# 健康检查（到代理本身的 TCP 连接耗时）的间隔与超时。
+HEALTH_CHECK_INTERVAL = 15.0
+HEALTH_CHECK_TIMEOUT = 3.0
+# 所有代理都满载时，等待空闲名额的最长时间；超时后仍按最空闲的代理发出请求。
+LEASE_WAIT_SECONDS = 30.0
+
+
+def parse_proxy_urls(value: Optional[str]) -> List[str]:
+    """NFOFETCH_HTTP_PROXY 支持用逗号或空白分隔多个代理。"""
+    if not value:
+        return []
+    return [p for p in re.split(r"[,\s]+", value) if p]
+
+
+def _display(url: str) -> str:
+    # 指标标签中不出现代理的用户名密码
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc.rsplit('@', 1)[-1]}"
+
+
+@dataclass
+class Proxy:
+    url: str
+    in_flight: int = 0
+    consecutive_failures: int = 0
+    ejected: bool = False
+    ejected_until: float = 0.0
+    # 半开状态下是否已有一个试探请求在进行中
+    trial: bool = False
+    # 健康检查测得的连接耗时（指数滑动平均），用于在负载相同时优先低延迟代理
+    latency: float = 0.0
+    label: str = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.label = _display(self.url)
+
+    def healthy(self, now: float) -> bool:
+        return not self.ejected
+
+    def half_open(self, now: float) -> bool:
+        """已冷却完毕、等待一次成功（健康检查或试探请求）后重新启用。"""
+        return self.ejected and self.ejected_until <= now
+
+
+class ProxyPool:
+    """代理池：按每个代理的并发上限分摊页面与图片请求，连续失败的代理暂时剔除。
+
+    选择策略：在健康且未满载的代理中取进行中请求最少者，其次取延迟最低者。
+    后台线程定期测量到各代理的 TCP 连接耗时。被剔除的代理冷却后进入半开状态：同一时间只放行
+    一个试探请求，试探请求或健康检查成功后才重新启用，失败则重新冷却。
+    未配置代理时 lease() 返回 None，即直连。
+    """
+
+    def __init__(self, urls: List[str], max_concurrency: int) -> None:
+        self.proxies = [Proxy(url) for url in urls]
+        self.max_concurrency = max(1, max_concurrency)
+        self._cond = threading.Condition()
+        self._checker: Optional[threading.Thread] = None
+        for proxy in self.proxies:
+            PROXY_UP.set(1, proxy=proxy.label)
+            PROXY_IN_FLIGHT.set(0, proxy=proxy.label)
+
+    def _pick(self, now: float, *, force: bool) -> Optional[Proxy]:
+        candidates = [
+            p for p in self.proxies if p.healthy(now) or (p.half_open(now) and not p.trial)
+        ] or self.proxies
+        if not force:
+            candidates = [p for p in candidates if p.in_flight < self.max_concurrency]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda p: (p.in_flight, p.latency))
+
+    @contextmanager
+    def lease(self) -> Iterator[Optional[Proxy]]:
+        """占用一个代理名额执行请求。
+
+        块内抛出的连接失败、超时等网络异常计为该代理的一次失败；
+        HTTP 错误状态说明代理本身工作正常，不计入。
+        """
+        if not self.proxies:
+            yield None
+            return
+        self._ensure_checker()
+        deadline = time.monotonic() + LEASE_WAIT_SECONDS
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                proxy = self._pick(now, force=now >= deadline)
+                if proxy is not None:
+                    break
+                self._cond.wait(timeout=max(0.0, deadline - now))
+            trial = proxy.half_open(now) and not proxy.trial
+            if trial:
+                proxy.trial = True
+            proxy.in_flight += 1
+            PROXY_IN_FLIGHT.set(proxy.in_flight, proxy=proxy.label)
+        failed = False
+        # 经该代理拿到了上游响应（含 HTTP 错误状态），足以证明半开的代理已恢复
+        answered = False
+        try:
+            yield proxy
+            answered = True
+        except Exception as exc:
+            failed = _is_proxy_failure(exc)
+            answered = getattr(exc, "response", None) is not None
+            raise
+        finally:
+            with self._cond:
+                proxy.in_flight -= 1
+                PROXY_IN_FLIGHT.set(proxy.in_flight, proxy=proxy.label)
+                if trial:
+                    proxy.trial = False
+                if failed:
+                    self._record_failure(proxy)
+                elif not proxy.ejected:
+                    proxy.consecutive_failures = 0
+                elif answered:
+                    self._readmit(proxy, "试探请求成功")
+                self._cond.notify()
+
+    def _record_failure(self, proxy: Proxy) -> None:
+        now = time.monotonic()
+        proxy.consecutive_failures += 1
+        if proxy.half_open(now):
+            # 半开状态下失败：重新冷却一轮
+            proxy.ejected_until = now + EJECT_SECONDS
+            logger.warning("代理 %s 冷却后仍然失败，继续剔除", proxy.label)
+        elif proxy.consecutive_failures >= EJECT_AFTER_FAILURES and proxy.healthy(now):
+            proxy.ejected = True
+            proxy.ejected_until = now + EJECT_SECONDS
+            PROXY_UP.set(0, proxy=proxy.label)
+            logger.warning(
+                "代理 %s 连续失败 %d 次，暂时剔除", proxy.label, proxy.consecutive_failures
+            )
+
+    def _readmit(self, proxy: Proxy, reason: str) -> None:
+        proxy.ejected = False
+        proxy.consecutive_failures = 0
+        PROXY_UP.set(1, proxy=proxy.label)
+        logger.info("代理 %s 恢复可用（%s）", proxy.label, reason)
+        self._cond.notify_all()
+
+    # ---- 健康检查 ----
+
+    def _ensure_checker(self) -> None:
+        if self._checker is not None:
+            return
+        with self._cond:
+            if self._checker is None:
+                self._checker = threading.Thread(
+                    target=self._check_loop, name="nfofetch-proxy-check", daemon=True
+                )
+                self._checker.start()
+
+    def _check_loop(self) -> None:
+        while True:
+            self.check_all()
+            time.sleep(HEALTH_CHECK_INTERVAL)
+
+    def check_all(self) -> None:
+        for proxy in self.proxies:
+            latency = _probe(proxy.url)
+            with self._cond:
+                now = time.monotonic()
+                if latency is None:
+                    self._record_failure(proxy)
+                    continue
+                proxy.latency = latency if not proxy.latency else 0.7 * proxy.latency + 0.3 * latency
+                if proxy.half_open(now):
+                    # 冷却结束且探测成功：重新启用
+                    self._readmit(proxy, "健康检查成功")
+
+
+def _is_proxy_failure(exc: Optional[BaseException]) -> bool:
+    """异常（或其 __cause__ 链）是否为网络层错误，而非上游返回的 HTTP 错误。"""
+    while exc is not None:
+        if getattr(exc, "response", None) is not None:
+            return False
+        if isinstance(exc, OSError) or type(exc).__module__.startswith(
+            ("httpx", "httpcore", "curl_cffi")
+        ):
+            return True
+        exc = exc.__cause__
+    return False
+
+
+def _probe(url: str) -> Optional[float]:
+    """测量到代理本身的 TCP 连接耗时，不产生任何上游流量。失败返回 None。"""
+    parsed = urlparse(url)
+    if not parsed.hostname:
+        return None
+    port = parsed.port or (443 if parsed.scheme == "https" else 1080 if "socks" in parsed.scheme else 80)
+    start = time.perf_counter()
+    try:
+        with socket.create_connection((parsed.hostname, port), timeout=HEALTH_CHECK_TIMEOUT):
+            return time.perf_counter() - start
+    except OSError:
+        return None
+
+
+_pools: Dict[tuple, ProxyPool] = {}
+_clients: Dict[Optional[str], object] = {}
+_lock = threading.Lock()
+
+
+def get_proxy_pool(settings: Settings) -> ProxyPool:
+    key = (settings.http_proxy, settings.proxy_concurrency)
+    with _lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ProxyPool(
+                parse_proxy_urls(settings.http_proxy), settings.proxy_concurrency
+            )
+        return pool
+
+
+def get_http_client(proxy_url: Optional[str]):
+    """按代理复用 httpx.Client（创建客户端需初始化 SSL 上下文，开销达数十毫秒）。
+
+    httpx.Client 可在多线程间共享；User-Agent 等请求头由调用方按请求传入。
+    """
+    import httpx
+
+    with _lock:
+        client = _clients.get(proxy_url)
+        if client is None:
+            client = _clients[proxy_url] = httpx.Client(
+                proxy=proxy_url,
+                timeout=20.0,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            )
+        return client
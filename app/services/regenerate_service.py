@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from app.schemas import MovieRecord
+from app.services.nfo_service import METADATA_SIDECAR_NAME, build_movie_nfo
+from app.services.probe_service import main_video_in, probe_video
+
+NFO_NAME = "movie.nfo"
+
+# 单个结果状态
+STATUS_UPDATED = "updated"
+STATUS_UNCHANGED = "unchanged"
+STATUS_FAILED = "failed"
+
+
+@dataclass
+class RegenerateReport:
+    """离线重新生成 NFO 的统计结果。"""
+
+    total: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+def iter_sidecars(root: Path) -> Iterator[Path]:
+    """递归查找 root 下所有元数据 sidecar 文件（基于 os.scandir，不跟随符号链接目录）。"""
+    for sidecar, _ in iter_sidecars_with_names(root):
+        yield sidecar
+
+
+def iter_sidecars_with_names(root: Path) -> Iterator[Tuple[Path, List[str]]]:
+    """同 iter_sidecars，并给出 sidecar 所在目录中的全部文件名。
+
+    文件名来自查找时的同一次 scandir，调用方无需再列一次目录（NFS 上列目录开销很大）。
+    """
+    stack = [str(root)]
+    while stack:
+        current = stack.pop()
+        names: List[str] = []
+        sidecar: Optional[Path] = None
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        names.append(entry.name)
+                        if entry.name == METADATA_SIDECAR_NAME:
+                            sidecar = Path(entry.path)
+        except OSError:
+            continue
+        if sidecar is not None:
+            yield sidecar, names
+
+
+def regenerate_one(sidecar_path: str, dry_run: bool = False) -> tuple[str, str, Optional[str]]:
+    """根据 sidecar 重新生成同目录的 movie.nfo，仅在内容变化时写入。
+
+    返回 (sidecar 路径, 状态, 错误信息)，供进程池汇总。
+    """
+    try:
+        sidecar = Path(sidecar_path)
+        # sidecar 由本程序写出，可信，直接构造轻量记录以跳过 pydantic 校验。
+        metadata = MovieRecord.from_dict(json.loads(sidecar.read_bytes()))
+        # 同时探测目录中的正片，保留 <fileinfo><streamdetails>（只读文件头，开销很小）
+        video = main_video_in(sidecar.parent)
+        probe = probe_video(video) if video is not None else None
+        new_bytes = build_movie_nfo(metadata, probe).encode("utf-8")
+
+        nfo_path = sidecar.with_name(NFO_NAME)
+        try:
+            old_bytes: Optional[bytes] = nfo_path.read_bytes()
+        except FileNotFoundError:
+            old_bytes = None
+        if old_bytes == new_bytes:
+            return sidecar_path, STATUS_UNCHANGED, None
+
+        if not dry_run:
+            _write_atomic(nfo_path, new_bytes)
+        return sidecar_path, STATUS_UPDATED, None
+    except Exception as exc:  # noqa: BLE001 - 单个文件失败不影响整体
+        return sidecar_path, STATUS_FAILED, str(exc)
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """经由唯一的临时文件原子地写入 path；同时运行的多次重新生成不会互相覆盖临时文件。"""
+    try:
+        mode = path.stat().st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644
+    fd, tmp_name = tempfile.mkstemp(prefix=path.name + ".", suffix=".tmp", dir=path.parent)
+    tmp = Path(tmp_name)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # mkstemp 创建的文件权限为 0600，沿用原文件权限，媒体服务器仍可读取
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def regenerate_library(
+    root: Path,
+    *,
+    workers: Optional[int] = None,
+    dry_run: bool = False,
+    chunksize: int = 64,
+) -> RegenerateReport:
+    """离线批量重新生成 root 下所有影片的 movie.nfo，不访问网络。
+
+    - 以每个目录中的元数据 sidecar 为数据源，使用进程池并行构建 NFO；
+    - 只有内容发生变化的文件才会（原子地）写回；
+    - dry_run 时只统计需要更新的数量，不写入文件。
+    """
+
+    report = RegenerateReport()
+    sidecars = [str(p) for p in iter_sidecars(root)]
+    report.total = len(sidecars)
+    if not sidecars:
+        return report
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(
+            regenerate_one,
+            sidecars,
+            [dry_run] * len(sidecars),
+            chunksize=chunksize,
+        )
+        for path, status, error in results:
+            if status == STATUS_UPDATED:
+                report.updated += 1
+            elif status == STATUS_UNCHANGED:
+                report.unchanged += 1
+            else:
+                report.failed += 1
+                report.errors.append(f"{path}: {error}")
+    return report
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Tuple
+
+from app.schemas import MovieRecord
+from app.services.file_service import apply_renames, plan_dir_renames
+from app.services.regenerate_service import iter_sidecars_with_names
+
+
+@dataclass
+class LibraryRenamePlan:
+    """整库重命名计划：按目录分组的 (原路径, 新路径)。"""
+
+    root: Path
+    format_str: str
+    dirs: List[Tuple[Path, List[Tuple[Path, Path]]]] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return sum(len(ops) for _, ops in self.dirs)
+
+    def diff_lines(self) -> List[str]:
+        """dry-run 展示用：每个目录一行标题，下面是 `- 原名` / `+ 新名`。"""
+        lines: List[str] = []
+        for movie_dir, ops in self.dirs:
+            lines.append(f"{movie_dir}:")
+            for src, dst in ops:
+                lines.append(f"  - {src.name}")
+                lines.append(f"  + {dst.name}")
+        return lines
+
+
+def plan_library_renames(root: Path, format_str: str) -> LibraryRenamePlan:
+    """为 root 下所有带元数据 sidecar 的影片目录规划重命名（每个目录只列一次）。"""
+    plan = LibraryRenamePlan(root=root, format_str=format_str)
+    # 查找 sidecar 时已列出各目录的文件名，规划重命名直接复用，每个目录只列一次
+    for sidecar, names in sorted(iter_sidecars_with_names(root)):
+        movie_dir = sidecar.parent
+        try:
+            metadata = MovieRecord.from_dict(json.loads(sidecar.read_bytes()))
+            ops = plan_dir_renames(movie_dir, metadata, format_str, names=names)
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            plan.errors.append(f"{movie_dir}: {exc}")
+            continue
+        if ops:
+            plan.dirs.append((movie_dir, ops))
+    return plan
+
+
+def default_journal_path(root: Path) -> Path:
+    return root / f".nfofetch-rename-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+
+
+def apply_library_plan(plan: LibraryRenamePlan, journal_path: Path) -> List[str]:
+    """执行整库重命名计划，每一步先写入撤销日志再重命名。返回失败目录的错误信息。"""
+    errors: List[str] = []
+    with journal_path.open("a", encoding="utf-8") as journal:
+        for movie_dir, ops in plan.dirs:
+            try:
+                apply_renames(ops, journal=journal)
+            except OSError as exc:
+                errors.append(f"{movie_dir}: {exc}")
+        journal.flush()
+        os.fsync(journal.fileno())
+    return errors
+
+
+def undo_renames(journal_path: Path) -> Tuple[int, List[str]]:
+    """按撤销日志逆序还原重命名，返回 (还原数量, 错误信息)。
+
+    目标文件已不存在或原文件名已被占用的步骤会跳过并记录。
+    """
+    steps: List[Tuple[Path, Path]] = []
+    with journal_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                steps.append((Path(entry["src"]), Path(entry["dst"])))
+
+    restored = 0
+    errors: List[str] = []
+    for src, dst in reversed(steps):
+        if not dst.exists():
+            # 写日志后、重命名前中断的步骤
+            continue
+        if src.exists():
+            errors.append(f"无法还原 {dst} -> {src}：原文件名已被占用")
+            continue
+        try:
+            dst.rename(src)
+            restored += 1
+        except OSError as exc:
+            errors.append(f"无法还原 {dst} -> {src}：{exc}")
+    return restored, errors
+
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+from app.config import Settings
+from app.deadline import current_deadline
+from app.metrics import SCHEDULER_QUEUED, SCHEDULER_WAIT_SECONDS
+from app.services.proxy_pool import parse_proxy_urls
+
+# 优先级（数值越小越优先）：交互式预览 > 交互式写入 > 后台批量任务。
+PREVIEW = 0
+WRITE = 1
+BATCH = 2
+PRIORITY_NAMES = {PREVIEW: "preview", WRITE: "write", BATCH: "batch"}
+
+# 始终为交互式请求保留的名额数：后台任务最多同时占用 capacity - INTERACTIVE_RESERVE 个名额，
+# 用户点击后最多等一个进行中的请求结束即可开始。
+INTERACTIVE_RESERVE = 1
+# 设定了任务截止时间时，等待名额期间检查预算 / 取消状态的间隔（秒）。
+_DEADLINE_POLL_SECONDS = 0.5
+# 未配置代理时的默认上游并发数。
+DEFAULT_DIRECT_CONCURRENCY = 8
+
+# 当前上下文的 (优先级, 租户)；租户用于同一优先级内的公平轮转（例如客户端地址、任务 ID）。
+_current: ContextVar[Tuple[int, str]] = ContextVar("nfofetch_priority", default=(BATCH, ""))
+
+
+@contextmanager
+def priority(level: int, tenant: str = "") -> Iterator[None]:
+    """在块内以指定优先级发出上游请求。"""
+    token = _current.set((level, tenant))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def current_priority() -> Tuple[int, str]:
+    return _current.get()
+
+
+class _Waiter:
+    __slots__ = ("level", "granted")
+
+    def __init__(self, level: int) -> None:
+        self.level = level
+        self.granted = False
+
+
+class Scheduler:
+    """上游请求（详情页抓取、图片下载）的优先级调度器。
+
+    所有请求共享 capacity 个名额（即上游的并发预算）。名额空出时优先分配给最高优先级的
+    等待者；同一优先级内按租户轮转，避免单个批量任务或用户占满名额。每个阶段（抓取一页、
+    下载一张图）单独申请名额，因此后台任务在阶段之间会让位给新到的交互式请求。
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(1, capacity)
+        self.batch_limit = max(1, self.capacity - INTERACTIVE_RESERVE)
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._batch_in_use = 0
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Waiter]]"] = {
+            level: OrderedDict() for level in PRIORITY_NAMES
+        }
+
+    @contextmanager
+    def slot(self, stage: str) -> Iterator[None]:
+        """申请一个名额；任务预算在排队期间用尽或任务被取消时放弃排队并抛出 DeadlineExceeded。"""
+        level, tenant = _current.get()
+        name = PRIORITY_NAMES.get(level, "batch")
+        waiter = _Waiter(level)
+        deadline = current_deadline()
+        start = time.perf_counter()
+        with self._cond:
+            self._queues[level].setdefault(tenant, deque()).append(waiter)
+            SCHEDULER_QUEUED.inc(priority=name)
+            self._dispatch_locked()
+            while not waiter.granted:
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                if deadline.expired():
+                    self._withdraw_locked(waiter, tenant)
+                    deadline.check(stage)
+                self._cond.wait(timeout=_DEADLINE_POLL_SECONDS)
+        SCHEDULER_WAIT_SECONDS.observe(time.perf_counter() - start, priority=name, stage=stage)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_use -= 1
+                if level == BATCH:
+                    self._batch_in_use -= 1
+                self._dispatch_locked()
+
+    def _dispatch_locked(self) -> None:
+        granted = False
+        while self._in_use < self.capacity:
+            waiter = self._next_locked()
+            if waiter is None:
+                break
+            waiter.granted = granted = True
+            self._in_use += 1
+            if waiter.level == BATCH:
+                self._batch_in_use += 1
+            SCHEDULER_QUEUED.dec(priority=PRIORITY_NAMES[waiter.level])
+        if granted:
+            self._cond.notify_all()
+
+    def _withdraw_locked(self, waiter: _Waiter, tenant: str) -> None:
+        tenants = self._queues[waiter.level]
+        waiters = tenants.get(tenant)
+        if waiters is not None:
+            waiters.remove(waiter)
+            if not waiters:
+                del tenants[tenant]
+        SCHEDULER_QUEUED.dec(priority=PRIORITY_NAMES[waiter.level])
+
+    def _next_locked(self) -> Optional[_Waiter]:
+        for level in sorted(self._queues):
+            if level == BATCH and self._batch_in_use >= self.batch_limit:
+                continue
+            tenants = self._queues[level]
+            if not tenants:
+                continue
+            tenant, waiters = next(iter(tenants.items()))
+            waiter = waiters.popleft()
+            # 轮转：该租户排到本优先级的末尾
+            del tenants[tenant]
+            if waiters:
+                tenants[tenant] = waiters
+            return waiter
+        return None
+
+
+def upstream_capacity(settings: Settings) -> int:
+    """上游并发预算：显式配置优先，否则为 代理数 × 每代理并发数（直连时为默认值）。"""
+    if settings.upstream_concurrency > 0:
+        return settings.upstream_concurrency
+    proxies = parse_proxy_urls(settings.http_proxy)
+    return len(proxies) * settings.proxy_concurrency if proxies else DEFAULT_DIRECT_CONCURRENCY
+
+
+_schedulers: Dict[int, Scheduler] = {}
+_lock = threading.Lock()
+
+
+def get_scheduler(settings: Settings) -> Scheduler:
+    capacity = upstream_capacity(settings)
+    with _lock:
+        scheduler = _schedulers.get(capacity)
+        if scheduler is None:
+            scheduler = _schedulers[capacity] = Scheduler(capacity)
+        return scheduler
@@ -1,12 +1,244 @@
 from __future__ import annotations
 
+import contextvars
+import queue
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Optional, Sequence
+
 from app.config import Settings
+from app.deadline import Deadline, DeadlineExceeded, current_deadline, job_deadline, note_cut
+from app.metrics import SCRAPES_IN_FLIGHT, record_cache
 from app.schemas import MovieMetadata
+from app.scrapers.base import SplitScraper
 from app.scrapers.registry import get_scraper
+from app.services.metadata_cache import get_metadata_cache
+from app.tracing import span
+
+if TYPE_CHECKING:
+    from app.services.parse_pool import ParsePool
+
+# 多源刮削时默认需要凑齐的字段，凑齐后即返回，不再等待较慢的站点。
+DEFAULT_REQUIRED_FIELDS: tuple[str, ...] = ("title", "number", "premiered", "posters")
+
 
+def scrape_movie(
+    url: str,
+    settings: Settings,
+    *,
+    use_cache: bool = True,
+    parse_pool: Optional[ParsePool] = None,
+) -> MovieMetadata:
+    """根据 URL 选择合适的站点 scraper 并执行刮削。
 
-def scrape_movie(url: str, settings: Settings) -> MovieMetadata:
-    """根据 URL 选择合适的站点 scraper 并执行刮削。"""
+    NFOFETCH_METADATA_CACHE_DAYS 内刮削过（或从缓存包导入过）的影片直接返回缓存结果，
+    use_cache=False 时强制重新刮削并刷新缓存。传入 parse_pool 时，当前线程只负责下载，
+    解析交给进程池（站点不支持拆分时仍在当前线程内完成）。
+    """
     scraper = get_scraper(url)
-    return scraper.scrape(url, settings=settings)
+    cache = get_metadata_cache(settings) if settings.metadata_cache_ttl > 0 else None
+    if cache is not None and use_cache:
+        cached = cache.get(url, settings.metadata_cache_ttl)
+        record_cache("metadata", cached is not None)
+        if cached is not None:
+            return cached
+
+    SCRAPES_IN_FLIGHT.inc()
+    try:
+        with span("scrape_movie", scraper=scraper.name, url=url):
+            if parse_pool is not None and isinstance(scraper, SplitScraper):
+                metadata = parse_pool.parse(scraper.fetch_page(url, settings))
+            else:
+                metadata = scraper.scrape(url, settings=settings)
+    except DeadlineExceeded:
+        note_cut("fetch")
+        raise
+    finally:
+        SCRAPES_IN_FLIGHT.dec()
+    dl = current_deadline()
+    # 已被取消的请求（例如多源刮削中较慢的站点）不再写缓存
+    if cache is not None and not (dl is not None and dl.cancelled.is_set()):
+        try:
+            cache.put(url, metadata)
+        except OSError:
+            pass  # 缓存写入失败不影响刮削结果
+    return metadata
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == []
+
+
+def _field_order(
+    field: str, source_order: Sequence[str], field_priority: Mapping[str, Sequence[str]]
+) -> List[str]:
+    preferred = list(field_priority.get(field, ()))
+    return preferred + [s for s in source_order if s not in preferred]
+
+
+def _pick_fields(
+    results: Mapping[str, MovieMetadata],
+    source_order: Sequence[str],
+    field_priority: Mapping[str, Sequence[str]],
+) -> Dict[str, tuple[str, Any]]:
+    """字段 -> (来源, 值)：每个字段取优先级最高且非空的值，都为空的字段不出现。"""
+    picked: Dict[str, tuple[str, Any]] = {}
+    for field in MovieMetadata.model_fields:
+        for source in _field_order(field, source_order, field_priority):
+            metadata = results.get(source)
+            if metadata is None:
+                continue
+            value = getattr(metadata, field)
+            if not _is_empty(value):
+                picked[field] = (source, value)
+                break
+    return picked
+
+
+def merge_metadata(
+    results: Mapping[str, MovieMetadata],
+    source_order: Sequence[str],
+    field_priority: Optional[Mapping[str, Sequence[str]]] = None,
+) -> Optional[MovieMetadata]:
+    """按字段优先级合并多个站点的刮削结果。
+
+    - source_order：默认的站点优先级（越靠前越优先）；
+    - field_priority：可按字段单独指定站点顺序，例如 {"plot": ["siteb", "javdb"]}，
+      未列出的站点按 source_order 排在其后。
+    每个字段取优先级最高且非空的值；results 为空时返回 None。
+    """
+
+    if not results:
+        return None
+    picked = _pick_fields(results, source_order, field_priority or {})
+    merged: Dict[str, Any] = {field: value for field, (_, value) in picked.items()}
+    merged.setdefault("title", "Unknown Title")
+    return MovieMetadata(**merged)
+
+
+def _settled(
+    picked: Mapping[str, tuple[str, Any]],
+    finished: set[str],
+    source_order: Sequence[str],
+    field_priority: Mapping[str, Sequence[str]],
+    required_fields: Sequence[str],
+) -> bool:
+    """必需字段已凑齐，且每个已取得的字段，排在其来源之前的站点都已返回（或失败）。
+
+    否则较慢但优先级更高的站点可能给出不同的值，此时提前返回会违背字段优先级。
+    """
+    if any(f not in picked for f in required_fields):
+        return False
+    for field, (winner, _) in picked.items():
+        for source in _field_order(field, source_order, field_priority):
+            if source == winner:
+                break
+            if source in source_order and source not in finished:
+                return False
+    return True
+
+
+def scrape_movie_multi(
+    urls: Sequence[str],
+    settings: Settings,
+    *,
+    required_fields: Sequence[str] = DEFAULT_REQUIRED_FIELDS,
+    field_priority: Optional[Mapping[str, Sequence[str]]] = None,
+    timeout: Optional[float] = None,
+    use_cache: bool = True,
+) -> MovieMetadata:
+    """并发请求多个站点（同一影片在各站点的页面 URL），合并字段后返回。
+
+    - 站点优先级与 urls 顺序一致，字段可通过 field_priority 单独调整；
+    - 已返回的结果凑齐 required_fields，且各字段的取值不会再被优先级更高的站点覆盖
+      （排在取值来源之前的站点都已返回或失败）后立即返回，并取消较慢站点的请求
+      （各站点使用任务截止时间的子 Deadline，取消后在下一个检查点放弃并归还上游名额）；
+    - timeout 为整体等待上限（秒），超时后用已有结果合并；设定了任务截止时间时不超过剩余预算；
+    - use_cache=False 时忽略刮削结果缓存，重新请求各站点（见 scrape_movie）；
+    - 所有站点都失败时抛出 RuntimeError，汇总各站点的错误信息。
+    """
+
+    if not urls:
+        raise ValueError("至少需要一个影片页面 URL")
+    if len(urls) == 1:
+        return scrape_movie(urls[0], settings=settings, use_cache=use_cache)
+
+    # 同一 scraper 出现多次时追加序号，保证每个来源名称唯一。
+    sources: List[tuple[str, str]] = []
+    for url in urls:
+        scraper = get_scraper(url)
+        name = scraper.name
+        n = 1
+        while any(name == s for s, _ in sources):
+            n += 1
+            name = f"{scraper.name}#{n}"
+        sources.append((name, url))
+    source_order = [name for name, _ in sources]
+
+    # 使用守护线程而非线程池：提前返回后较慢站点的线程不会阻塞进程退出。
+    done_queue: "queue.Queue[tuple[str, Optional[MovieMetadata], Optional[Exception]]]" = (
+        queue.Queue()
+    )
+    job = current_deadline()
+    # 每个站点一个子 Deadline：提前返回或超时后单独取消未完成的站点
+    children: Dict[str, Deadline] = {
+        name: job.child() if job is not None else Deadline(None) for name, _ in sources
+    }
+
+    def _run(name: str, url: str) -> None:
+        try:
+            with job_deadline(deadline=children[name]):
+                metadata = scrape_movie(url, settings=settings, use_cache=use_cache)
+            done_queue.put((name, metadata, None))
+        except Exception as exc:  # noqa: BLE001 - 单个站点失败不影响其它站点
+            done_queue.put((name, None, exc))
+
+    for name, url in sources:
+        # 复制当前上下文，使追踪等 ContextVar 状态在子线程中同样生效。
+        ctx = contextvars.copy_context()
+        threading.Thread(
+            target=ctx.run,
+            args=(_run, name, url),
+            name=f"nfofetch-scrape-{name}",
+            daemon=True,
+        ).start()
+
+    results: Dict[str, MovieMetadata] = {}
+    finished: set[str] = set()
+    errors: List[str] = []
+    priorities = field_priority or {}
+    job_remaining = job.remaining() if job is not None else None
+    if job_remaining is not None:
+        timeout = max(0.0, job_remaining if timeout is None else min(timeout, job_remaining))
+    deadline = time.monotonic() + timeout if timeout is not None else None
+
+    try:
+        for _ in sources:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                name, metadata, exc = done_queue.get(timeout=remaining)
+            except queue.Empty:
+                if job is not None and job.expired():
+                    note_cut("fetch")
+                break
+            finished.add(name)
+            if metadata is None:
+                if isinstance(exc, DeadlineExceeded):
+                    # 子 Deadline 只在循环结束后才被单独取消，这里是整个任务的预算用尽或被取消
+                    note_cut("fetch")
+                errors.append(f"{name}: {exc}")
+                continue
+            results[name] = metadata
+            # 在补默认标题之前判断，避免 title 字段总被视为已取得
+            picked = _pick_fields(results, source_order, priorities)
+            if _settled(picked, finished, source_order, priorities, required_fields):
+                break
+    finally:
+        for name in source_order:
+            if name not in finished:
+                children[name].cancel()
 
+    merged = merge_metadata(results, source_order, field_priority)
+    if merged is None:
+        raise RuntimeError("所有站点刮削失败：" + "；".join(errors or ["等待超时"]))
+    return merged
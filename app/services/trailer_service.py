@@ -0,0 +1,386 @@
+"""预告片分段并行下载。
+
+预告片动辄数百 MB，单连接下载会占用一个上游名额好几分钟，并拖慢整批任务。这里先用
+`Range: bytes=0-0` 探测文件大小，再按 SEGMENT_BYTES 切分，由多个线程各自经代理池
+（复用各代理的共享连接池）并行下载不同分段：
+
+- 临时文件 `<目标>.part` 预先 truncate 到完整大小（稀疏文件），各分段直接写入自己的偏移；
+- 各分段已写入的字节数保存在 `<目标>.part.segments.json`，中断（失败、超出任务预算、进程退出）
+  后再次下载时，只要远端文件的大小与 ETag / Last-Modified 未变，就从各分段的断点继续；
+- 每个分段单独申请调度器名额，交互式请求不必等整个预告片下载完；
+- 各分段共享全局下载限速（见 app.services.bandwidth），连接数多少不影响总带宽；限速时每次
+  只请求 SEGMENT_WINDOW_SECONDS 秒流量的范围，并在申请名额之前等待限速，不会占着名额睡眠；
+- 全部分段完成且文件大小与远端一致后，才原子地重命名为目标文件。
+
+服务器不支持 Range 时退化为单连接整体下载（无法续传）。
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from app.config import Settings
+from app.deadline import DeadlineExceeded, deadline_expired, note_cut, stage_timeout
+from app.metrics import DOWNLOADED_BYTES, UPSTREAM_RESPONSES, time_stage
+from app.services.bandwidth import MIN_BURST_BYTES, Prepaid, current_rate, prepay
+from app.services.proxy_pool import get_http_client, get_proxy_pool
+from app.services.scheduler import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+# 单个分段的大小：足够大以摊薄请求开销，又足够小使每个分段只短暂占用上游名额。
+SEGMENT_BYTES = 8 * 1024 * 1024
+# 单个分段最多尝试次数（每次从该分段的断点继续）。
+SEGMENT_ATTEMPTS = 3
+# 限速时单次请求的范围：按当前速率计的秒数（至少 MIN_BURST_BYTES），请求之间归还上游名额。
+SEGMENT_WINDOW_SECONDS = 2.0
+# 单次请求的默认超时（连接 / 两个数据块之间）；设定了任务截止时间时取两者中的较小者。
+TRAILER_TIMEOUT = 30.0
+# 预告片大小上限，超过即视为异常响应。
+MAX_TRAILER_BYTES = 4 * 1024 * 1024 * 1024
+PARTIAL_SUFFIX = ".part"
+STATE_SUFFIX = ".segments.json"
+_CHUNK = 256 * 1024
+_TRAILER_EXTENSIONS = (".mp4", ".m4v", ".webm", ".mkv", ".mov")
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class TrailerDownloadError(RuntimeError):
+    """预告片下载失败。retryable 为 False 时重试也无意义（例如远端文件已变化）。"""
+
+    def __init__(self, message: str, *, retryable: bool = True) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def trailer_path_for(video_path: Path, url: str) -> Path:
+    """预告片的保存路径：与视频同目录的 `<视频名>-trailer.<扩展名>`（Jellyfin / Kodi 约定）。"""
+    suffix = Path(urlparse(url).path).suffix.lower()
+    if suffix not in _TRAILER_EXTENSIONS:
+        suffix = ".mp4"
+    return video_path.with_name(f"{video_path.stem}-trailer{suffix}")
+
+
+@dataclass
+class _RemoteFile:
+    size: int
+    ranges: bool
+    # ETag 或 Last-Modified，用于判断续传时远端文件是否变化
+    validator: str
+
+
+class _SegmentState:
+    """各分段的下载进度（已写入字节数）。"""
+
+    def __init__(self, path: Path, url: str, remote: _RemoteFile, segment_bytes: int) -> None:
+        self.path = path
+        self.url = url
+        self.size = remote.size
+        self.validator = remote.validator
+        self.ranges = remote.ranges
+        # 不支持 Range 时整个文件作为一个分段
+        self.segment_bytes = segment_bytes if remote.ranges else max(1, remote.size)
+        self.progress = [0] * max(1, -(-remote.size // self.segment_bytes))
+        self.resumed = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(
+        cls, path: Path, url: str, remote: _RemoteFile, segment_bytes: int
+    ) -> "_SegmentState":
+        """读取上次中断时保存的进度；远端文件或分段方式变化时从头开始。"""
+        state = cls(path, url, remote, segment_bytes)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return state
+        same = (
+            remote.ranges
+            and data.get("url") == url
+            and data.get("size") == state.size
+            and data.get("validator") == state.validator
+            and data.get("segment_bytes") == state.segment_bytes
+            and len(data.get("progress") or []) == len(state.progress)
+        )
+        if same:
+            state.progress = [
+                min(max(0, int(n)), state.span(i)[1] - state.span(i)[0])
+                for i, n in enumerate(data["progress"])
+            ]
+            state.resumed = True
+        return state
+
+    def span(self, index: int) -> Tuple[int, int]:
+        """分段的 [起始, 结束) 偏移。"""
+        start = index * self.segment_bytes
+        return start, min(self.size, start + self.segment_bytes)
+
+    def pending(self) -> List[int]:
+        return [
+            i for i, done in enumerate(self.progress) if done < self.span(i)[1] - self.span(i)[0]
+        ]
+
+    def completed_bytes(self) -> int:
+        return sum(self.progress)
+
+    def advance(self, index: int, nbytes: int) -> None:
+        with self._lock:
+            self.progress[index] += nbytes
+
+    def reset(self, index: int) -> None:
+        with self._lock:
+            self.progress[index] = 0
+
+    def save(self) -> None:
+        # 持锁写入：多个下载线程会在各自的分段结束时保存
+        with self._lock:
+            data = {
+                "url": self.url,
+                "size": self.size,
+                "validator": self.validator,
+                "segment_bytes": self.segment_bytes,
+                "progress": list(self.progress),
+            }
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+
+def _transport_error(exc: Exception, host: str) -> Exception:
+    import httpx
+
+    UPSTREAM_RESPONSES.inc(host=host, status="error")
+    if not isinstance(exc, httpx.TransportError):
+        # 解码失败、重定向过多、URL 无效等：重试也不会成功
+        return TrailerDownloadError(f"{type(exc).__name__}: {exc}", retryable=False)
+    if deadline_expired():
+        # 超时由任务预算缩短或任务已取消：不算作代理故障，也不再重试
+        return DeadlineExceeded("trailer")
+    return TrailerDownloadError(f"{type(exc).__name__}: {exc}")
+
+
+def _probe(url: str, settings: Settings) -> _RemoteFile:
+    """请求第一个字节，得到文件大小、是否支持 Range 以及校验标识。"""
+    import httpx
+
+    host = urlparse(url).netloc.lower()
+    headers = {"User-Agent": settings.user_agent, "Range": "bytes=0-0"}
+    with get_scheduler(settings).slot("trailer"), get_proxy_pool(settings).lease() as proxy:
+        client = get_http_client(proxy.url if proxy else None)
+        timeout = stage_timeout(TRAILER_TIMEOUT, "trailer")
+        try:
+            with client.stream("GET", url, headers=headers, timeout=timeout) as resp:
+                UPSTREAM_RESPONSES.inc(host=host, status=resp.status_code)
+                if resp.status_code >= 400:
+                    raise TrailerDownloadError(
+                        f"HTTP {resp.status_code}", retryable=resp.status_code >= 500
+                    )
+                validator = resp.headers.get("etag") or resp.headers.get("last-modified") or ""
+                m = _CONTENT_RANGE.fullmatch(resp.headers.get("content-range", "").strip())
+                if resp.status_code == 206 and m and m.group(3) != "*":
+                    return _RemoteFile(int(m.group(3)), True, validator)
+                length = resp.headers.get("content-length", "")
+                if resp.status_code == 200 and length.isdigit():
+                    return _RemoteFile(int(length), False, validator)
+                raise TrailerDownloadError("无法确定预告片大小", retryable=False)
+        except (httpx.HTTPError, httpx.InvalidURL) as exc:
+            raise _transport_error(exc, host) from None
+
+
+def _fetch_segment(
+    client,
+    url: str,
+    f: BinaryIO,
+    state: _SegmentState,
+    index: int,
+    settings: Settings,
+    stop: threading.Event,
+    allowance: Prepaid,
+    window: Optional[int] = None,
+) -> None:
+    """下载一个分段（从该分段的断点开始），写入临时文件中对应的偏移。
+
+    给出 window 时（仅支持 Range 时）本次只下载断点之后的 window 字节，分段剩余部分由调用方
+    再次领取；allowance 为申请名额前预先等待过的限速额度。
+    """
+    import httpx
+
+    host = urlparse(url).netloc.lower()
+    start, end = state.span(index)
+    if not state.ranges:
+        state.reset(index)
+    pos = start + state.progress[index]
+    if window is not None and state.ranges:
+        end = min(end, pos + window)
+    headers = {"User-Agent": settings.user_agent}
+    if state.ranges:
+        headers["Range"] = f"bytes={pos}-{end - 1}"
+
+    timeout = stage_timeout(TRAILER_TIMEOUT, "trailer")
+    try:
+        with client.stream("GET", url, headers=headers, timeout=timeout) as resp:
+            UPSTREAM_RESPONSES.inc(host=host, status=resp.status_code)
+            if resp.status_code >= 400:
+                raise TrailerDownloadError(
+                    f"HTTP {resp.status_code}",
+                    retryable=resp.status_code >= 500 or resp.status_code == 429,
+                )
+            if state.ranges:
+                m = _CONTENT_RANGE.fullmatch(resp.headers.get("content-range", "").strip())
+                if (
+                    resp.status_code != 206
+                    or m is None
+                    or int(m.group(1)) != pos
+                    or (m.group(3) != "*" and int(m.group(3)) != state.size)
+                ):
+                    raise TrailerDownloadError(
+                        "分段响应的范围不符（远端文件可能已变化）", retryable=False
+                    )
+            f.seek(pos)
+            for chunk in allowance.throttle(resp.iter_bytes(_CHUNK)):
+                if stop.is_set():
+                    return
+                if deadline_expired():
+                    raise DeadlineExceeded("trailer")
+                if pos + len(chunk) > end:
+                    raise TrailerDownloadError("响应长度超出预期", retryable=False)
+                f.write(chunk)
+                pos += len(chunk)
+                state.advance(index, len(chunk))
+                DOWNLOADED_BYTES.inc(len(chunk), kind="trailer")
+    except (httpx.HTTPError, httpx.InvalidURL) as exc:
+        raise _transport_error(exc, host) from None
+    if pos != end:
+        raise TrailerDownloadError(f"分段 {index} 未下载完整（{pos - start}/{end - start} 字节）")
+
+
+def _run_segments(url: str, part: Path, state: _SegmentState, settings: Settings) -> None:
+    """多个线程从队列领取未完成的分段并行下载；任一分段最终失败时停止其余分段并抛出异常。"""
+    todo: "queue.Queue[int]" = queue.Queue()
+    pending = state.pending()
+    for index in pending:
+        todo.put(index)
+    attempts = [0] * len(state.progress)
+    errors: List[BaseException] = []
+    stop = threading.Event()
+    scheduler = get_scheduler(settings)
+    proxies = get_proxy_pool(settings)
+
+    def worker() -> None:
+        # 无缓冲写入：保存的进度不会超前于已交给操作系统的数据
+        with part.open("r+b", buffering=0) as f:
+            while not stop.is_set():
+                try:
+                    index = todo.get_nowait()
+                except queue.Empty:
+                    return
+                start, end = state.span(index)
+                left = end - start - (state.progress[index] if state.ranges else 0)
+                rate = current_rate(settings)
+                window = None
+                if rate and state.ranges:
+                    window = max(MIN_BURST_BYTES, int(rate * SEGMENT_WINDOW_SECONDS))
+                    left = min(left, window)
+                try:
+                    # 先等待限速再申请名额与代理，限速等待期间不占用上游名额
+                    with prepay(settings, "trailer", left, stop) as allowance:
+                        if stop.is_set():
+                            return
+                        with scheduler.slot("trailer"), proxies.lease() as proxy:
+                            client = get_http_client(proxy.url if proxy else None)
+                            _fetch_segment(
+                                client, url, f, state, index, settings, stop, allowance, window
+                            )
+                    if state.progress[index] < end - start and not stop.is_set():
+                        # 限速下只下载了一个窗口，剩余部分重新排队
+                        todo.put(index)
+                except TrailerDownloadError as exc:
+                    attempts[index] += 1
+                    if exc.retryable and attempts[index] < SEGMENT_ATTEMPTS and not stop.is_set():
+                        todo.put(index)
+                        continue
+                    errors.append(exc)
+                    stop.set()
+                except BaseException as exc:  # noqa: BLE001 - 交给调用方处理
+                    errors.append(exc)
+                    stop.set()
+                finally:
+                    state.save()
+
+    threads = []
+    for i in range(max(1, min(settings.trailer_connections, len(pending)))):
+        # 每个线程复制一份上下文，沿用调用方的调度优先级与任务截止时间
+        ctx = contextvars.copy_context()
+        thread = threading.Thread(
+            target=ctx.run, args=(worker,), name=f"nfofetch-trailer-{i}", daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    if errors:
+        # 优先报告预算用尽，调用方据此记录被跳过的阶段
+        raise next((e for e in errors if isinstance(e, DeadlineExceeded)), errors[0])
+
+
+def download_trailer(url: str, dest: Path, settings: Settings) -> bool:
+    """分段并行下载预告片到 dest，成功（或 dest 已存在）返回 True。
+
+    失败时保留临时文件与分段进度，下次调用从断点继续；远端文件已变化等无法续传的错误
+    则删除临时文件。超出任务预算时记录 `trailer` 阶段被跳过。
+    """
+    if dest.exists():
+        return True
+    part = dest.with_name(dest.name + PARTIAL_SUFFIX)
+    state_path = part.with_name(part.name + STATE_SUFFIX)
+
+    with time_stage("trailer_download", url=url, dest=dest.name):
+        try:
+            remote = _probe(url, settings)
+            if remote.size <= 0 or remote.size > MAX_TRAILER_BYTES:
+                raise TrailerDownloadError(f"预告片大小异常：{remote.size} 字节", retryable=False)
+            state = _SegmentState.load(state_path, url, remote, SEGMENT_BYTES)
+            if not (state.resumed and part.is_file() and part.stat().st_size == remote.size):
+                state = _SegmentState(state_path, url, remote, SEGMENT_BYTES)
+                # 预分配为稀疏文件，各分段直接写入自己的偏移
+                with part.open("wb") as f:
+                    f.truncate(remote.size)
+                state.save()
+            elif state.completed_bytes():
+                logger.info(
+                    "续传预告片 %s：已完成 %d/%d 字节", dest.name, state.completed_bytes(), remote.size
+                )
+
+            _run_segments(url, part, state, settings)
+
+            if state.pending() or part.stat().st_size != remote.size:
+                raise TrailerDownloadError(
+                    f"预告片大小校验失败：{part.stat().st_size}/{remote.size} 字节"
+                )
+            os.replace(part, dest)
+            state_path.unlink(missing_ok=True)
+            return True
+        except DeadlineExceeded as exc:
+            note_cut("trailer")
+            logger.info("预告片下载中止（保留进度以便续传）%s -> %s：%s", url, dest, exc)
+            return False
+        except TrailerDownloadError as exc:
+            logger.warning("预告片下载失败 %s -> %s：%s", url, dest, exc)
+            if not exc.retryable:
+                part.unlink(missing_ok=True)
+                state_path.unlink(missing_ok=True)
+            return False
+        except OSError as exc:
+            logger.warning("预告片写入失败 %s -> %s：%s", url, dest, exc)
+            return False
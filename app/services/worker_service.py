@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from app.config import Settings
+from app.deadline import Deadline, DeadlineExceeded, current_deadline, job_deadline
+from app.services.job_queue import DEFAULT_LEASE_SECONDS, Job, JobQueue
+from app.services.scheduler import BATCH, priority
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _heartbeat_loop(
+    queue_path: str,
+    job_id: int,
+    worker: str,
+    lease_seconds: float,
+    stop: threading.Event,
+    deadline: Deadline,
+) -> None:
+    # sqlite 连接不能跨线程共享，心跳线程使用独立连接
+    with JobQueue(queue_path) as queue:
+        while not stop.wait(lease_seconds / 3):
+            try:
+                if not queue.heartbeat(job_id, worker, lease_seconds):
+                    # 租约已被其它 worker 接管：立即取消本地执行，避免两个节点同时写入同一影片
+                    logger.warning("任务 %s 的租约已被其它 worker 接管，取消本地执行", job_id)
+                    deadline.cancel()
+                    return
+            except Exception as exc:  # noqa: BLE001 - 共享存储短暂不可用时下一轮再试
+                logger.warning("任务 %s 心跳失败：%s", job_id, exc)
+
+
+def run_job(job: Job, settings: Settings) -> dict:
+    """执行单个任务：刮削并写入 NFO / 图片，返回可 JSON 序列化的结果。"""
+    from app.services.file_service import save_assets_for_existing_video
+    from app.services.nfo_service import build_movie_nfo
+    from app.services.parse_pool import get_parse_pool
+    from app.services.probe_service import probe_video
+    from app.services.scrape_service import scrape_movie
+
+    video_path = Path(job.video_path).expanduser()
+    if not video_path.is_file():
+        raise FileNotFoundError(f"视频文件不存在或不可读：{video_path}")
+
+    metadata = scrape_movie(job.url, settings=settings, parse_pool=get_parse_pool(settings))
+    dl = current_deadline()
+    if dl is not None and dl.cancelled.is_set():
+        # 任务已被取消（租约丢失）：不再重命名视频、写入 NFO
+        raise DeadlineExceeded("write", cancelled=True)
+    result = save_assets_for_existing_video(
+        metadata=metadata,
+        nfo_text=build_movie_nfo(metadata, probe_video(video_path)),
+        video_path=video_path,
+        settings=settings,
+        rename_format=job.rename_format or None,
+    )
+    if not result.success:
+        raise RuntimeError(result.message or "写入失败")
+    return result.model_dump(mode="json")
+
+
+def run_worker(
+    queue_path: str,
+    settings: Settings,
+    *,
+    worker: Optional[str] = None,
+    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    poll_interval: float = 2.0,
+    once: bool = False,
+    max_jobs: Optional[int] = None,
+) -> int:
+    """循环领取并执行任务，返回处理的任务数。
+
+    once=True 时队列为空即退出；否则持续轮询。执行期间由后台线程定期续约，
+    worker 崩溃时租约自然过期，任务会被其它节点重新领取。
+    """
+    worker = worker or default_worker_id()
+    processed = 0
+    with JobQueue(queue_path) as queue:
+        while max_jobs is None or processed < max_jobs:
+            job = queue.lease(worker, lease_seconds)
+            if job is None:
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            stop = threading.Event()
+            # 心跳线程发现租约丢失时通过它取消任务：排队的上游请求放弃、下载在下一个数据块处中止
+            dl = Deadline(settings.job_deadline or None)
+            beat = threading.Thread(
+                target=_heartbeat_loop,
+                args=(queue_path, job.id, worker, lease_seconds, stop, dl),
+                name=f"nfofetch-heartbeat-{job.id}",
+                daemon=True,
+            )
+            beat.start()
+            try:
+                # 后台优先级；同一进程内的多个任务按任务轮转分配上游名额
+                with priority(BATCH, f"job:{job.id}"):
+                    with job_deadline(deadline=dl):
+                        result = run_job(job, settings)
+            except Exception as exc:  # noqa: BLE001 - 放回队列（可能由能访问该视频的节点处理），继续下一个任务
+                if dl.cancelled.is_set():
+                    logger.warning("任务 %s 已由其它 worker 接管，放弃本地结果", job.id)
+                else:
+                    queue.fail(job.id, worker, f"{type(exc).__name__}: {exc}", retry=True)
+                    logger.warning("任务 %s 失败：%s", job.id, exc)
+            else:
+                if dl.cancelled.is_set():
+                    logger.warning("任务 %s 已由其它 worker 接管，放弃本地结果", job.id)
+                else:
+                    queue.complete(job.id, worker, result)
+            finally:
+                stop.set()
+                beat.join()
+            processed += 1
+    return processed
+
+
+def run_worker_threads(
+    queue_path: str, settings: Settings, threads: int, *, worker: Optional[str] = None, **kwargs
+) -> int:
+    """在当前进程内以 threads 个线程同时执行 run_worker，返回处理的任务总数。
+
+    下载在各线程内并发进行；配合 NFOFETCH_PARSE_WORKERS，解析交给共享的进程池，
+    不会因 GIL 限制吞吐。
+    """
+    if threads <= 1:
+        return run_worker(queue_path, settings, worker=worker, **kwargs)
+    worker = worker or default_worker_id()
+    counts = [0] * threads
+
+    def _run(i: int) -> None:
+        counts[i] = run_worker(queue_path, settings, worker=f"{worker}:{i}", **kwargs)
+
+    pool = [
+        threading.Thread(target=_run, args=(i,), name=f"nfofetch-worker-{i}", daemon=True)
+        for i in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sum(counts)
+
+
+_embedded: list = []
+
+
+def start_embedded_workers(settings: Settings) -> int:
+    """在当前（Web）进程内启动 settings.embedded_workers 个后台 worker 线程，返回启动的线程数。
+
+    这些线程以后台优先级申请上游名额，不会挤占页面上的交互式刮削。每个进程只启动一次。
+    """
+    if _embedded or not settings.queue_path or settings.embedded_workers <= 0:
+        return 0
+    for i in range(settings.embedded_workers):
+        thread = threading.Thread(
+            target=run_worker,
+            args=(settings.queue_path, settings),
+            kwargs={"worker": f"{default_worker_id()}:embedded-{i}"},
+            name=f"nfofetch-embedded-worker-{i}",
+            daemon=True,
+        )
+        thread.start()
+        _embedded.append(thread)
+    return len(_embedded)
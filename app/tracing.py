@@ -0,0 +1,218 @@
+"""按需追踪单次刮削：记录嵌套 span，输出 Chrome trace JSON（chrome://tracing / Perfetto 可直接打开）。
+
+- 未开启追踪时 `span()` 只做一次 ContextVar 读取，开销可忽略；
+- `start_trace()` 开启一次追踪，可选同时采集 cProfile（输出 .prof）与 tracemalloc（写入 trace 元数据）；
+- 追踪文件写入 NFOFETCH_TRACE_DIR（默认 `./traces`），只保留最近 NFOFETCH_TRACE_KEEP 份。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("nfofetch_trace", default=None)
+
+_SAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def trace_dir() -> Path:
+    return Path(os.getenv("NFOFETCH_TRACE_DIR", "traces")).expanduser()
+
+
+def trace_mode() -> str:
+    """Web 端追踪模式：off（默认，仅请求显式要求时追踪）/ slow（只保存慢请求）/ all。"""
+    return (os.getenv("NFOFETCH_TRACE") or "off").strip().lower()
+
+
+def slow_threshold() -> float:
+    try:
+        return float(os.getenv("NFOFETCH_TRACE_SLOW_SECONDS", "10"))
+    except ValueError:
+        return 10.0
+
+
+class Trace:
+    """一次追踪收集到的事件。多个线程可同时写入。"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.events: List[Dict[str, Any]] = []
+        self.metadata: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self.started_at = time.time()
+        self.duration = 0.0
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def add_span(self, name: str, start_us: float, end_us: float, args: Dict[str, Any]) -> None:
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": round(start_us, 1),
+            "dur": round(end_us - start_us, 1),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = {k: str(v) for k, v in args.items()}
+        with self._lock:
+            self.events.append(event)
+
+    def to_chrome(self) -> Dict[str, Any]:
+        with self._lock:
+            events = list(self.events)
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        for tid in {e["tid"] for e in events}:
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "tid": tid,
+                    "args": {"name": thread_names.get(tid, str(tid))},
+                }
+            )
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "name": self.name,
+                "started_at": self.started_at,
+                "duration_seconds": self.duration,
+                **self.metadata,
+            },
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[None]:
+    """记录一个嵌套 span；当前没有进行中的追踪时为空操作。"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = trace._now_us()
+    try:
+        yield
+    finally:
+        trace.add_span(name, start, trace._now_us(), args)
+
+
+@contextmanager
+def start_trace(
+    name: str,
+    *,
+    keep_if_slower_than: Optional[float] = None,
+    profile: bool = False,
+    memory: bool = False,
+) -> Iterator[Trace]:
+    """开启一次追踪，结束时写出 `<时间>-<name>.trace.json`。
+
+    - keep_if_slower_than：只有总耗时不低于该秒数才写文件（用于只保留慢请求）；
+    - profile：同时用 cProfile 采集当前线程，输出同名 `.prof`（可用 snakeviz 等查看）；
+    - memory：用 tracemalloc 统计峰值内存与分配最多的代码行，写入 trace 元数据。
+    """
+    trace = Trace(name)
+    token = _current.set(trace)
+
+    profiler = None
+    if profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+    started_tracemalloc = False
+    if memory:
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracemalloc = True
+        tracemalloc.reset_peak()
+
+    start_us = trace._now_us()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        with span(name):
+            yield trace
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        trace.duration = (trace._now_us() - start_us) / 1e6
+        _current.reset(token)
+
+        if memory:
+            import tracemalloc
+
+            _, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+            trace.metadata["tracemalloc_peak_bytes"] = peak
+            trace.metadata["tracemalloc_top"] = [str(s) for s in top]
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+        if keep_if_slower_than is None or trace.duration >= keep_if_slower_than:
+            _write_trace(trace, profiler)
+
+
+def _write_trace(trace: Trace, profiler: Any) -> Path:
+    directory = trace_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(trace.started_at))
+    base = f"{stamp}-{int(trace.started_at * 1000) % 1000:03d}-{_SAFE_NAME.sub('_', trace.name)}"
+    path = directory / f"{base}.trace.json"
+    if profiler is not None:
+        prof_path = directory / f"{base}.prof"
+        profiler.dump_stats(str(prof_path))
+        trace.metadata["profile_file"] = prof_path.name
+    path.write_text(json.dumps(trace.to_chrome(), ensure_ascii=False), encoding="utf-8")
+    trace.metadata["trace_file"] = path.name
+    _prune(directory)
+    return path
+
+
+def _prune(directory: Path) -> None:
+    try:
+        keep = int(os.getenv("NFOFETCH_TRACE_KEEP", "100"))
+    except ValueError:
+        keep = 100
+    traces = sorted(directory.glob("*.trace.json"), reverse=True)
+    for old in traces[keep:]:
+        old.unlink(missing_ok=True)
+        old.with_name(old.name.replace(".trace.json", ".prof")).unlink(missing_ok=True)
+
+
+def list_traces(limit: int = 20) -> List[Dict[str, Any]]:
+    """列出最近的追踪文件（新的在前），附带名称与总耗时。"""
+    directory = trace_dir()
+    if not directory.is_dir():
+        return []
+    items: List[Dict[str, Any]] = []
+    for path in sorted(directory.glob("*.trace.json"), reverse=True)[:limit]:
+        try:
+            other = json.loads(path.read_text(encoding="utf-8")).get("otherData", {})
+        except (OSError, ValueError):
+            continue
+        items.append(
+            {
+                "file": path.name,
+                "name": other.get("name"),
+                "started_at": other.get("started_at"),
+                "duration_seconds": other.get("duration_seconds"),
+                "profile_file": other.get("profile_file"),
+            }
+        )
+    return items
@@ -0,0 +1,85 @@
+"""详情页流式读取基准：对比整页下载 + 整页解析 与 提前结束读取 + 只解析所需区块。
+
+    python benchmarks/detail_fetch.py --pages-count 50 --page-padding 200000
+    python benchmarks/detail_fetch.py --pages recorded_pages/   # 使用录制的真实页面
+
+输出每页平均传输字节数、解析耗时，以及两种方式解析结果是否一致。
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_javdb import FAKE_HOST, FakeJavdb, add_fake_arguments, config_from_args  # noqa: E402
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="详情页流式读取基准")
+    parser.add_argument("--pages-count", type=int, default=30, help="请求的详情页数量")
+    parser.add_argument("--page-padding", type=int, default=200 * 1024, help="合成页面末尾填充字节数")
+    add_fake_arguments(parser)
+    args = parser.parse_args(argv)
+
+    import httpx
+    from selectolax.parser import HTMLParser
+
+    from app.scrapers.javdb import JavdbScraper, detail_slice, read_detail_sections
+
+    config = config_from_args(args)
+    config.page_padding = args.page_padding
+    fake = FakeJavdb(config).start()
+    scraper = JavdbScraper()
+
+    full_bytes, lean_bytes = [], []
+    full_parse, lean_parse = [], []
+    mismatches = 0
+    try:
+        with httpx.Client(proxy=fake.address, timeout=30.0) as client:
+            for i in range(args.pages_count):
+                url = f"http://{FAKE_HOST}/v/b{i:05d}"
+
+                resp = client.get(url)
+                full = resp.content
+                full_bytes.append(resp.num_bytes_downloaded)
+                t0 = time.perf_counter()
+                expected = scraper._parse_metadata(HTMLParser(full.decode("utf-8")), base_url=url)
+                full_parse.append(time.perf_counter() - t0)
+
+                with client.stream("GET", url) as resp:
+                    body, _ = read_detail_sections(resp.iter_bytes(16 * 1024))
+                    lean_bytes.append(resp.num_bytes_downloaded)
+                t0 = time.perf_counter()
+                section = detail_slice(body)
+                got = scraper._parse_metadata(HTMLParser(section.decode("utf-8")), base_url=url)
+                lean_parse.append(time.perf_counter() - t0)
+
+                if got.model_dump() != expected.model_dump():
+                    mismatches += 1
+    finally:
+        fake.stop()
+
+    def kib(values) -> str:
+        return f"{statistics.mean(values) / 1024:.1f} KiB"
+
+    def ms(values) -> str:
+        return f"{statistics.mean(values) * 1000:.2f} ms"
+
+    print(f"页面数: {args.pages_count}")
+    print(f"整页:   传输 {kib(full_bytes)}  解析 {ms(full_parse)}")
+    print(f"提前结束: 传输 {kib(lean_bytes)}  解析 {ms(lean_parse)}")
+    saved = 1 - sum(lean_bytes) / sum(full_bytes)
+    print(f"节省传输 {saved:.1%}，解析耗时降至 {sum(lean_parse) / sum(full_parse):.1%}")
+    print(f"解析结果不一致: {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,236 @@
+"""端到端吞吐基准：以本地替身服务器代替 javdb，压测 Web 流程或 CLI。
+
+    # Web：启动 uvicorn 子进程，N 个并发用户各自执行 /scrape/fetch + /scrape
+    python benchmarks/e2e_throughput.py web --users 8 --movies 80 --latency 0.2
+
+    # CLI：并发启动 N 个 `python -m app.cli` 进程
+    python benchmarks/e2e_throughput.py cli --users 4 --movies 20
+
+输出 movies/min、各流程 p50/p99 延迟；Web 模式下额外在压测期间持续请求 /health，
+以其延迟近似事件循环阻塞（event-loop lag）。可用 --min-throughput / --max-p99 作为回归门禁，
+不达标时以非零状态退出。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_javdb import FAKE_HOST, FakeJavdb, add_fake_arguments, config_from_args  # noqa: E402
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _base_env(fake: FakeJavdb, workdir: Path) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["NFOFETCH_HTTP_PROXY"] = fake.address
+    env["NFOFETCH_BROWSE_ROOT"] = str(workdir)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (str(PROJECT_ROOT), env.get("PYTHONPATH", "")) if p
+    )
+    return env
+
+
+def _make_videos(workdir: Path, count: int) -> List[Path]:
+    videos = []
+    for i in range(count):
+        movie_dir = workdir / f"movie-{i:05d}"
+        movie_dir.mkdir(parents=True, exist_ok=True)
+        video = movie_dir / "video.mp4"
+        video.write_bytes(b"\x00" * 1024)
+        videos.append(video)
+    return videos
+
+
+async def _run_web(args: argparse.Namespace, fake: FakeJavdb, workdir: Path) -> Dict[str, object]:
+    import httpx
+
+    port = _free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(args.workers), "--log-level", "warning",
+        ],
+        cwd=str(PROJECT_ROOT),
+        env=_base_env(fake, workdir),
+    )
+    base = f"http://127.0.0.1:{port}"
+    videos = _make_videos(workdir, args.movies)
+    latencies: List[float] = []
+    lags: List[float] = []
+    failures = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for i, video in enumerate(videos):
+        queue.put_nowait((i, video))
+
+    try:
+        async with httpx.AsyncClient(base_url=base, timeout=300.0, trust_env=False) as client:
+            for _ in range(100):
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+
+            done = asyncio.Event()
+
+            async def probe_lag() -> None:
+                while not done.is_set():
+                    t0 = time.perf_counter()
+                    try:
+                        await client.get("/health")
+                        lags.append(time.perf_counter() - t0)
+                    except httpx.TransportError:
+                        pass
+                    await asyncio.sleep(0.05)
+
+            async def user() -> None:
+                nonlocal failures
+                while True:
+                    try:
+                        i, video = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    url = f"http://{FAKE_HOST}/v/m{i:05d}"
+                    t0 = time.perf_counter()
+                    try:
+                        r1 = await client.post("/scrape/fetch", data={"url": url})
+                        r2 = await client.post(
+                            "/scrape", data={"url": url, "video_path": str(video)}
+                        )
+                        ok = (
+                            r1.status_code == 200
+                            and r2.status_code == 200
+                            and "刮削完成" in r2.text
+                        )
+                    except httpx.TransportError:
+                        ok = False
+                    latencies.append(time.perf_counter() - t0)
+                    failures += 0 if ok else 1
+
+            prober = asyncio.create_task(probe_lag())
+            started = time.perf_counter()
+            await asyncio.gather(*(user() for _ in range(args.users)))
+            elapsed = time.perf_counter() - started
+            done.set()
+            await prober
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    return {
+        "elapsed": elapsed,
+        "latencies": latencies,
+        "failures": failures,
+        "lag_p99": _percentile(lags, 99),
+        "lag_max": max(lags) if lags else 0.0,
+    }
+
+
+def _run_cli(args: argparse.Namespace, fake: FakeJavdb, workdir: Path) -> Dict[str, object]:
+    from concurrent.futures import ThreadPoolExecutor
+
+    env = _base_env(fake, workdir)
+    videos = _make_videos(workdir, args.movies)
+
+    def one(item) -> tuple[float, bool]:
+        i, video = item
+        t0 = time.perf_counter()
+        proc = subprocess.run(
+            [
+                sys.executable, "-m", "app.cli",
+                "--url", f"http://{FAKE_HOST}/v/m{i:05d}",
+                "--video", str(video),
+            ],
+            cwd=str(PROJECT_ROOT),
+            env=env,
+            capture_output=True,
+        )
+        return time.perf_counter() - t0, proc.returncode == 0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        results = list(pool.map(one, enumerate(videos)))
+    elapsed = time.perf_counter() - started
+    return {
+        "elapsed": elapsed,
+        "latencies": [r[0] for r in results],
+        "failures": sum(1 for r in results if not r[1]),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="端到端吞吐基准（本地替身服务器）")
+    parser.add_argument("mode", choices=["web", "cli"])
+    parser.add_argument("--users", type=int, default=4, help="并发用户 / 进程数")
+    parser.add_argument("--movies", type=int, default=20, help="总影片数")
+    parser.add_argument("--workers", type=int, default=1, help="Web 模式下 uvicorn worker 数")
+    parser.add_argument("--min-throughput", type=float, default=None, help="movies/min 下限")
+    parser.add_argument("--max-p99", type=float, default=None, help="单部影片 p99 延迟上限（秒）")
+    add_fake_arguments(parser)
+    args = parser.parse_args(argv)
+
+    fake = FakeJavdb(config_from_args(args)).start()
+    try:
+        with tempfile.TemporaryDirectory(prefix="nfofetch-bench-") as tmp:
+            workdir = Path(tmp)
+            if args.mode == "web":
+                result = asyncio.run(_run_web(args, fake, workdir))
+            else:
+                result = _run_cli(args, fake, workdir)
+    finally:
+        fake.stop()
+
+    latencies: List[float] = result["latencies"]  # type: ignore[assignment]
+    elapsed: float = result["elapsed"]  # type: ignore[assignment]
+    throughput = len(latencies) / elapsed * 60 if elapsed else 0.0
+    p99 = _percentile(latencies, 99)
+    print(f"模式: {args.mode}  并发: {args.users}  影片: {len(latencies)}  失败: {result['failures']}")
+    print(f"耗时: {elapsed:.2f} s  吞吐: {throughput:.1f} movies/min")
+    if latencies:
+        print(
+            f"延迟: p50 {_percentile(latencies, 50):.3f} s  p99 {p99:.3f} s  "
+            f"平均 {statistics.mean(latencies):.3f} s"
+        )
+    if "lag_p99" in result:
+        print(f"事件循环延迟(/health): p99 {result['lag_p99']:.3f} s  最大 {result['lag_max']:.3f} s")
+    print(f"替身服务器统计: {fake.stats}")
+
+    failed = False
+    if args.min_throughput is not None and throughput < args.min_throughput:
+        print(f"FAIL 吞吐 {throughput:.1f} < {args.min_throughput}")
+        failed = True
+    if args.max_p99 is not None and p99 > args.max_p99:
+        print(f"FAIL p99 {p99:.3f} > {args.max_p99}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
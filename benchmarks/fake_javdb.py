@@ -0,0 +1,331 @@
+"""本地 javdb 替身服务器：返回录制的（或合成的）详情页与图片，可注入延迟、限速、403/429 与 Cloudflare 质询。
+
+同时作为 HTTP 代理工作：把 NFOFETCH_HTTP_PROXY 指向它，再刮削 `http://javdb.test/v/<id>`
+形式的 URL，即可在不访问真实站点的情况下跑通完整的刮削流程。
+
+    python benchmarks/fake_javdb.py --port 8765 --latency 0.3 --rate-429 0.05
+    NFOFETCH_HTTP_PROXY=http://127.0.0.1:8765 python -m app.cli --url http://javdb.test/v/abc --video /tmp/a.mp4
+
+--pages 指向一个目录时，`/v/<id>` 返回其中的 `<id>.html`（没有时随机选一份），
+否则使用内置的合成详情页。
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import random
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+FAKE_HOST = "javdb.test"
+FAKE_IMAGE_HOST = "img.javdb.test"
+
+_DETAIL_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{number} {title} | JavDB</title></head>
+<body>
+<section class="section"><div class="container">
+<div class="video-detail">
+  <h2 class="title is-4"><strong>{number} </strong><strong class="current-title">{title}</strong></h2>
+  <div class="video-meta-panel"><div class="columns">
+    <div class="column column-video-cover">
+      <a href="http://{image_host}/covers/{vid}.jpg"><img src="http://{image_host}/covers/{vid}.jpg" class="video-cover"></a>
+    </div>
+    <div class="column">
+      <nav class="panel movie-panel-info">
+        <div class="panel-block first-block"><strong>番號:</strong>&nbsp;<span class="value">{number}</span>
+          <a class="button is-white copy-to-clipboard" data-clipboard-text="{number}"></a></div>
+        <div class="panel-block"><strong>日期:</strong>&nbsp;<span class="value">2024-05-{day:02d}</span></div>
+        <div class="panel-block"><strong>時長:</strong>&nbsp;<span class="value">{runtime} 分鍾</span></div>
+        <div class="panel-block"><strong>片商:</strong>&nbsp;<span class="value"><a>FAKE STUDIO</a></span></div>
+        <div class="panel-block"><strong>系列:</strong>&nbsp;<span class="value"><a>Fake Series</a></span></div>
+        <div class="panel-block"><strong>評分:</strong>&nbsp;<span class="value">4.{day}分</span></div>
+        <div class="panel-block"><strong>類別:</strong>&nbsp;<span class="value"><a>單體作品</a>, <a>高畫質</a></span></div>
+        <div class="panel-block"><strong>演員:</strong>&nbsp;<span class="value"><a href="/actors/x">演员{day}</a><strong class="symbol female">♀</strong></span></div>
+      </nav>
+    </div>
+  </div></div>
+</div>
+<div class="tile-images preview-images">
+{trailer}{previews}
+</div>
+{filler}
+</div></section>
+</body></html>
+"""
+
+_CHALLENGE_PAGE = (
+    b"<!DOCTYPE html><html><head><title>Just a moment...</title></head>"
+    b"<body><div id=\"challenge-running\">Checking your browser</div></body></html>"
+)
+
+
+@dataclass
+class FakeConfig:
+    latency: float = 0.0
+    jitter: float = 0.0
+    bandwidth: int = 0  # 每个响应的字节/秒，0 为不限速
+    rate_403: float = 0.0
+    rate_429: float = 0.0
+    challenge_rate: float = 0.0
+    image_size: int = 200 * 1024
+    # 以 stall_rate 的概率让图片响应卡住 stall_seconds 秒（模拟 CDN 边缘节点偶发停顿）
+    stall_rate: float = 0.0
+    stall_seconds: float = 5.0
+    previews: int = 8
+    page_padding: int = 60 * 1024  # 合成页面末尾的填充，模拟真实页面体积
+    # 预告片大小（字节），0 表示合成页面中没有预告片
+    trailer_size: int = 0
+    pages_dir: Optional[Path] = None
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address) -> None:
+        # 客户端提前断开（例如读到所需内容即关闭连接）属于正常情况
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class FakeJavdb:
+    """在后台线程运行的替身服务器。"""
+
+    def __init__(self, config: FakeConfig, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.config = config
+        self.stats: Dict[str, int] = {}
+        self._stats_lock = threading.Lock()
+        self._recorded: List[Path] = (
+            sorted(config.pages_dir.glob("*.html")) if config.pages_dir else []
+        )
+        self._server = _Server((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeJavdb":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-javdb", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    # ---- 内容生成 ----
+
+    def detail_page(self, vid: str) -> bytes:
+        if self._recorded:
+            path = self.config.pages_dir / f"{vid}.html"  # type: ignore[operator]
+            if not path.is_file():
+                path = random.choice(self._recorded)
+            return path.read_bytes()
+        seed = int(hashlib.md5(vid.encode()).hexdigest()[:8], 16)
+        previews = "\n".join(
+            f'  <a class="tile-item" href="http://{FAKE_IMAGE_HOST}/samples/{vid}_l_{i}.jpg">'
+            f'<img src="http://{FAKE_IMAGE_HOST}/samples/{vid}_s_{i}.jpg"></a>'
+            for i in range(self.config.previews)
+        )
+        filler = "<!-- " + "x" * self.config.page_padding + " -->"
+        trailer = (
+            f'  <video id="preview-video"><source src="//{FAKE_IMAGE_HOST}/trailers/{vid}.mp4"'
+            ' type="video/mp4"></video>\n'
+            if self.config.trailer_size
+            else ""
+        )
+        return _DETAIL_TEMPLATE.format(
+            number=f"FAKE-{seed % 1000:03d}",
+            title=f"合成影片 {vid}",
+            vid=vid,
+            day=seed % 9 + 1,
+            runtime=90 + seed % 60,
+            image_host=FAKE_IMAGE_HOST,
+            previews=previews,
+            trailer=trailer,
+            filler=filler,
+        ).encode("utf-8")
+
+    def image(self, path: str) -> bytes:
+        seed = hashlib.sha256(path.encode()).digest()
+        body = seed * (max(0, self.config.image_size - 4) // len(seed) + 1)
+        return b"\xff\xd8\xff\xe0" + body[: max(0, self.config.image_size - 4)]
+
+    def trailer(self, path: str, start: int, end: int) -> bytes:
+        """预告片 [start, end) 区间的内容（按路径确定的重复字节序列，可按任意区间生成）。"""
+        seed = hashlib.sha256(path.encode()).digest()
+        n = max(0, end - start)
+        rotated = seed[start % len(seed) :] + seed[: start % len(seed)]
+        return (rotated * (n // len(seed) + 1))[:n]
+
+    # ---- HTTP 处理 ----
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:  # noqa: D401 - 静默
+                pass
+
+            def do_GET(self) -> None:  # noqa: N802
+                cfg = fake.config
+                # 作为代理时收到的是绝对 URL
+                path = urlparse(self.path).path if "://" in self.path else self.path
+                path = path.split("?", 1)[0]
+
+                delay = cfg.latency + random.uniform(0, cfg.jitter)
+                if delay:
+                    time.sleep(delay)
+
+                roll = random.random()
+                if roll < cfg.challenge_rate:
+                    fake.count("challenge")
+                    self._send(
+                        403,
+                        _CHALLENGE_PAGE,
+                        "text/html; charset=utf-8",
+                        {"Server": "cloudflare", "cf-mitigated": "challenge"},
+                    )
+                    return
+                roll -= cfg.challenge_rate
+                if roll < cfg.rate_403:
+                    fake.count("403")
+                    self._send(403, b"Forbidden", "text/plain")
+                    return
+                roll -= cfg.rate_403
+                if roll < cfg.rate_429:
+                    fake.count("429")
+                    self._send(429, b"Too Many Requests", "text/plain", {"Retry-After": "1"})
+                    return
+
+                if path.startswith("/v/"):
+                    fake.count("page")
+                    body = fake.detail_page(path[3:].strip("/") or "index")
+                    self._send(200, body, "text/html; charset=utf-8")
+                elif path.startswith("/trailers/") and cfg.trailer_size:
+                    fake.count("trailer")
+                    self._send_range(path, cfg.trailer_size)
+                elif path.endswith(".jpg"):
+                    fake.count("image")
+                    if cfg.stall_rate and random.random() < cfg.stall_rate:
+                        fake.count("stall")
+                        time.sleep(cfg.stall_seconds)
+                    self._send(200, fake.image(path), "image/jpeg")
+                else:
+                    fake.count("404")
+                    self._send(404, b"Not Found", "text/plain")
+
+            def _send_range(self, path: str, size: int) -> None:
+                headers = {"Accept-Ranges": "bytes", "ETag": f'"{size:x}"'}
+                m = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", "").strip())
+                if m is None:
+                    self._send(200, fake.trailer(path, 0, size), "video/mp4", headers)
+                    return
+                start = int(m.group(1))
+                end = min(size, int(m.group(2)) + 1) if m.group(2) else size
+                if start >= end:
+                    self._send(416, b"", "text/plain", {"Content-Range": f"bytes */{size}"})
+                    return
+                headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+                self._send(206, fake.trailer(path, start, end), "video/mp4", headers)
+
+            def _send(
+                self,
+                status: int,
+                body: bytes,
+                content_type: str,
+                headers: Optional[Dict[str, str]] = None,
+            ) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                bandwidth = fake.config.bandwidth
+                try:
+                    if not bandwidth:
+                        self.wfile.write(body)
+                        return
+                    chunk = max(1024, bandwidth // 20)
+                    for i in range(0, len(body), chunk):
+                        self.wfile.write(body[i : i + chunk])
+                        time.sleep(len(body[i : i + chunk]) / bandwidth)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        return Handler
+
+
+def add_fake_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", type=float, default=0.0, help="每个响应的固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="额外的随机延迟上限（秒）")
+    parser.add_argument("--bandwidth", type=int, default=0, help="每个响应的限速（字节/秒），0 不限速")
+    parser.add_argument("--rate-403", type=float, default=0.0, help="返回 403 的概率")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--challenge-rate", type=float, default=0.0, help="返回 Cloudflare 质询页的概率")
+    parser.add_argument("--image-size", type=int, default=200 * 1024, help="合成图片大小（字节）")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="图片响应卡住的概率")
+    parser.add_argument("--stall-seconds", type=float, default=5.0, help="图片响应卡住的时长（秒）")
+    parser.add_argument("--trailer-size", type=int, default=0, help="合成预告片大小（字节），0 为没有预告片")
+    parser.add_argument("--pages", default=None, help="录制的详情页目录（<id>.html）")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    return FakeConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        bandwidth=args.bandwidth,
+        rate_403=args.rate_403,
+        rate_429=args.rate_429,
+        challenge_rate=args.challenge_rate,
+        image_size=args.image_size,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds,
+        trailer_size=args.trailer_size,
+        pages_dir=Path(args.pages) if args.pages else None,
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="本地 javdb 替身服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_fake_arguments(parser)
+    args = parser.parse_args(argv)
+
+    fake = FakeJavdb(config_from_args(args), host=args.host, port=args.port).start()
+    print(f"替身服务器已启动：{fake.address}")
+    print(f"export NFOFETCH_HTTP_PROXY={fake.address}")
+    print(f"示例 URL：http://{FAKE_HOST}/v/abc123")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.stop()
+        print(fake.stats)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,94 @@
+"""图片对冲请求基准：模拟 CDN 偶发停顿，对比关闭 / 开启对冲时每部影片下载图片的耗时分布。
+
+    python benchmarks/image_hedging.py --movies 60 --stall-rate 0.03 --stall-seconds 5
+
+每部影片按 file_service 的方式依次下载 1 张封面与 --images-per-movie - 1 张剧照，
+输出每部影片耗时的 p50 / p90 / p99 与对冲请求数。
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_javdb import FAKE_IMAGE_HOST, FakeJavdb, add_fake_arguments, config_from_args  # noqa: E402
+
+
+def _percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _hedges(outcome: str) -> float:
+    from app.metrics import IMAGE_HEDGES
+
+    return sum(v for k, v in IMAGE_HEDGES.snapshot()["samples"] if k == [outcome])
+
+
+def _run(label: str, fake: FakeJavdb, args: argparse.Namespace, hedge_delay) -> None:
+    from app.config import get_settings
+    from app.services import download_service
+
+    # 每轮使用全新的耗时窗口与预算
+    download_service._LATENCY = download_service._LatencyWindow(download_service.HEDGE_WINDOW)
+    download_service._BUDGET = download_service._HedgeBudget()
+    settings = get_settings()
+    settings.http_proxy = fake.address
+    settings.image_hedge_delay = hedge_delay
+    settings.image_hedge_budget = args.budget / 100
+    sent_before = _hedges("sent")
+    won_before = _hedges("won")
+
+    per_movie = []
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for m in range(args.warmup + args.movies):
+            start = time.perf_counter()
+            for i in range(args.images_per_movie):
+                url = f"http://{FAKE_IMAGE_HOST}/samples/{label}{m:04d}_l_{i}.jpg"
+                dest = Path(tmp) / f"{m}_{i}.jpg"
+                if not download_service.download_image(url, dest, settings):
+                    failures += 1
+            if m >= args.warmup:
+                per_movie.append(time.perf_counter() - start)
+
+    sent = _hedges("sent") - sent_before
+    won = _hedges("won") - won_before
+    images = (args.warmup + args.movies) * args.images_per_movie
+    print(
+        f"{label:>4}: p50 {statistics.median(per_movie):.2f}s  "
+        f"p90 {_percentile(per_movie, 0.9):.2f}s  p99 {_percentile(per_movie, 0.99):.2f}s  "
+        f"最慢 {max(per_movie):.2f}s  对冲 {sent:.0f}/{images}（先完成 {won:.0f}）  失败 {failures}"
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="图片对冲请求基准")
+    parser.add_argument("--movies", type=int, default=60, help="统计的影片数")
+    parser.add_argument("--warmup", type=int, default=5, help="预热影片数（用于积累耗时样本，不计入统计）")
+    parser.add_argument("--images-per-movie", type=int, default=9)
+    parser.add_argument("--budget", type=float, default=10.0, help="对冲预算（百分比）")
+    add_fake_arguments(parser)
+    parser.set_defaults(latency=0.05, jitter=0.05, stall_rate=0.03)
+    args = parser.parse_args(argv)
+
+    fake = FakeJavdb(config_from_args(args)).start()
+    try:
+        _run("off", fake, args, 0.0)
+        _run("auto", fake, args, None)
+    finally:
+        fake.stop()
+    print(fake.stats)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,82 @@
+"""导入耗时基准：用 `python -X importtime` 测量模块的累计导入时间并与预算比较。
+
+批量脚本会成千上万次地启动 CLI，启动开销直接决定吞吐。用法：
+
+    python benchmarks/import_time.py                 # 使用默认预算
+    python benchmarks/import_time.py --budget app.cli=30 --repeat 10
+
+任一模块超出预算（毫秒，取多次运行的最小值）时以非零状态退出，可直接用作 CI 门禁。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# 模块 -> 累计导入耗时预算（毫秒）
+DEFAULT_BUDGETS: Dict[str, float] = {
+    "app.cli": 50.0,
+    "app.main": 1500.0,
+}
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s+(\S+)\s*$")
+
+
+def measure_import_ms(module: str) -> float:
+    """在全新解释器中导入 module，返回其累计导入耗时（毫秒）。"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (str(PROJECT_ROOT), env.get("PYTHONPATH", "")) if p
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=str(PROJECT_ROOT),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败：\n{proc.stderr}")
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m and m.group(3) == module:
+            return int(m.group(2)) / 1000.0
+    raise RuntimeError(f"未在 importtime 输出中找到 {module}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="检查模块导入耗时是否在预算内")
+    parser.add_argument(
+        "--budget",
+        action="append",
+        default=[],
+        metavar="MODULE=MS",
+        help="覆盖或新增模块预算，可重复指定",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="每个模块重复测量次数")
+    args = parser.parse_args(argv)
+
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in args.budget:
+        module, _, ms = item.partition("=")
+        budgets[module.strip()] = float(ms)
+
+    failed = False
+    for module, budget in budgets.items():
+        best = min(measure_import_ms(module) for _ in range(max(1, args.repeat)))
+        ok = best <= budget
+        failed = failed or not ok
+        mark = "OK  " if ok else "FAIL"
+        print(f"{mark} {module:<20} {best:8.1f} ms  (预算 {budget:.0f} ms)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
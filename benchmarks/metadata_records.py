@@ -0,0 +1,90 @@
+"""元数据表示基准：比较 MovieMetadata（完整校验 / model_construct）与 MovieRecord
+构造 N 条记录的耗时与内存占用。
+
+    python benchmarks/metadata_records.py            # 默认 100k 条
+    python benchmarks/metadata_records.py -n 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.schemas import Actor, MovieMetadata, MovieRecord  # noqa: E402
+
+
+def _sample(i: int) -> Dict[str, Any]:
+    base = f"https://c0.jdbstatic.com/samples/ab/{i:06d}"
+    return {
+        "title": f"ABC-{i:03d} 标题 {i}",
+        "number": f"ABC-{i:03d}",
+        "plot": None,
+        "year": 2024,
+        "premiered": "2024-01-01",
+        "releasedate": "2024-01-01",
+        "runtime": 120,
+        "genres": ["VR", "単体作品"],
+        "tags": [],
+        "actors": [{"name": "演员甲", "role": None, "thumb": None}],
+        "studio": "IDEA POCKET",
+        "label": None,
+        "series": None,
+        "directors": ["导演乙"],
+        "rating": 4.2,
+        "posters": [f"https://c0.jdbstatic.com/covers/ab/{i:06d}.jpg"],
+        "art": [f"{base}_l_{k}.jpg" for k in range(8)],
+        "source_url": f"https://javdb.com/v/{i:06d}",
+    }
+
+
+def _construct_unvalidated(d: Dict[str, Any]) -> MovieMetadata:
+    data = dict(d)
+    data["actors"] = [Actor.model_construct(**a) for a in d["actors"]]
+    return MovieMetadata.model_construct(**data)
+
+
+CASES: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "MovieMetadata(校验)": lambda d: MovieMetadata(**d),
+    "MovieMetadata.model_construct": _construct_unvalidated,
+    "MovieRecord.from_dict": MovieRecord.from_dict,
+}
+
+
+def run_case(build: Callable[[Dict[str, Any]], Any], samples: List[Dict[str, Any]]):
+    gc.collect()
+    start = time.perf_counter()
+    objs = [build(d) for d in samples]
+    elapsed = time.perf_counter() - start
+    del objs
+
+    gc.collect()
+    tracemalloc.start()
+    objs = [build(d) for d in samples]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objs
+    return elapsed, current
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="比较元数据表示的构造耗时与内存")
+    parser.add_argument("-n", type=int, default=100_000, help="记录条数")
+    args = parser.parse_args(argv)
+
+    samples = [_sample(i) for i in range(args.n)]
+    print(f"{'表示':<32}{'耗时(s)':>10}{'内存(MiB)':>12}{'字节/条':>10}")
+    for name, build in CASES.items():
+        elapsed, mem = run_case(build, samples)
+        print(f"{name:<32}{elapsed:>10.3f}{mem / 2**20:>12.1f}{mem / args.n:>10.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
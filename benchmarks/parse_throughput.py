@@ -0,0 +1,101 @@
+"""详情页解析吞吐基准：对比线程内解析（受 GIL 限制）与解析进程池在不同进程数下的吞吐。
+
+    python benchmarks/parse_throughput.py --pages recorded_pages/       # 使用录制的真实页面
+    python benchmarks/parse_throughput.py --pages-count 2000 --previews 40
+
+页面先按 fetch_page 的方式截取所需区块，再分别交给：
+- threads：与 CPU 核数相同的线程，在当前进程内解析；
+- pool=N：N 个解析进程（ParsePool.parse_many，最多 2N 个页面在途）。
+输出每秒解析页数与相对 pool=1 的加速比，并核对各方式的解析结果一致。
+可用 --min-speedup 作为回归门禁（最大进程数下的加速比），不达标时以非零状态退出。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_javdb import FAKE_HOST, FakeConfig, FakeJavdb  # noqa: E402
+
+
+def _load_pages(args: argparse.Namespace) -> List[bytes]:
+    if args.pages:
+        recorded = [p.read_bytes() for p in sorted(Path(args.pages).glob("*.html"))]
+        if not recorded:
+            raise SystemExit(f"{args.pages} 中没有 .html 文件")
+        return [recorded[i % len(recorded)] for i in range(args.pages_count)]
+    fake = FakeJavdb(FakeConfig(previews=args.previews)).start()
+    try:
+        return [fake.detail_page(f"p{i:05d}") for i in range(args.pages_count)]
+    finally:
+        fake.stop()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="详情页解析吞吐基准")
+    parser.add_argument("--pages", default=None, help="录制的详情页目录（*.html），默认使用合成页面")
+    parser.add_argument("--pages-count", type=int, default=1000, help="解析的页面数（录制页面循环使用）")
+    parser.add_argument("--previews", type=int, default=8, help="合成页面的预览图数量")
+    parser.add_argument(
+        "--max-workers", type=int, default=os.cpu_count() or 1, help="测试的最大解析进程数，默认 CPU 核数"
+    )
+    parser.add_argument("--min-speedup", type=float, default=None, help="最大进程数下要求的最低加速比")
+    args = parser.parse_args(argv)
+
+    from app.scrapers.base import RawPage
+    from app.scrapers.javdb import JavdbScraper, detail_slice
+    from app.services.parse_pool import ParsePool
+
+    scraper = JavdbScraper()
+    pages = [
+        RawPage(url=f"http://{FAKE_HOST}/v/p{i:05d}", body=detail_slice(body))
+        for i, body in enumerate(_load_pages(args))
+    ]
+    expected = [scraper.parse_page(p).model_dump() for p in pages]
+    print(f"页面数: {len(pages)}  平均区块大小: {sum(len(p.body) for p in pages) / len(pages) / 1024:.1f} KiB")
+    print(f"CPU 核数: {os.cpu_count()}")
+
+    mismatches = 0
+    rates = {}
+
+    threads = args.max_workers
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        got = list(pool.map(scraper.parse_page, pages))
+    rates["threads"] = len(pages) / (time.perf_counter() - start)
+    mismatches += sum(g.model_dump() != e for g, e in zip(got, expected))
+    print(f"threads={threads:<3} {rates['threads']:8.0f} 页/秒")
+
+    counts = sorted({1, *(n for n in (2, 4, 8, 16, 32, 64) if n < args.max_workers), args.max_workers})
+    for n in counts:
+        with ParsePool(n) as pool:
+            # 预热：启动进程并完成导入，不计入耗时
+            list(pool.parse_many(pages[: n * 2]))
+            start = time.perf_counter()
+            got = list(pool.parse_many(pages))
+            rates[n] = len(pages) / (time.perf_counter() - start)
+        mismatches += sum(g.model_dump() != e for g, e in zip(got, expected))
+        speedup = rates[n] / rates[1]
+        print(f"pool={n:<6} {rates[n]:8.0f} 页/秒  加速比 {speedup:5.2f}  并行效率 {speedup / n:6.1%}")
+
+    print(f"解析结果不一致: {mismatches}")
+    if mismatches:
+        return 1
+    best = rates[counts[-1]] / rates[1]
+    if args.min_speedup is not None and best < args.min_speedup:
+        print(f"加速比 {best:.2f} 低于要求的 {args.min_speedup}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
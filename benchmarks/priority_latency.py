@@ -0,0 +1,97 @@
+"""优先级调度基准：后台批量刮削占满上游名额时，测量交互式预览（抓取详情页 + 下载封面）的延迟。
+
+    python benchmarks/priority_latency.py --batch-threads 16 --probes 20 --latency 0.2
+
+依次以两种方式发出同样的交互式请求：与批量任务同为 batch 优先级（相当于没有调度），
+以及 preview 优先级。批量任务每部影片抓取详情页并依次下载全部图片。
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_javdb import FAKE_HOST, FakeJavdb, add_fake_arguments, config_from_args  # noqa: E402
+
+
+def _percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="优先级调度基准")
+    parser.add_argument("--batch-threads", type=int, default=16, help="并发的批量任务数")
+    parser.add_argument("--probes", type=int, default=20, help="每种方式测量的交互式请求数")
+    parser.add_argument("--capacity", type=int, default=4, help="上游并发名额")
+    add_fake_arguments(parser)
+    parser.set_defaults(latency=0.2, image_size=20 * 1024)
+    args = parser.parse_args(argv)
+
+    from app.config import get_settings
+    from app.services.download_service import download_image
+    from app.services.scheduler import BATCH, PREVIEW, priority
+    from app.services.scrape_service import scrape_movie
+
+    fake = FakeJavdb(config_from_args(args)).start()
+    settings = get_settings()
+    settings.http_proxy = fake.address
+    settings.proxy_concurrency = args.capacity
+    settings.metadata_cache_ttl = 0
+    settings.image_hedge_delay = 0.0
+    stop = threading.Event()
+    tmp = Path(tempfile.mkdtemp())
+
+    def batch_loop(n: int) -> None:
+        i = 0
+        with priority(BATCH, f"job:{n}"):
+            while not stop.is_set():
+                meta = scrape_movie(f"http://{FAKE_HOST}/v/bat{n}x{i}", settings)
+                for j, url in enumerate(list(meta.posters) + list(meta.art)):
+                    if stop.is_set():
+                        break
+                    download_image(str(url), tmp / f"b{n}_{i}_{j}.jpg", settings)
+                i += 1
+
+    def probe(label: str, level: int) -> list:
+        times = []
+        for k in range(args.probes):
+            start = time.perf_counter()
+            with priority(level, "user"):
+                meta = scrape_movie(f"http://{FAKE_HOST}/v/{label}{k}", settings)
+                download_image(str(meta.posters[0]), tmp / f"{label}{k}.jpg", settings)
+            times.append(time.perf_counter() - start)
+            time.sleep(0.2)
+        return times
+
+    threads = [threading.Thread(target=batch_loop, args=(n,), daemon=True) for n in range(args.batch_threads)]
+    for t in threads:
+        t.start()
+    time.sleep(2.0)
+    try:
+        for label, level in (("as-batch", BATCH), ("preview", PREVIEW)):
+            times = probe(label, level)
+            print(
+                f"{label:>8}: p50 {statistics.median(times):.2f}s  p90 {_percentile(times, 0.9):.2f}s  "
+                f"最慢 {max(times):.2f}s"
+            )
+    finally:
+        stop.set()
+        for t in threads:
+            t.join(timeout=30)
+        fake.stop()
+    print(fake.stats)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
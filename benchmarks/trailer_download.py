@@ -0,0 +1,97 @@
+"""预告片分段下载基准：在每连接限速的替身 CDN 上对比不同连接数的下载耗时，并验证断点续传。
+
+    python benchmarks/trailer_download.py --trailer-size 67108864 --bandwidth 4194304
+    python benchmarks/trailer_download.py --connections 1 4 8 --resume
+
+每种连接数各下载一次，输出耗时与吞吐，并逐字节核对内容；指定 --resume 时，再以最大连接数
+下载一次并在约一半耗时处（用任务预算）中断，然后续传完成，输出续传时实际下载的字节数。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_javdb import FAKE_IMAGE_HOST, FakeJavdb, add_fake_arguments, config_from_args  # noqa: E402
+
+
+def _downloaded(kind: str = "trailer") -> float:
+    from app.metrics import DOWNLOADED_BYTES
+
+    return sum(v for labels, v in DOWNLOADED_BYTES.snapshot()["samples"] if labels == [kind])
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="预告片分段下载基准")
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 2, 4, 8], help="测试的连接数")
+    parser.add_argument("--resume", action="store_true", help="验证中断后的断点续传")
+    add_fake_arguments(parser)
+    parser.set_defaults(trailer_size=64 * 1024 * 1024, bandwidth=4 * 1024 * 1024)
+    args = parser.parse_args(argv)
+
+    fake = FakeJavdb(config_from_args(args)).start()
+    os.environ["NFOFETCH_HTTP_PROXY"] = fake.address
+    # 替身服务器同时充当唯一的代理：放宽每代理并发与上游名额，避免它们成为瓶颈
+    os.environ.setdefault("NFOFETCH_PROXY_CONCURRENCY", str(max(args.connections)))
+    os.environ.setdefault("NFOFETCH_UPSTREAM_CONCURRENCY", str(max(args.connections) + 1))
+
+    from app.config import get_settings
+    from app.deadline import job_deadline
+    from app.services.trailer_service import download_trailer
+
+    settings = get_settings()
+    url = f"http://{FAKE_IMAGE_HOST}/trailers/bench.mp4"
+    expected = fake.trailer("/trailers/bench.mp4", 0, args.trailer_size)
+    size_mib = args.trailer_size / 1024 / 1024
+    print(f"预告片 {size_mib:.0f} MiB，每连接限速 {args.bandwidth / 1024 / 1024:.1f} MiB/s")
+    failures = 0
+    elapsed_by_n = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for n in args.connections:
+                dest = Path(tmp) / f"c{n}-trailer.mp4"
+                start = time.perf_counter()
+                ok = download_trailer(url, dest, replace(settings, trailer_connections=n))
+                elapsed = elapsed_by_n[n] = time.perf_counter() - start
+                same = ok and dest.read_bytes() == expected
+                failures += not same
+                print(
+                    f"连接数 {n:<3} 耗时 {elapsed:6.2f}s  {size_mib / elapsed:6.1f} MiB/s  "
+                    f"内容{'一致' if same else '不一致'}"
+                )
+
+            if args.resume:
+                n = max(args.connections)
+                cut_after = elapsed_by_n[n] / 2
+                dest = Path(tmp) / "resume-trailer.mp4"
+                resumable = replace(settings, trailer_connections=n)
+                with job_deadline(cut_after):
+                    first = download_trailer(url, dest, resumable)
+                before = _downloaded()
+                start = time.perf_counter()
+                ok = download_trailer(url, dest, resumable)
+                elapsed = time.perf_counter() - start
+                fetched = (_downloaded() - before) / 1024 / 1024
+                same = ok and dest.read_bytes() == expected
+                failures += first or not same
+                print(
+                    f"续传：首次在 {cut_after:.2f}s 时中断（{'已' if first else '未'}完成），"
+                    f"续传下载 {fetched:.1f}/{size_mib:.0f} MiB，耗时 {elapsed:.2f}s，"
+                    f"内容{'一致' if same else '不一致'}"
+                )
+    finally:
+        fake.stop()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
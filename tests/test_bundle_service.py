@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import json
+import time
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from app.config import Settings, get_settings
+from app.services import image_cache
+from app.services.bundle_service import BUNDLE_FORMAT, import_bundle
+from app.services.image_cache import cached_original
+from app.services.metadata_cache import get_metadata_cache
+
+JPEG = b"\xff\xd8\xff\xe0" + bytes(1024)
+
+
+@pytest.fixture
+def settings(tmp_path: Path) -> Settings:
+    settings = get_settings()
+    settings.cache_dir = str(tmp_path / "cache")
+    return settings
+
+
+def _record(url, fetched, title: str = "ABC-123 标题") -> str:
+    return json.dumps({"url": url, "fetched": fetched, "metadata": {"title": title}})
+
+
+def _bundle(path: Path, metadata_lines, image_lines=(), blobs=None) -> Path:
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("manifest.json", json.dumps({"format": BUNDLE_FORMAT}))
+        zf.writestr("metadata.jsonl", "\n".join(metadata_lines) + "\n")
+        zf.writestr("images.jsonl", "\n".join(image_lines) + "\n")
+        for name, data in (blobs or {}).items():
+            zf.writestr(name, data)
+    return path
+
+
+def test_import_skips_bad_records(tmp_path: Path, settings: Settings) -> None:
+    now = time.time()
+    lines = [
+        _record("https://javdb.com/v/good1", now - 60),
+        _record("https://javdb.com/v/yesterday", "yesterday"),
+        _record(123, now),
+        _record("https://javdb.com/v/future", now + 86400),
+        _record("https://javdb.com/v/nan", float("nan")),
+        _record("https://javdb.com/v/bool", True),
+        json.dumps({"url": "https://javdb.com/v/notitle", "fetched": now, "metadata": {}}),
+        json.dumps(["not", "an", "object"]),
+        "{broken json",
+        _record("https://javdb565.com/v/good2", now - 30, "另一部"),
+    ]
+    stats = import_bundle(_bundle(tmp_path / "mixed.zip", lines), settings)
+
+    assert stats.records == 2
+    assert stats.skipped == 8
+    cache = get_metadata_cache(settings)
+    assert cache.get("https://javdb.com/v/good1", 3600).title == "ABC-123 标题"
+    assert cache.get("https://javdb.com/v/good2", 3600).title == "另一部"
+    assert cache.get("https://javdb.com/v/future", 10**9) is None
+
+
+def test_import_images_validated(tmp_path: Path, settings: Settings, monkeypatch) -> None:
+    monkeypatch.setattr(image_cache, "MAX_IMAGE_BYTES", 4096)
+    images = [
+        json.dumps({"url": "https://c0.jdbstatic.com/covers/ok.jpg", "blob": "images/ok"}),
+        json.dumps({"url": "https://c0.jdbstatic.com/covers/big.jpg", "blob": "images/big"}),
+        json.dumps({"url": "https://c0.jdbstatic.com/covers/txt.jpg", "blob": "images/txt"}),
+        json.dumps({"url": 42, "blob": "images/ok"}),
+        json.dumps({"url": "https://c0.jdbstatic.com/covers/gone.jpg", "blob": "images/gone"}),
+    ]
+    blobs = {
+        "images/ok": JPEG,
+        "images/big": JPEG + bytes(8192),
+        "images/txt": b"<html>not an image</html>",
+    }
+    bundle = _bundle(tmp_path / "images.zip", [], images, blobs)
+
+    stats = import_bundle(bundle, settings)
+
+    assert stats.images == 1
+    assert cached_original("https://c0.jdbstatic.com/covers/ok.jpg", settings) is not None
+    assert cached_original("https://c0.jdbstatic.com/covers/big.jpg", settings) is None
+    assert cached_original("https://c0.jdbstatic.com/covers/txt.jpg", settings) is None
+    images_dir = Path(settings.cache_dir) / "images"
+    assert not list(images_dir.rglob("*.part"))
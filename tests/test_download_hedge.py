@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from app.config import Settings, get_settings
+from app.services import download_service
+from app.services.scheduler import get_scheduler
+
+JPEG = b"\xff\xd8\xff\xe0" + bytes(4096)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """首个请求按 server.stall 卡住（"headers"：发送响应头前；"body"：发送部分内容后），之后的请求正常返回。"""
+
+    def do_GET(self) -> None:  # noqa: N802 - http.server 的命名
+        server = self.server
+        with server.lock:
+            first = server.requests == 0
+            server.requests += 1
+        if first and server.stall == "headers":
+            server.release.wait(10)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(JPEG)))
+        self.end_headers()
+        if first:
+            self.wfile.write(JPEG[:1024])
+            self.wfile.flush()
+            server.release.wait(10)
+            return
+        self.wfile.write(JPEG)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture(params=["headers", "body"])
+def server(request) -> Iterator[ThreadingHTTPServer]:
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.requests = 0
+    httpd.stall = request.param
+    httpd.release = threading.Event()
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.release.set()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def settings(monkeypatch) -> Settings:
+    settings = get_settings()
+    settings.http_proxy = None
+    settings.image_hedge_delay = 0.2
+    settings.image_hedge_budget = 1.0
+    monkeypatch.setattr(download_service, "_BUDGET", download_service._HedgeBudget())
+    return settings
+
+
+def _image_threads() -> list:
+    return [t for t in threading.enumerate() if t.name == "nfofetch-image"]
+
+
+def test_hedge_winner_releases_loser(tmp_path: Path, server, settings) -> None:
+    url = f"http://127.0.0.1:{server.server_address[1]}/covers/abc.jpg"
+    scheduler = get_scheduler(settings)
+
+    start = time.monotonic()
+    assert download_service.download_image(url, tmp_path / "abc.jpg", settings)
+
+    assert time.monotonic() - start < 5
+    assert (tmp_path / "abc.jpg").read_bytes() == JPEG
+    # 落败请求的名额与代理随胜出方返回立即归还，不等到超时
+    assert scheduler._in_use == 0
+    if server.stall == "body":
+        # 已收到响应头的落败请求连接被中止，线程随即结束
+        until = time.monotonic() + 2
+        while _image_threads() and time.monotonic() < until:
+            time.sleep(0.01)
+        assert not _image_threads()
+    assert not list(tmp_path.glob("*.part"))
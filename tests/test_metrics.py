@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+from app import metrics
+from app.metrics import DEAD_SNAPSHOT_NAME, render_metrics
+
+COUNTER = "nfofetch_image_hedges_total"
+GAUGE = "nfofetch_scrapes_in_flight"
+
+
+@pytest.fixture
+def metrics_dir(tmp_path: Path, monkeypatch) -> Path:
+    monkeypatch.setenv("NFOFETCH_METRICS_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _other(directory: Path, name: str, *, age: float, hedges: float, in_flight: float) -> Path:
+    """写入另一台主机上某个 worker 的快照，age 秒前最后更新。"""
+    snap = {
+        "pid": 1,
+        "host": "other-host",
+        "started": 0.0,
+        "written": time.time() - age,
+        "interval": 5.0,
+        "metrics": {
+            COUNTER: {
+                "type": "counter",
+                "help": "对冲请求",
+                "labels": ["outcome"],
+                "samples": [[["sent"], hedges]],
+            },
+            GAUGE: {"type": "gauge", "help": "进行中的刮削", "labels": [], "samples": [[[], in_flight]]},
+        },
+    }
+    path = directory / f"metrics-{name}.json"
+    path.write_text(json.dumps(snap), encoding="utf-8")
+    return path
+
+
+def _value(text: str, sample: str) -> float:
+    own = metrics.snapshot()["metrics"]
+    base = dict((tuple(k), v) for k, v in own[COUNTER]["samples"]).get(("sent",), 0.0)
+    if sample == GAUGE:
+        base = sum(v for _, v in own[GAUGE]["samples"])
+    for line in text.splitlines():
+        if line.startswith(sample + " ") or line.startswith(sample + '{outcome="sent"}'):
+            return float(line.rsplit(" ", 1)[1]) - base
+    return -base
+
+
+def test_stale_snapshots_fold_into_dead(metrics_dir: Path) -> None:
+    stale = _other(metrics_dir, "other-host-1-0", age=60, hedges=5, in_flight=2)
+    _other(metrics_dir, "other-host-2-0", age=1, hedges=1, in_flight=3)
+
+    text = render_metrics()
+
+    # 已退出进程的计数保留、gauge 不计；仍在更新的其它主机进程不受本机 pid 检查影响
+    assert _value(text, COUNTER) == 6
+    assert _value(text, GAUGE) == 3
+    assert not stale.exists()
+    assert (metrics_dir / DEAD_SNAPSHOT_NAME).exists()
+    assert _value(render_metrics(), COUNTER) == 6
+
+    # 同名但内容不同的快照再次过期时累加，不覆盖已有计数
+    _other(metrics_dir, "other-host-1-0", age=60, hedges=4, in_flight=1)
+    assert _value(render_metrics(), COUNTER) == 10
+    assert sorted(p.name for p in metrics_dir.glob("metrics-other-host-*.json")) == [
+        "metrics-other-host-2-0.json"
+    ]
+
+
+def test_snapshot_name_includes_host_and_start(metrics_dir: Path) -> None:
+    metrics.write_snapshot()
+
+    pid, host, started = metrics._process_identity()
+    (path,) = [p for p in metrics_dir.glob("metrics-*.json") if f"-{pid}-" in p.name]
+    assert path.name.endswith(f"-{pid}-{int(started * 1000)}.json")
+    assert json.loads(path.read_text(encoding="utf-8"))["host"] == host
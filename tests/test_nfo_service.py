@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from xml.etree.ElementTree import fromstring
+
+from app.schemas import MovieMetadata
+from app.services.nfo_service import build_movie_nfo
+from app.services.probe_service import VideoProbe
+
+METADATA = MovieMetadata(title="ABC-123 标题", number="ABC-123")
+
+
+def test_stream_details_from_probe() -> None:
+    probe = VideoProbe(
+        duration=7384.6, width=1920, height=1080, video_codec="h264", audio_codec="aac", audio_channels=2
+    )
+    movie = fromstring(build_movie_nfo(METADATA, probe))
+
+    assert movie.findtext("runtime") == "123"
+    video = movie.find("fileinfo/streamdetails/video")
+    assert video is not None
+    assert (video.findtext("codec"), video.findtext("width"), video.findtext("height")) == (
+        "h264",
+        "1920",
+        "1080",
+    )
+    assert video.findtext("durationinseconds") == "7385"
+    assert movie.findtext("fileinfo/streamdetails/audio/channels") == "2"
+
+
+def test_duration_only_probe_has_no_fileinfo() -> None:
+    movie = fromstring(build_movie_nfo(METADATA, VideoProbe(duration=3600)))
+
+    assert movie.findtext("runtime") == "60"
+    assert movie.find("fileinfo") is None
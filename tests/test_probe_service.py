@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import random
+import struct
+from pathlib import Path
+
+import pytest
+
+from app.services.probe_service import probe_video
+
+# ---- MP4 夹具 ----
+
+
+def _box(kind: bytes, body: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(body), kind) + body
+
+
+def _full_box(kind: bytes, version: int, body: bytes) -> bytes:
+    return _box(kind, bytes([version, 0, 0, 0]) + body)
+
+
+def _mvhd(version: int, timescale: int, duration: int) -> bytes:
+    if version == 1:
+        body = struct.pack(">QQIQ", 0, 0, timescale, duration)
+    else:
+        body = struct.pack(">IIII", 0, 0, timescale, duration)
+    return _full_box(b"mvhd", version, body + bytes(80))
+
+
+def _tkhd(version: int, width: int, height: int) -> bytes:
+    if version == 1:
+        head = struct.pack(">QQIIQ", 0, 0, 1, 0, 0)
+    else:
+        head = struct.pack(">IIIII", 0, 0, 1, 0, 0)
+    # reserved(8) + layer / alternate_group / volume / reserved(8) + matrix(36)，宽高为 16.16 定点数
+    size = struct.pack(">II", width << 16, height << 16)
+    return _full_box(b"tkhd", version, head + bytes(8 + 8 + 36) + size)
+
+
+def _trak(handler: bytes, entry: bytes, tkhd: bytes = b"") -> bytes:
+    hdlr = _full_box(b"hdlr", 0, bytes(4) + handler + bytes(12) + b"\x00")
+    stsd = _full_box(b"stsd", 0, struct.pack(">I", 1) + entry)
+    stbl = _box(b"stbl", stsd)
+    minf = _box(b"minf", stbl)
+    mdia = _box(b"mdia", hdlr + minf)
+    return _box(b"trak", tkhd + mdia)
+
+
+def _video_entry(fourcc: bytes, width: int, height: int) -> bytes:
+    body = bytes(6) + struct.pack(">H", 1) + bytes(16) + struct.pack(">HH", width, height) + bytes(50)
+    return _box(fourcc, body)
+
+
+def _audio_entry(fourcc: bytes, channels: int) -> bytes:
+    body = bytes(6) + struct.pack(">H", 1) + bytes(8) + struct.pack(">HHI", channels, 16, 0) + bytes(4)
+    return _box(fourcc, body)
+
+
+def _mp4(version: int, *, moov_last: bool = False) -> bytes:
+    moov = _box(
+        b"moov",
+        _mvhd(version, 1000, 7_384_500)
+        + _trak(b"vide", _video_entry(b"avc1", 1920, 1080), _tkhd(version, 1920, 1080))
+        + _trak(b"soun", _audio_entry(b"mp4a", 2)),
+    )
+    ftyp = _box(b"ftyp", b"isom" + struct.pack(">I", 512) + b"isomavc1")
+    mdat = _box(b"mdat", bytes(4096))
+    return ftyp + (mdat + moov if moov_last else moov + mdat)
+
+
+# ---- Matroska 夹具 ----
+
+
+def _vint_size(n: int) -> bytes:
+    if n < 0x7F:
+        return bytes([0x80 | n])
+    return b"\x01" + n.to_bytes(7, "big")
+
+
+def _el(eid: int, body: bytes) -> bytes:
+    return eid.to_bytes((eid.bit_length() + 7) // 8, "big") + _vint_size(len(body)) + body
+
+
+def _uint_el(eid: int, value: int) -> bytes:
+    return _el(eid, value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big"))
+
+
+def _mkv(*, unknown_segment_size: bool = False) -> bytes:
+    ebml = _el(0x1A45DFA3, _el(0x4282, b"matroska"))
+    info = _el(0x1549A966, _uint_el(0x2AD7B1, 1_000_000) + _el(0x4489, struct.pack(">d", 5_400_000.0)))
+    video = _el(
+        0xAE,
+        _uint_el(0x83, 1)
+        + _el(0x86, b"V_MPEGH/ISO/HEVC")
+        + _el(0xE0, _uint_el(0xB0, 3840) + _uint_el(0xBA, 2160)),
+    )
+    audio = _el(0xAE, _uint_el(0x83, 2) + _el(0x86, b"A_OPUS") + _el(0xE1, _uint_el(0x9F, 6)))
+    tracks = _el(0x1654AE6B, video + audio)
+    cluster = _el(0x1F43B675, bytes(2048))
+    body = info + tracks + cluster
+    if unknown_segment_size:
+        segment = (0x18538067).to_bytes(4, "big") + b"\x01\xff\xff\xff\xff\xff\xff\xff" + body
+    else:
+        segment = _el(0x18538067, body)
+    return ebml + segment
+
+
+def _write(tmp_path: Path, name: str, data: bytes) -> Path:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path
+
+
+@pytest.mark.parametrize("version", [0, 1])
+@pytest.mark.parametrize("moov_last", [False, True])
+def test_probe_mp4(tmp_path: Path, version: int, moov_last: bool) -> None:
+    probe = probe_video(_write(tmp_path, "movie.mp4", _mp4(version, moov_last=moov_last)))
+
+    assert probe is not None
+    assert probe.duration == pytest.approx(7384.5)
+    assert probe.runtime_minutes == 123
+    assert (probe.width, probe.height) == (1920, 1080)
+    assert probe.video_codec == "h264"
+    assert probe.audio_codec == "aac"
+    assert probe.audio_channels == 2
+
+
+@pytest.mark.parametrize("unknown_segment_size", [False, True])
+def test_probe_mkv(tmp_path: Path, unknown_segment_size: bool) -> None:
+    data = _mkv(unknown_segment_size=unknown_segment_size)
+    probe = probe_video(_write(tmp_path, "movie.mkv", data))
+
+    assert probe is not None
+    assert probe.duration == pytest.approx(5400.0)
+    assert (probe.width, probe.height) == (3840, 2160)
+    assert probe.video_codec == "hevc"
+    assert probe.audio_codec == "opus"
+    assert probe.audio_channels == 6
+
+
+@pytest.mark.parametrize(
+    "name, data, marker",
+    [
+        ("moov.mp4", _mp4(0), b"hdlr"),
+        ("moov_last.mp4", _mp4(1, moov_last=True), b"hdlr"),
+        ("movie.mkv", _mkv(), b"A_OPUS"),
+    ],
+    ids=["mp4", "mp4-moov-last", "mkv"],
+)
+def test_probe_truncated(tmp_path: Path, name: str, data: bytes, marker: bytes) -> None:
+    # 在 moov / Tracks 区块中间截断（例如仍在下载的文件）
+    cut = data.index(marker) + 2
+    assert probe_video(_write(tmp_path, name, data[:cut])) is None
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_probe_garbage(tmp_path: Path, seed: int) -> None:
+    rng = random.Random(seed)
+    garbage = bytes(rng.randrange(256) for _ in range(4096))
+    assert probe_video(_write(tmp_path, "random.mp4", garbage)) is None
+    # 文件头看起来像 MP4 / MKV，后面是随机数据
+    assert probe_video(_write(tmp_path, "fake.mp4", _box(b"ftyp", b"isom") + garbage)) is None
+    assert probe_video(_write(tmp_path, "fake.mkv", b"\x1a\x45\xdf\xa3" + garbage)) is None
+
+
+def test_probe_empty_and_missing(tmp_path: Path) -> None:
+    assert probe_video(_write(tmp_path, "empty.mp4", b"")) is None
+    assert probe_video(tmp_path / "missing.mkv") is None
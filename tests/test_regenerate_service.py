@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import json
+import os
+import stat
+from pathlib import Path
+
+from app.services import regenerate_service
+from app.services.nfo_service import METADATA_SIDECAR_NAME
+from app.services.regenerate_service import (
+    NFO_NAME,
+    STATUS_FAILED,
+    STATUS_UNCHANGED,
+    STATUS_UPDATED,
+    regenerate_one,
+)
+
+
+def _sidecar(tmp_path: Path) -> Path:
+    sidecar = tmp_path / METADATA_SIDECAR_NAME
+    sidecar.write_text(json.dumps({"title": "标题", "number": "ABC-123"}), encoding="utf-8")
+    return sidecar
+
+
+def test_regenerate_writes_and_keeps_mode(tmp_path: Path) -> None:
+    sidecar = _sidecar(tmp_path)
+    nfo = tmp_path / NFO_NAME
+    nfo.write_text("<movie />", encoding="utf-8")
+    os.chmod(nfo, 0o640)
+
+    assert regenerate_one(str(sidecar))[1] == STATUS_UPDATED
+    assert "ABC-123" in nfo.read_text(encoding="utf-8")
+    assert stat.S_IMODE(nfo.stat().st_mode) == 0o640
+    assert regenerate_one(str(sidecar))[1] == STATUS_UNCHANGED
+    assert sorted(p.name for p in tmp_path.iterdir()) == [METADATA_SIDECAR_NAME, NFO_NAME]
+
+
+def test_failed_write_leaves_no_temp_file(tmp_path: Path, monkeypatch) -> None:
+    sidecar = _sidecar(tmp_path)
+
+    def fail_replace(src, dst) -> None:
+        raise OSError("磁盘已满")
+
+    monkeypatch.setattr(regenerate_service.os, "replace", fail_replace)
+
+    _, status, error = regenerate_one(str(sidecar))
+    assert status == STATUS_FAILED and error == "磁盘已满"
+    assert sorted(p.name for p in tmp_path.iterdir()) == [METADATA_SIDECAR_NAME]
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from app.schemas import MovieMetadata
+from app.services.file_service import plan_dir_renames
+from app.services.nfo_service import METADATA_SIDECAR_NAME
+from app.services.rename_service import plan_library_renames
+
+
+def _names(plan):
+    return {src.name: dst.name for src, dst in plan}
+
+
+def test_companion_target_taken_bumps_suffix(tmp_path: Path) -> None:
+    names = ["ABC-123.mp4", "ABC-123.srt", "ABC-123_2.srt", "zz.mp4", "zz.srt"]
+    metadata = MovieMetadata(title="标题", number="ABC-123")
+
+    plan = _names(plan_dir_renames(tmp_path, metadata, "{id}", names=names))
+
+    # ABC-123_2.srt 已被占用：zz.mp4 与它的字幕一起改到 _3，字幕不会被落下
+    assert plan == {"zz.mp4": "ABC-123_3.mp4", "zz.srt": "ABC-123_3.srt"}
+
+
+def test_companions_follow_video(tmp_path: Path) -> None:
+    names = ["old.mkv", "old.zh.srt", "old-poster.jpg", "movie.nfo"]
+    metadata = MovieMetadata(title="标题", number="XYZ-001")
+
+    plan = _names(plan_dir_renames(tmp_path, metadata, "{id}", names=names))
+
+    assert plan == {
+        "old.mkv": "XYZ-001.mkv",
+        "old.zh.srt": "XYZ-001.zh.srt",
+        "old-poster.jpg": "XYZ-001-poster.jpg",
+    }
+
+
+def test_library_plan_records_bad_sidecar(tmp_path: Path) -> None:
+    good = tmp_path / "good"
+    bad = tmp_path / "bad"
+    for d in (good, bad):
+        d.mkdir()
+        (d / "video.mp4").write_bytes(b"")
+    (good / METADATA_SIDECAR_NAME).write_text(
+        json.dumps({"title": "标题", "number": "GOOD-001"}), encoding="utf-8"
+    )
+    (bad / METADATA_SIDECAR_NAME).write_text(
+        json.dumps({"title": "标题", "number": "BAD-001", "actors": ["某演员"]}), encoding="utf-8"
+    )
+
+    plan = plan_library_renames(tmp_path, "{id}")
+
+    assert [d for d, _ in plan.dirs] == [good]
+    assert len(plan.errors) == 1 and plan.errors[0].startswith(str(bad))
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Optional
+
+import pytest
+
+from app.config import Settings, get_settings
+from app.deadline import DeadlineExceeded, check_deadline
+from app.schemas import MovieMetadata
+from app.scrapers import registry
+from app.scrapers.base import BaseScraper
+from app.services.scrape_service import scrape_movie_multi
+
+COMPLETE = {
+    "title": "ABC-123 标题",
+    "number": "ABC-123",
+    "premiered": "2024-01-02",
+    "posters": ["https://img.example.com/abc-123.jpg"],
+}
+
+
+class StubScraper(BaseScraper):
+    """按 URL 返回预设结果的 scraper：等待 delay 秒（期间检查任务预算 / 取消）后返回或失败。"""
+
+    def __init__(
+        self, name: str, fields: Optional[Dict[str, object]] = None, *, delay: float = 0.0
+    ) -> None:
+        self.name = name
+        self.fields = fields
+        self.delay = delay
+        self.started = threading.Event()
+        self.cancelled = threading.Event()
+
+    def supports(self, url: str) -> bool:
+        return True
+
+    def scrape(self, url: str, settings: Settings) -> MovieMetadata:
+        self.started.set()
+        until = time.monotonic() + self.delay
+        try:
+            while time.monotonic() < until:
+                check_deadline("fetch")
+                time.sleep(0.01)
+        except DeadlineExceeded as exc:
+            if exc.cancelled:
+                self.cancelled.set()
+            raise
+        if self.fields is None:
+            raise RuntimeError(f"{self.name} 暂时不可用")
+        return MovieMetadata(**self.fields)
+
+
+@pytest.fixture
+def settings() -> Settings:
+    settings = get_settings()
+    settings.metadata_cache_ttl = 0
+    return settings
+
+
+def _register(monkeypatch: pytest.MonkeyPatch, *scrapers: StubScraper) -> list[str]:
+    urls = []
+    for scraper in scrapers:
+        monkeypatch.setitem(registry._INSTANCES, scraper.name, scraper)
+        urls.append(f"https://{scraper.name}.test/v/abc-123")
+    return urls
+
+
+def test_returns_once_required_fields_settled(monkeypatch, settings) -> None:
+    fast = StubScraper("fast", COMPLETE)
+    slow = StubScraper("slow", {"title": "较慢站点", "plot": "简介"}, delay=5)
+    urls = _register(monkeypatch, fast, slow)
+
+    start = time.monotonic()
+    merged = scrape_movie_multi(urls, settings)
+
+    assert time.monotonic() - start < 2
+    assert merged.title == COMPLETE["title"]
+    assert merged.plot is None
+
+
+def test_slow_higher_priority_source_blocks_early_return(monkeypatch, settings) -> None:
+    # 较慢的站点排在前面：它的标题优先，不能用较快站点的结果提前返回
+    slow = StubScraper("slow", {"title": "优先站点的标题"}, delay=0.3)
+    fast = StubScraper("fast", COMPLETE)
+    urls = _register(monkeypatch, slow, fast)
+
+    merged = scrape_movie_multi(urls, settings)
+
+    assert merged.title == "优先站点的标题"
+    assert merged.number == "ABC-123"
+
+
+def test_all_sources_failing_raises(monkeypatch, settings) -> None:
+    urls = _register(monkeypatch, StubScraper("downa"), StubScraper("downb"))
+
+    with pytest.raises(RuntimeError, match="所有站点刮削失败"):
+        scrape_movie_multi(urls, settings)
+
+
+def test_slow_source_is_cancelled(monkeypatch, settings) -> None:
+    fast = StubScraper("fast", COMPLETE)
+    slow = StubScraper("slow", {"title": "较慢站点"}, delay=30)
+    urls = _register(monkeypatch, fast, slow)
+
+    scrape_movie_multi(urls, settings)
+
+    assert slow.started.wait(2)
+    assert slow.cancelled.wait(2)
+
+
+def test_slow_source_is_cancelled_on_timeout(monkeypatch, settings) -> None:
+    partial = StubScraper("partial", {"title": "只有标题"})
+    slow = StubScraper("slow", COMPLETE, delay=30)
+    urls = _register(monkeypatch, partial, slow)
+
+    merged = scrape_movie_multi(urls, settings, timeout=0.3)
+
+    assert merged.title == "只有标题"
+    assert slow.cancelled.wait(2)